@@ -0,0 +1,97 @@
+import asyncio
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Dict
+from config import settings
+from database import DatabaseService
+from logger import logger
+
+class ActivityTracker:
+    """
+    Suivi de la dernière activité des utilisateurs, écrit en différé : touch()
+    ne fait qu'une mise à jour en mémoire, et au plus une écriture par
+    utilisateur toutes les write_interval est regroupée avec les autres dans
+    un UPDATE groupé toutes les flush_interval secondes.
+    """
+
+    def __init__(self, write_interval_minutes: float = None, flush_interval: float = None,
+                 db_factory=DatabaseService, clock: Callable[[], datetime] = datetime.utcnow):
+        self.write_interval = timedelta(minutes=write_interval_minutes or settings.ACTIVITY_WRITE_INTERVAL_MINUTES)
+        self.flush_interval = flush_interval or settings.ACTIVITY_FLUSH_SECONDS
+        self.db_factory = db_factory
+        self.clock = clock
+        self._pending: Dict[int, datetime] = {}
+        self._last_written: Dict[int, datetime] = {}
+        self._lock = threading.Lock()
+        self._task = None
+        self.stats = {"touches": 0, "writes": 0, "flushes": 0}
+
+    def touch(self, user_id: int):
+        """Note l'activité d'un utilisateur (aucun accès base de données)"""
+        now = self.clock()
+        with self._lock:
+            self.stats["touches"] += 1
+            last = self._last_written.get(user_id)
+            if last is not None and now - last < self.write_interval:
+                return
+            self._pending[user_id] = now
+            # Réservé dès maintenant : les requêtes suivantes de la période ne réécrivent pas
+            self._last_written[user_id] = now
+
+    def flush(self) -> int:
+        """Écrit les activités en attente en une requête ; retourne le nombre d'utilisateurs mis à jour"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            # Oublie les utilisateurs dont la période est écoulée (mémoire bornée aux utilisateurs récents)
+            horizon = self.clock() - self.write_interval
+            self._last_written = {user_id: at for user_id, at in self._last_written.items() if at > horizon}
+        if not pending:
+            return 0
+
+        db = self.db_factory()
+        try:
+            db.update_users_last_active(pending)
+        except Exception:
+            # Remis en attente pour le prochain flush (sans écraser une activité plus récente)
+            with self._lock:
+                for user_id, seen_at in pending.items():
+                    self._pending.setdefault(user_id, seen_at)
+            raise
+        finally:
+            db.close()
+        with self._lock:
+            self.stats["writes"] += len(pending)
+            self.stats["flushes"] += 1
+        return len(pending)
+
+    async def run_forever(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception as e:
+                logger.error(f"Erreur écriture des activités utilisateurs: {e}")
+
+    def start(self):
+        """Démarre les écritures périodiques dans la boucle asyncio courante"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self.run_forever())
+        return self._task
+
+    async def stop(self):
+        """Arrête les écritures périodiques et écrit les activités restantes"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await asyncio.to_thread(self.flush)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {**self.stats, "pending": len(self._pending)}
+
+# Instance globale
+activity_tracker = ActivityTracker()
@@ -1,123 +1,269 @@
 
 from openai import OpenAI
 import os
-from typing import Dict, List, Optional
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Optional
 import json
 from logger import logger
+from config import settings
+from resilience import ResilientCaller, CircuitBreaker
+from model_router import ModelRouter, StaticMessage, count_tokens
+from json_stream import IncrementalJSONParser, StreamingJSONError, TASK_REQUIRED_FIELDS, TASK_SCHEMAS
+
+# Rappel des résultats partiels : (champ, valeur, champs reçus jusqu'ici)
+PartialCallback = Callable[[str, object, Dict], None]
+
+# Prompts système invariants, construits une seule fois. Ils sont toujours envoyés en
+# premier et à l'identique pour que le cache de préfixe du fournisseur s'applique ;
+# seul le message utilisateur varie d'un appel à l'autre.
+SYSTEM_MESSAGES = {
+    "saas_idea": StaticMessage("system", """
+        Tu es un expert en création de SaaS. Génère une idée complète de micro-SaaS basée sur le prompt utilisateur.
+
+        Retourne un JSON avec:
+        - name: nom du SaaS
+        - description: description détaillée
+        - features: liste des fonctionnalités principales
+        - tech_stack: technologies recommandées
+        - monetization: modèle de monétisation
+        - target_market: marché cible
+        - mvp_timeline: timeline pour le MVP (en semaines)
+        - estimated_cost: coût estimé de développement
+        """),
+    "code_structure": StaticMessage("system", """
+        Tu es un architecte logiciel expert. Génère la structure de code complète pour ce SaaS.
+
+        Retourne un JSON avec:
+        - file_structure: arborescence des fichiers
+        - main_files: contenu des fichiers principaux
+        - database_schema: schéma de base de données SQL
+        - api_endpoints: liste des endpoints API
+        - frontend_components: composants React principaux
+        - deployment_config: configuration de déploiement
+        """),
+    "marketing_strategy": StaticMessage("system", """
+        Tu es un expert en marketing digital. Crée une stratégie marketing complète pour ce SaaS.
+
+        Retourne un JSON avec:
+        - positioning: positionnement unique
+        - target_personas: personas détaillées
+        - channels: canaux d'acquisition
+        - content_strategy: stratégie de contenu
+        - pricing_strategy: stratégie de prix
+        - launch_plan: plan de lancement
+        - kpis: indicateurs clés à suivre
+        """)
+}
+
+SAAS_IDEA_USER_TEMPLATE = """Idée de base: {prompt}
+Public cible: {target_audience}
+Stack technique préférée: {tech_stack}
+
+Génère une idée de SaaS complète et réalisable."""
 
 class AIService:
     def __init__(self):
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        # Les retries sont gérés par ResilientCaller, pas par le SDK
+        api_key = os.getenv("OPENAI_API_KEY")
+        if not api_key and settings.OPENAI_BASE_URL:
+            api_key = "sk-local"  # Le serveur local n'exige pas de clé
+        self.client = OpenAI(api_key=api_key, base_url=settings.OPENAI_BASE_URL, max_retries=0)
+        self.resilience = ResilientCaller(
+            "openai_chat",
+            max_attempts=settings.AI_MAX_ATTEMPTS,
+            deadline=settings.AI_CALL_DEADLINE,
+            attempt_timeout=settings.AI_ATTEMPT_TIMEOUT,
+            hedge=settings.AI_HEDGE_REQUESTS,
+            breaker=CircuitBreaker(
+                "openai_chat",
+                failure_threshold=settings.AI_BREAKER_FAILURES,
+                reset_timeout=settings.AI_BREAKER_RESET_SECONDS
+            )
+        )
+        self.router = ModelRouter()
+    
+    def _chat_completion(self, **kwargs):
+        """Appel chat.completions avec délai, retries, hedging et disjoncteur"""
+        return self.resilience.call(self.client.chat.completions.create, **kwargs)
+    
+    def _cache_options(self, task: str) -> Dict:
+        """Regroupe les requêtes d'une même tâche sur le même cache de préfixe côté fournisseur"""
+        if not settings.AI_PROMPT_CACHE_KEY:
+            return {}
+        return {"prompt_cache_key": f"smartsaas-{task}"}
+    
+    def _routed_completion(self, task: str, plan: str, messages: List[Dict], temperature: float,
+                           max_tokens_cap: int = None):
+        """Choisit le modèle et le budget de tokens de la tâche, puis enregistre la consommation réelle"""
+        decision = self.router.route(task, plan, messages)
+        if max_tokens_cap:
+            decision.max_tokens = min(decision.max_tokens, max_tokens_cap)
+        
+        response = self._chat_completion(
+            model=decision.model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=decision.max_tokens,
+            **self._cache_options(task)
+        )
+        self.router.record_usage(decision, getattr(response, "usage", None), response.choices[0].finish_reason)
+        return response
+    
+    def _streamed_json_completion(self, task: str, plan: str, messages: List[Dict], temperature: float,
+                                  on_partial: PartialCallback = None) -> Dict:
+        """
+        Diffuse la complétion et valide l'objet JSON au fil de l'eau : chaque champ
+        complet est transmis à on_partial et le flux est coupé dès que tous les
+        champs du schéma de la tâche sont reçus. Une réponse invalide ou privée
+        d'un champ indispensable est conservée en texte brut dans "description".
+        """
+        decision = self.router.route(task, plan, messages)
+        parser = IncrementalJSONParser(TASK_SCHEMAS[task], TASK_REQUIRED_FIELDS[task])
+        stream = self._chat_completion(
+            model=decision.model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=decision.max_tokens,
+            stream=True,
+            stream_options={"include_usage": True},
+            **self._cache_options(task)
+        )
+        
+        usage = None
+        finish_reason = None
+        parse_error = None
+        text_parts = []
+        try:
+            for chunk in stream:
+                if getattr(chunk, "usage", None):
+                    usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                choice = chunk.choices[0]
+                finish_reason = choice.finish_reason or finish_reason
+                content = choice.delta.content or ""
+                text_parts.append(content)
+                if parse_error is not None:
+                    continue
+                try:
+                    completed = parser.feed(content)
+                except StreamingJSONError as e:
+                    parse_error = e
+                    continue
+                for name, value in completed:
+                    if on_partial:
+                        on_partial(name, value, dict(parser.fields))
+                if parser.schema_complete:
+                    finish_reason = "early_stop"
+                    break
+        finally:
+            stream.close()
         
-    def generate_saas_idea(self, prompt: str, target_audience: str = "", tech_stack: str = "") -> Dict:
+        text = "".join(text_parts)
+        if usage is None:
+            # Flux interrompu avant le bloc d'usage : estimation locale
+            usage = SimpleNamespace(prompt_tokens=decision.prompt_tokens,
+                                    completion_tokens=count_tokens(text))
+        self.router.record_usage(decision, usage, finish_reason)
+        
+        if parse_error is not None:
+            logger.warning(f"Réponse {task} partiellement invalide: {parse_error}")
+        if parser.missing_fields:
+            logger.warning(f"Réponse {task} sans champs {', '.join(parser.missing_fields)}, texte brut conservé")
+            return {"description": text}
+        return parser.fields
+    
+    def get_metrics(self) -> Dict:
+        return {
+            "openai_chat": self.resilience.snapshot(),
+            "routing": self.router.snapshot()
+        }
+    
+    def generate_text(self, prompt: str, max_tokens: int = 500, plan: str = "free") -> Dict:
+        """Génère un texte marketing libre"""
+        try:
+            response = self._routed_completion(
+                "text", plan,
+                [{"role": "user", "content": prompt}],
+                temperature=0.7,
+                max_tokens_cap=max_tokens
+            )
+            return {"success": True, "text": response.choices[0].message.content}
+        except Exception as e:
+            logger.error(f"Erreur génération texte: {e}")
+            return {"success": False, "error": str(e)}
+    
+    def generate_image(self, prompt: str, size: str = "1024x1024", quality: str = "standard") -> Dict:
+        """Génère une image avec DALL-E"""
+        try:
+            response = self.resilience.call(
+                self.client.images.generate,
+                model="dall-e-3",
+                prompt=prompt,
+                size=size,
+                quality=quality,
+                n=1
+            )
+            return {"success": True, "image_url": response.data[0].url}
+        except Exception as e:
+            logger.error(f"Erreur génération image: {e}")
+            return {"success": False, "error": str(e)}
+        
+    def generate_saas_idea(self, prompt: str, target_audience: str = "", tech_stack: str = "", plan: str = "free",
+                           on_partial: PartialCallback = None) -> Dict:
         """Génère une idée de SaaS complète avec l'IA"""
         try:
-            system_prompt = """Tu es un expert en création de SaaS. Génère une idée complète de micro-SaaS basée sur le prompt utilisateur.
-            
-            Retourne un JSON avec:
-            - name: nom du SaaS
-            - description: description détaillée
-            - features: liste des fonctionnalités principales
-            - tech_stack: technologies recommandées
-            - monetization: modèle de monétisation
-            - target_market: marché cible
-            - mvp_timeline: timeline pour le MVP (en semaines)
-            - estimated_cost: coût estimé de développement
-            """
-            
-            user_prompt = f"""
-            Idée de base: {prompt}
-            Public cible: {target_audience}
-            Stack technique préférée: {tech_stack}
-            
-            Génère une idée de SaaS complète et réalisable.
-            """
+            user_prompt = SAAS_IDEA_USER_TEMPLATE.format(
+                prompt=prompt, target_audience=target_audience, tech_stack=tech_stack
+            )
             
-            response = self.client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": system_prompt},
+            result = self._streamed_json_completion(
+                "saas_idea", plan,
+                [
+                    SYSTEM_MESSAGES["saas_idea"],
                     {"role": "user", "content": user_prompt}
                 ],
                 temperature=0.7,
-                max_tokens=1500
+                on_partial=on_partial
             )
+            return {"success": True, "saas_idea": result}
             
-            try:
-                result = json.loads(response.choices[0].message.content)
-                return {"success": True, "saas_idea": result}
-            except json.JSONDecodeError:
-                return {"success": True, "saas_idea": {"description": response.choices[0].message.content}}
-                
         except Exception as e:
             logger.error(f"Erreur génération idée SaaS: {e}")
             return {"success": False, "error": str(e)}
     
-    def generate_code_structure(self, saas_idea: Dict) -> Dict:
+    def generate_code_structure(self, saas_idea: Dict, plan: str = "free", on_partial: PartialCallback = None) -> Dict:
         """Génère la structure de code pour une idée SaaS"""
         try:
-            system_prompt = """Tu es un architecte logiciel expert. Génère la structure de code complète pour ce SaaS.
-            
-            Retourne un JSON avec:
-            - file_structure: arborescence des fichiers
-            - main_files: contenu des fichiers principaux
-            - database_schema: schéma de base de données SQL
-            - api_endpoints: liste des endpoints API
-            - frontend_components: composants React principaux
-            - deployment_config: configuration de déploiement
-            """
-            
-            response = self.client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": system_prompt},
+            result = self._streamed_json_completion(
+                "code_structure", plan,
+                [
+                    SYSTEM_MESSAGES["code_structure"],
                     {"role": "user", "content": f"Génère la structure de code pour: {json.dumps(saas_idea)}"}
                 ],
                 temperature=0.3,
-                max_tokens=2000
+                on_partial=on_partial
             )
+            return {"success": True, "code_structure": result}
             
-            try:
-                result = json.loads(response.choices[0].message.content)
-                return {"success": True, "code_structure": result}
-            except json.JSONDecodeError:
-                return {"success": True, "code_structure": {"description": response.choices[0].message.content}}
-                
         except Exception as e:
             logger.error(f"Erreur génération code: {e}")
             return {"success": False, "error": str(e)}
     
-    def generate_marketing_strategy(self, saas_idea: Dict) -> Dict:
+    def generate_marketing_strategy(self, saas_idea: Dict, plan: str = "free", on_partial: PartialCallback = None) -> Dict:
         """Génère une stratégie marketing pour le SaaS"""
         try:
-            system_prompt = """Tu es un expert en marketing digital. Crée une stratégie marketing complète pour ce SaaS.
-            
-            Retourne un JSON avec:
-            - positioning: positionnement unique
-            - target_personas: personas détaillées
-            - channels: canaux d'acquisition
-            - content_strategy: stratégie de contenu
-            - pricing_strategy: stratégie de prix
-            - launch_plan: plan de lancement
-            - kpis: indicateurs clés à suivre
-            """
-            
-            response = self.client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": system_prompt},
+            result = self._streamed_json_completion(
+                "marketing_strategy", plan,
+                [
+                    SYSTEM_MESSAGES["marketing_strategy"],
                     {"role": "user", "content": f"Crée une stratégie marketing pour: {json.dumps(saas_idea)}"}
                 ],
                 temperature=0.5,
-                max_tokens=1500
+                on_partial=on_partial
             )
+            return {"success": True, "marketing_strategy": result}
             
-            try:
-                result = json.loads(response.choices[0].message.content)
-                return {"success": True, "marketing_strategy": result}
-            except json.JSONDecodeError:
-                return {"success": True, "marketing_strategy": {"description": response.choices[0].message.content}}
-                
         except Exception as e:
             logger.error(f"Erreur génération marketing: {e}")
             return {"success": False, "error": str(e)}
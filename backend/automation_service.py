@@ -1,43 +1,159 @@
 
 import asyncio
 import json
-import requests
-from typing import Dict, List, Optional
+import time
+import uuid
+from collections import OrderedDict
+from functools import partial
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime, timedelta
-import schedule
-import threading
 from logger import logger
-from database import db_service
+from database import DatabaseService, db_service
+from config import settings
+from interpolation import CompiledTemplate, TemplateError, compile_template
+from scheduler import Daily, Interval, Weekly, scheduler
+
+SYNC_JOB_ID = "automations:sync"
+# Recouvrement entre deux synchronisations (horloges des workers, transactions en cours)
+SYNC_OVERLAP = timedelta(seconds=5)
+
+# Variables disponibles dans les configs : contexte de l'exécution, sorties des actions en amont
+RUN_VARIABLES = ("user_email", "date", "automation_id", "automation_name")
+ACTION_OUTPUTS = {
+    "generate_content": ("generated_content",),
+    "webhook": ("webhook_status", "webhook_response"),
+}
+
+def automation_trigger(config: Dict):
+    """Déclencheur du planificateur pour la config d'une automatisation (None si manuelle)"""
+    trigger = config.get("trigger", {})
+    if trigger.get("type", "manual") != "schedule":
+        return None
+
+    frequency = trigger.get("frequency", "daily")
+    time_str = trigger.get("time", "09:00")
+    if frequency == "daily":
+        return Daily(time_str)
+    elif frequency == "weekly":
+        return Weekly(trigger.get("day", "monday"), time_str)
+    elif frequency == "hourly":
+        return Interval(3600)
+    raise ValueError(f"Fréquence inconnue: {frequency}")
+
+def action_graph(actions: List[Dict]) -> Tuple[List[str], Dict[str, List[str]]]:
+    """
+    Identifiants des actions (ordre topologique) et dépendances directes de
+    chacune. Sans aucun depends_on, les actions s'enchaînent dans l'ordre de
+    la liste (comportement historique) ; sinon seules les dépendances
+    déclarées sont respectées et les branches indépendantes tournent en parallèle.
+    """
+    ids = [str(action.get("id") or f"action_{index + 1}") for index, action in enumerate(actions)]
+    if len(set(ids)) != len(ids):
+        raise ValueError("Identifiants d'actions en double")
+
+    if not any("depends_on" in action for action in actions):
+        dependencies = {action_id: ids[index - 1:index] for index, action_id in enumerate(ids)}
+        return ids, dependencies
+
+    dependencies = {}
+    for action_id, action in zip(ids, actions):
+        depends_on = action.get("depends_on") or []
+        depends_on = [depends_on] if isinstance(depends_on, str) else [str(dep) for dep in depends_on]
+        unknown = [dep for dep in depends_on if dep not in ids]
+        if unknown:
+            raise ValueError(f"Action {action_id} : dépendances inconnues {', '.join(unknown)}")
+        dependencies[action_id] = depends_on
+
+    # Tri topologique (Kahn) : détecte les cycles
+    remaining = {action_id: set(deps) for action_id, deps in dependencies.items()}
+    order = []
+    while remaining:
+        ready = [action_id for action_id in ids if action_id in remaining and not remaining[action_id]]
+        if not ready:
+            raise ValueError(f"Dépendances cycliques entre les actions {', '.join(sorted(remaining))}")
+        for action_id in ready:
+            order.append(action_id)
+            del remaining[action_id]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+    return order, dependencies
+
+def action_ancestors(order: List[str], dependencies: Dict[str, List[str]]) -> Dict[str, set]:
+    """Actions en amont (directes ou non) de chaque action"""
+    ancestors: Dict[str, set] = {}
+    for action_id in order:
+        ancestors[action_id] = set(dependencies[action_id]).union(*(ancestors[dep] for dep in dependencies[action_id]))
+    return ancestors
+
+def compile_actions(config: Dict) -> Dict[str, CompiledTemplate]:
+    """
+    Compile chaque action une fois ({{variable}} -> rendu direct) et rejette
+    les variables inconnues : seules sont admises celles de l'exécution, les
+    variables déclarées dans config["variables"] et les sorties des actions en amont.
+    """
+    actions = config.get("actions", [])
+    order, dependencies = action_graph(actions)
+    ancestors = action_ancestors(order, dependencies)
+    by_id = dict(zip(dependencies, actions))
+    shared = set(RUN_VARIABLES).union(config.get("variables") or {})
+    compiled = {}
+    for action_id, action in by_id.items():
+        allowed = shared.union(*(ACTION_OUTPUTS.get(by_id[upstream].get("type"), ()) for upstream in ancestors[action_id]))
+        try:
+            compiled[action_id] = compile_template(action, allowed)
+        except TemplateError as e:
+            raise TemplateError(f"Action {action_id} : {e}") from None
+    return compiled
 
 class AutomationService:
-    def __init__(self):
-        self.active_automations = {}
-        self.scheduler_running = False
+    def __init__(self, scheduler=scheduler, db_factory=DatabaseService, max_parallel_actions: int = None):
+        self.scheduler = scheduler
+        self.db_factory = db_factory
+        self.max_parallel_actions = max_parallel_actions or settings.AUTOMATION_MAX_PARALLEL_ACTIONS
+        self._triggers = {}
+        # Actions compilées par automatisation, recompilées quand updated_at change
+        self._compiled: "OrderedDict[str, Tuple[datetime, Dict[str, CompiledTemplate]]]" = OrderedDict()
+        self._synced_at = None
+
+    async def _with_db(self, fn, *args):
+        """Exécute un appel base de données bloquant hors de la boucle, sur sa propre session"""
+        def call():
+            db = self.db_factory()
+            try:
+                return fn(db, *args)
+            finally:
+                db.close()
+        return await asyncio.to_thread(call)
         
     def create_automation(self, user_id: int, name: str, config: Dict) -> Dict:
         """Crée une nouvelle automatisation"""
         try:
-            automation_data = {
-                "id": f"auto_{user_id}_{int(datetime.now().timestamp())}",
-                "user_id": user_id,
-                "name": name,
-                "config": config,
-                "created_at": datetime.now().isoformat(),
-                "is_active": True,
-                "last_run": None,
-                "next_run": None
-            }
+            automation_id = f"auto_{uuid.uuid4().hex[:16]}"
+            trigger = automation_trigger(config)
+            # Rejette dépendances inconnues, cycles et variables inconnues
+            compiled = compile_actions(config)
+            next_run_at = trigger.next_after(self.scheduler.clock()) if trigger else None
             
             # Sauvegarder en base de données
-            automation_id = db_service.create_automation(automation_data)
-            automation_data["db_id"] = automation_id
+            db = self.db_factory()
+            try:
+                automation = db.create_automation(
+                    automation_id, user_id, name, config,
+                    trigger=config.get("trigger") if trigger else None,
+                    next_run_at=next_run_at
+                )
+            finally:
+                db.close()
+            self._cache_compiled(automation_id, automation["updated_at"], compiled)
             
             # Programmer l'automatisation
-            self.schedule_automation(automation_data)
+            if trigger is not None:
+                self.schedule_automation(automation_id, trigger, next_run_at)
             
             return {
                 "success": True,
-                "automation_id": automation_data["id"],
+                "automation_id": automation_id,
+                "next_run_at": next_run_at.isoformat() if next_run_at else None,
                 "message": f"Automatisation '{name}' créée avec succès"
             }
             
@@ -45,111 +161,261 @@ class AutomationService:
             logger.error(f"Erreur création automatisation: {e}")
             return {"success": False, "error": str(e)}
     
-    def schedule_automation(self, automation: Dict):
+    def schedule_automation(self, automation_id: str, trigger, next_run_at: datetime):
         """Programme une automatisation"""
+        self.scheduler.add_job(automation_id, partial(self.run_automation, automation_id, "schedule"), trigger, next_run_at)
+        logger.info(f"Automatisation {automation_id} programmée")
+
+    def _parse_trigger(self, trigger_json: str):
+        # Déclencheurs identiques partagés (ex. tous les « daily 09:00 »)
+        if trigger_json not in self._triggers:
+            try:
+                self._triggers[trigger_json] = automation_trigger({"trigger": json.loads(trigger_json or "{}")})
+            except Exception as e:
+                logger.error(f"Déclencheur invalide {trigger_json}: {e}")
+                self._triggers[trigger_json] = None
+        return self._triggers[trigger_json]
+
+    def load_scheduled_automations(self) -> int:
+        """
+        Reconstruit le tas du planificateur (démarrage ou élection du leader) :
+        une requête sur l'index next_run_at, sans charger les configs complètes.
+        Les échéances passées pendant l'arrêt sont exécutées une fois.
+        """
+        synced_at = datetime.utcnow()
+        db = self.db_factory()
         try:
-            config = automation["config"]
-            trigger_type = config.get("trigger", {}).get("type", "manual")
-            
-            if trigger_type == "schedule":
-                frequency = config["trigger"].get("frequency", "daily")
-                time_str = config["trigger"].get("time", "09:00")
-                
-                if frequency == "daily":
-                    schedule.every().day.at(time_str).do(
-                        self.run_automation, automation["id"]
-                    )
-                elif frequency == "weekly":
-                    day = config["trigger"].get("day", "monday")
-                    getattr(schedule.every(), day).at(time_str).do(
-                        self.run_automation, automation["id"]
-                    )
-                elif frequency == "hourly":
-                    schedule.every().hour.do(
-                        self.run_automation, automation["id"]
-                    )
-                
-                self.active_automations[automation["id"]] = automation
-                logger.info(f"Automatisation {automation['id']} programmée")
-                
-        except Exception as e:
-            logger.error(f"Erreur programmation automatisation: {e}")
+            def entries():
+                for automation_id, trigger_json, next_run_at in db.iter_scheduled_automations():
+                    trigger = self._parse_trigger(trigger_json)
+                    if trigger is not None:
+                        yield automation_id, partial(self.run_automation, automation_id, "schedule"), trigger, next_run_at
+
+            count = self.scheduler.add_jobs(entries())
+        finally:
+            db.close()
+        self._synced_at = synced_at - SYNC_OVERLAP
+        self.scheduler.add_job(SYNC_JOB_ID, self.sync_scheduled_automations, Interval(settings.AUTOMATION_SYNC_SECONDS))
+        logger.info(f"{count} automatisations planifiées rechargées")
+        return count
+
+    def sync_scheduled_automations(self) -> int:
+        """Reporte dans le planificateur les automatisations créées ou modifiées par les autres workers"""
+        synced_at = datetime.utcnow()
+        db = self.db_factory()
+        try:
+            rows = list(db.iter_automations_updated_since(self._synced_at))
+        finally:
+            db.close()
+
+        entries = []
+        for automation_id, trigger_json, next_run_at in rows:
+            trigger = self._parse_trigger(trigger_json) if next_run_at else None
+            job = self.scheduler.get_job(automation_id)
+            if trigger is None:
+                self.scheduler.remove_job(automation_id)
+            elif job is None or job.next_run_at != next_run_at:
+                entries.append((automation_id, partial(self.run_automation, automation_id, "schedule"), trigger, next_run_at))
+        self._synced_at = synced_at - SYNC_OVERLAP
+        return self.scheduler.add_jobs(entries) if entries else 0
     
-    def run_automation(self, automation_id: str):
-        """Exécute une automatisation"""
+    def _cache_compiled(self, automation_id: str, updated_at: datetime, compiled: Dict[str, CompiledTemplate]):
+        self._compiled[automation_id] = (updated_at, compiled)
+        self._compiled.move_to_end(automation_id)
+        while len(self._compiled) > settings.AUTOMATION_TEMPLATE_CACHE_SIZE:
+            self._compiled.popitem(last=False)
+
+    def compiled_actions(self, automation: Dict) -> Dict[str, CompiledTemplate]:
+        """Actions compilées de l'automatisation ; recompilées seulement si sa config a changé"""
+        cached = self._compiled.get(automation["id"])
+        if cached and cached[0] == automation["updated_at"]:
+            self._compiled.move_to_end(automation["id"])
+            return cached[1]
+        compiled = compile_actions(automation["config"])
+        self._cache_compiled(automation["id"], automation["updated_at"], compiled)
+        return compiled
+
+    async def run_automation(self, automation_id: str, source: str = "manual", variables: Dict = None):
+        """
+        Exécute une automatisation et enregistre l'exécution dans automation_runs.
+        variables complète ou remplace config["variables"] (ex. données d'un déclencheur).
+        """
+        run_id = None
         try:
-            if automation_id not in self.active_automations:
+            def load(db):
+                automation = db.get_automation(automation_id)
+                user = db.get_user_by_id(automation["user_id"]) if automation else None
+                return automation, user.email if user else ""
+            automation, user_email = await self._with_db(load)
+            if not automation or not automation["is_active"]:
                 logger.error(f"Automatisation {automation_id} non trouvée")
-                return
-            
-            automation = self.active_automations[automation_id]
-            config = automation["config"]
-            actions = config.get("actions", [])
+                if source == "schedule":
+                    self.scheduler.remove_job(automation_id)
+                return {"success": False, "error": "Automatisation non trouvée"}
             
             logger.info(f"Exécution automatisation {automation_id}")
+            run_id = await self._with_db(lambda db: db.create_automation_run(automation_id, source))
             
-            results = []
-            for action in actions:
-                result = self.execute_action(action, automation["user_id"])
-                results.append(result)
-                
-                # Arrêter si une action échoue et que stop_on_error est True
-                if not result["success"] and config.get("stop_on_error", False):
-                    break
+            context = {
+                "user_email": user_email,
+                "date": datetime.now().strftime("%d/%m/%Y"),
+                "automation_id": automation_id,
+                "automation_name": automation["name"],
+                **(automation["config"].get("variables") or {}),
+                **(variables or {})
+            }
+            results = await self.run_actions(automation["config"], automation["user_id"], context,
+                                             self.compiled_actions(automation))
+            succeeded = all(r["success"] for r in results)
             
-            # Mettre à jour la dernière exécution
-            automation["last_run"] = datetime.now().isoformat()
-            db_service.update_automation_last_run(automation["db_id"])
+            # Prochaine échéance calculée par le planificateur
+            job = self.scheduler.get_job(automation_id) if source == "schedule" else None
             
-            # Récompenser l'utilisateur pour l'automatisation réussie
-            if all(r["success"] for r in results):
-                db_service.add_saas_tokens(
-                    automation["user_id"], 
-                    5, 
-                    "automation_success", 
-                    f"Automatisation '{automation['name']}' exécutée"
-                )
+            def finish(db):
+                db.finish_automation_run(run_id, "success" if succeeded else "failed", results)
+                # Mettre à jour la dernière exécution
+                db.update_automation_last_run(automation_id, next_run_at=job.next_run_at if job else None)
+                # Récompenser l'utilisateur pour l'automatisation réussie
+                if succeeded:
+                    db.add_saas_tokens(
+                        automation["user_id"], 
+                        5, 
+                        "automation_success", 
+                        f"Automatisation '{automation['name']}' exécutée"
+                    )
+            await self._with_db(finish)
             
             return {
                 "success": True,
                 "automation_id": automation_id,
+                "run_id": run_id,
                 "results": results
             }
             
         except Exception as e:
             logger.error(f"Erreur exécution automatisation: {e}")
+            if run_id is not None:
+                await self._with_db(lambda db: db.finish_automation_run(run_id, "failed", error=str(e)))
             return {"success": False, "error": str(e)}
-    
-    def execute_action(self, action: Dict, user_id: int) -> Dict:
-        """Exécute une action spécifique"""
+
+    async def run_actions(self, config: Dict, user_id: int, context: Dict = None,
+                          compiled: Dict[str, CompiledTemplate] = None) -> List[Dict]:
+        """
+        Exécute les actions en graphe : chaque action démarre dès que ses
+        dépendances sont terminées (au plus max_parallel_actions à la fois) et reçoit
+        leurs sorties (ex. generated_content), qui complètent le contexte de rendu
+        de ses {{variables}}. Les actions dont une dépendance a
+        échoué sont sautées ; avec stop_on_error, plus aucune action ne démarre
+        après un échec. Résultats dans l'ordre de la config, avec leur durée.
+        """
+        actions = config.get("actions", [])
+        order, dependencies = action_graph(actions)
+        ancestors = action_ancestors(order, dependencies)
+        by_id = dict(zip(dependencies, actions))
+        compiled = compiled or compile_actions(config)
+        context = context or {}
+        # Enchaînement historique : l'ordre est respecté mais un échec ne saute pas la suite
+        skip_on_failure = any("depends_on" in action for action in actions)
+
+        slots = asyncio.Semaphore(self.max_parallel_actions)
+        results: Dict[str, Dict] = {}
+        pending = list(order)
+        running: Dict[asyncio.Task, str] = {}
+        stopped = False
+
+        while pending or running:
+            for action_id in list(pending):
+                if stopped:
+                    results[action_id] = self._skipped(action_id, by_id[action_id], "Arrêt après une action en échec")
+                    pending.remove(action_id)
+                    continue
+                deps = dependencies[action_id]
+                if any(dep not in results for dep in deps):
+                    continue
+                pending.remove(action_id)
+                failed = [dep for dep in deps if not results[dep]["success"]] if skip_on_failure else []
+                if failed:
+                    results[action_id] = self._skipped(action_id, by_id[action_id], f"Dépendance en échec: {', '.join(failed)}")
+                    continue
+                # Sorties des actions en amont, les plus proches en dernier
+                inputs = {}
+                for upstream in order:
+                    if upstream in ancestors[action_id]:
+                        inputs.update(results[upstream].get("outputs") or {})
+                task = asyncio.ensure_future(
+                    self._timed_action(action_id, compiled[action_id], user_id, {**context, **inputs}, inputs, slots))
+                running[task] = action_id
+
+            if not running:
+                break
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                action_id = running.pop(task)
+                results[action_id] = task.result()
+                # Arrêter si une action échoue et que stop_on_error est True
+                if not results[action_id]["success"] and config.get("stop_on_error", False):
+                    stopped = True
+
+        return [results[action_id] for action_id in by_id]
+
+    def _skipped(self, action_id: str, action: Dict, reason: str) -> Dict:
+        return {"id": action_id, "action": action.get("type"), "success": False, "status": "skipped", "error": reason}
+
+    async def _timed_action(self, action_id: str, template: CompiledTemplate, user_id: int, context: Dict,
+                            inputs: Dict, slots: asyncio.Semaphore) -> Dict:
+        async with slots:
+            started_at = datetime.utcnow()
+            started = time.perf_counter()
+            try:
+                action = template.render(context)
+            except TemplateError as e:
+                result = {"success": False, "action": template.source.get("type"), "error": str(e)}
+            else:
+                result = await self.execute_action(action, user_id, inputs)
+            duration_ms = (time.perf_counter() - started) * 1000
+        return {
+            "id": action_id,
+            **result,
+            "status": "success" if result.get("success") else "failed",
+            "started_at": started_at.isoformat(),
+            "duration_ms": round(duration_ms, 1)
+        }
+
+    def _action_handler(self, action_type: str):
+        return {
+            "send_email": self.action_send_email,
+            "post_social": self.action_post_social,
+            "webhook": self.action_webhook,
+            "generate_content": self.action_generate_content,
+        }.get(action_type)
+
+    async def execute_action(self, action: Dict, user_id: int, inputs: Dict = None) -> Dict:
+        """Exécute une action ; les actions bloquantes tournent dans un thread"""
         try:
             action_type = action.get("type")
-            
-            if action_type == "send_email":
-                return self.action_send_email(action, user_id)
-            elif action_type == "post_social":
-                return self.action_post_social(action, user_id)
-            elif action_type == "webhook":
-                return self.action_webhook(action, user_id)
-            elif action_type == "generate_content":
-                return self.action_generate_content(action, user_id)
-            else:
+            handler = self._action_handler(action_type)
+            if handler is None:
                 return {"success": False, "error": f"Type d'action inconnu: {action_type}"}
+            if asyncio.iscoroutinefunction(handler):
+                return await handler(action, user_id, inputs or {})
+            return await asyncio.to_thread(handler, action, user_id, inputs or {})
                 
         except Exception as e:
             logger.error(f"Erreur exécution action: {e}")
             return {"success": False, "error": str(e)}
     
-    def action_send_email(self, action: Dict, user_id: int) -> Dict:
+    async def action_send_email(self, action: Dict, user_id: int, inputs: Dict = None) -> Dict:
         """Action d'envoi d'email"""
         try:
             from email_service import email_service
             
             to_email = action.get("to_email")
             subject = action.get("subject", "Email automatique")
-            content = action.get("content", "")
+            content = action.get("content") or (inputs or {}).get("generated_content", "")
             
-            result = email_service.send_email(to_email, subject, content, content)
+            result = await email_service.send_email_async(to_email, subject, content, content)
+            if not result.get("success"):
+                return {"success": False, "action": "send_email", "error": result.get("error")}
             
             return {
                 "success": True,
@@ -160,11 +426,11 @@ class AutomationService:
         except Exception as e:
             return {"success": False, "error": str(e)}
     
-    def action_post_social(self, action: Dict, user_id: int) -> Dict:
+    def action_post_social(self, action: Dict, user_id: int, inputs: Dict = None) -> Dict:
         """Action de publication sur les réseaux sociaux"""
         try:
             platform = action.get("platform", "twitter")
-            content = action.get("content", "")
+            content = action.get("content") or (inputs or {}).get("generated_content", "")
             
             # Placeholder pour l'intégration des APIs sociales
             if platform == "twitter":
@@ -183,31 +449,36 @@ class AutomationService:
         except Exception as e:
             return {"success": False, "error": str(e)}
     
-    def action_webhook(self, action: Dict, user_id: int) -> Dict:
-        """Action webhook HTTP"""
+    async def action_webhook(self, action: Dict, user_id: int, inputs: Dict = None) -> Dict:
+        """Action webhook HTTP (client partagé : keep-alive, retries, taille de réponse limitée)"""
         try:
+            from http_client import http_client
+            
             url = action.get("url")
             method = action.get("method", "POST")
             data = action.get("data", {})
             headers = action.get("headers", {"Content-Type": "application/json"})
             
             if method.upper() == "POST":
-                response = requests.post(url, json=data, headers=headers, timeout=30)
+                response = await http_client.request("POST", url, json=data, headers=headers)
             elif method.upper() == "GET":
-                response = requests.get(url, params=data, headers=headers, timeout=30)
+                response = await http_client.request("GET", url, params=data, headers=headers)
             else:
                 return {"success": False, "error": f"Méthode HTTP non supportée: {method}"}
             
             return {
                 "success": response.status_code < 400,
                 "action": "webhook",
-                "details": f"Webhook {method} {url} - Status: {response.status_code}"
+                "details": f"Webhook {method} {url} - Status: {response.status_code}",
+                "outputs": {"webhook_status": response.status_code, "webhook_response": response.text}
             }
             
+        except asyncio.TimeoutError:
+            return {"success": False, "error": f"Délai dépassé pour le webhook {action.get('url')}"}
         except Exception as e:
             return {"success": False, "error": str(e)}
     
-    def action_generate_content(self, action: Dict, user_id: int) -> Dict:
+    def action_generate_content(self, action: Dict, user_id: int, inputs: Dict = None) -> Dict:
         """Action de génération de contenu IA"""
         try:
             from ai_service import ai_service
@@ -223,7 +494,8 @@ class AutomationService:
                     "success": True,
                     "action": "generate_content",
                     "details": "Contenu généré avec succès",
-                    "generated_content": result
+                    # Sorties transmises aux actions suivantes
+                    "outputs": {"generated_content": result}
                 }
             
             return {"success": False, "error": "Type de contenu non supporté"}
@@ -239,23 +511,5 @@ class AutomationService:
         except Exception as e:
             logger.error(f"Erreur récupération automatisations: {e}")
             return []
-    
-    def start_scheduler(self):
-        """Démarre le planificateur d'automatisations"""
-        if self.scheduler_running:
-            return
-        
-        self.scheduler_running = True
-        
-        def run_scheduler():
-            while self.scheduler_running:
-                schedule.run_pending()
-                asyncio.sleep(1)
-        
-        scheduler_thread = threading.Thread(target=run_scheduler)
-        scheduler_thread.daemon = True
-        scheduler_thread.start()
-        
-        logger.info("🤖 Planificateur d'automatisations démarré")
 
 automation_service = AutomationService()
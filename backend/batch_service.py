@@ -0,0 +1,109 @@
+import asyncio
+import json
+from typing import AsyncIterator, Callable, Dict, List
+from logger import logger
+from config import settings
+from database import DatabaseService
+
+# Coût en crédits par type d'élément (identique aux endpoints unitaires)
+BATCH_ITEM_COSTS = {
+    "text": 1,
+    "marketing": 5
+}
+
+class BatchService:
+    def __init__(self, concurrency: int = None, db_factory: Callable[[], DatabaseService] = DatabaseService):
+        self.concurrency = concurrency or settings.BATCH_CONCURRENCY
+        self.db_factory = db_factory
+
+    def estimate_cost(self, items: List) -> int:
+        """Coût total du lot, lève ValueError pour un type inconnu"""
+        total = 0
+        for item in items:
+            if item.type not in BATCH_ITEM_COSTS:
+                raise ValueError(f"Type d'élément inconnu: {item.type}")
+            total += BATCH_ITEM_COSTS[item.type]
+        return total
+
+    def generate_item(self, item, plan: str = "free") -> Dict:
+        """Génère un élément du lot (appel bloquant, exécuté dans un thread)"""
+        from openai_client import generate_text, generate_marketing_content, use_openai_api
+
+        if item.type == "text":
+            if not use_openai_api():
+                return {"success": True, "result": generate_text(item.prompt)}  # Mode démo
+            # Un échec de l'API est un élément en échec (non facturé), pas un texte d'erreur
+            from ai_service import ai_service
+            result = ai_service.generate_text(item.prompt, plan=plan)
+            if not result["success"]:
+                return result
+            return {"success": True, "result": result["text"]}
+
+        result = generate_marketing_content(item.business_type, item.target_audience, item.platform)
+        if not result["success"]:
+            return result
+        return {"success": True, "content": result["content"]}
+
+    def settle(self, user_id: int, transaction_id: int, charged: int) -> Dict:
+        db = self.db_factory()
+        try:
+            refunded = db.settle_credit_reservation(transaction_id, charged)
+            user = db.get_user_by_id(user_id)
+            return {"credits_refunded": refunded, "credits_left": user.credits if user else None}
+        finally:
+            db.close()
+
+    async def stream_batch(self, user_id: int, items: List, transaction_id: int,
+                           plan: str = "free") -> AsyncIterator[str]:
+        """Exécute le lot avec une concurrence bornée et renvoie chaque résultat en NDJSON"""
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run_item(index: int, item):
+            async with semaphore:
+                try:
+                    result = await asyncio.to_thread(self.generate_item, item, plan)
+                except Exception as e:
+                    logger.error(f"Erreur génération groupée (élément {index}): {e}")
+                    result = {"success": False, "error": str(e)}
+                return index, item, result
+
+        tasks = [asyncio.create_task(run_item(index, item)) for index, item in enumerate(items)]
+        charged = 0
+        succeeded = 0
+        settled = False
+
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                index, item, result = await next_done
+                if result["success"]:
+                    charged += BATCH_ITEM_COSTS[item.type]
+                    succeeded += 1
+                yield json.dumps({"type": "result", "index": index, "item_type": item.type, **result}) + "\n"
+
+            summary = await asyncio.to_thread(self.settle, user_id, transaction_id, charged)
+            settled = True
+            yield json.dumps({
+                "type": "summary",
+                "total": len(items),
+                "succeeded": succeeded,
+                "failed": len(items) - succeeded,
+                "credits_charged": charged,
+                **summary
+            }) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+            if not settled:
+                # Client déconnecté : seuls les éléments déjà livrés sont facturés. Le règlement
+                # part dans un thread (pas d'appel bloquant sur la boucle) et se termine même
+                # si la tâche du flux est annulée pendant l'attente.
+                settlement = asyncio.get_running_loop().run_in_executor(
+                    None, self.settle, user_id, transaction_id, charged
+                )
+                try:
+                    await asyncio.shield(settlement)
+                except asyncio.CancelledError:
+                    pass
+
+# Instance globale
+batch_service = BatchService()
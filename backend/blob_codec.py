@@ -0,0 +1,37 @@
+import json
+import zlib
+from typing import Tuple
+from logger import logger
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+    logger.info("zstandard non installé - compression zlib utilisée")
+
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 9
+
+def default_codec() -> str:
+    return "zstd" if zstandard is not None else "zlib"
+
+def compress_json(data, codec: str = None) -> Tuple[bytes, str, int]:
+    """Sérialise et compresse un objet JSON : (blob, codec, taille non compressée)"""
+    codec = codec or default_codec()
+    raw = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw), codec, len(raw)
+    if codec == "zlib":
+        return zlib.compress(raw, ZLIB_LEVEL), codec, len(raw)
+    raise ValueError(f"Codec inconnu: {codec}")
+
+def decompress_json(blob: bytes, codec: str):
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Le paquet zstandard est requis pour lire ce contenu")
+        raw = zstandard.ZstdDecompressor().decompress(blob)
+    elif codec == "zlib":
+        raw = zlib.decompress(blob)
+    else:
+        raise ValueError(f"Codec inconnu: {codec}")
+    return json.loads(raw)
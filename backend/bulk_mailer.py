@@ -0,0 +1,204 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from config import settings
+from database import DatabaseService
+from email_service import email_service
+from logger import logger
+
+# (sujet, html, texte) d'un email, ou None pour ignorer le destinataire
+RenderedEmail = Optional[tuple]
+
+class RateLimiter:
+    """Débit global (seau à jetons) : au plus `rate` envois par seconde, avec une rafale de `burst`"""
+
+    def __init__(self, rate: float, burst: int = 1, clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], Awaitable] = asyncio.sleep):
+        self.interval = 1.0 / rate if rate and rate > 0 else 0.0
+        self.burst = max(1, burst)
+        self.clock = clock
+        self.sleep = sleep
+        self._next_slot = None
+
+    async def acquire(self):
+        if not self.interval:
+            return
+        now = self.clock()
+        # Réserve le prochain créneau libre ; la rafale autorise un créneau dans le passé
+        earliest = now - (self.burst - 1) * self.interval
+        slot = earliest if self._next_slot is None else max(self._next_slot, earliest)
+        self._next_slot = slot + self.interval
+        if slot > now:
+            await self.sleep(slot - now)
+
+def _recipient_id(recipient: Dict) -> int:
+    return recipient["id"]
+
+@dataclass
+class MailingJob:
+    name: str
+    # (db, cursor, limit) -> destinataires suivant la clé cursor (None : depuis le début),
+    # triés selon cette clé, avec au moins "id" et "email"
+    fetch_chunk: Callable[[DatabaseService, Any, int], List[Dict]]
+    render: Callable[[Dict], RenderedEmail]
+    # Clé de pagination (sérialisable en JSON) d'un destinataire : point de reprise après son lot
+    cursor: Callable[[Dict], Any] = _recipient_id
+
+class BulkMailer:
+    """
+    Envois groupés : destinataires lus par lots (pagination par clé, lot suivant
+    préchargé pendant les envois), rendu par destinataire, envois concurrents
+    bornés et débit global limité. La progression est enregistrée après chaque
+    lot dans mailing_runs : un envoi interrompu reprend au dernier lot terminé
+    (les destinataires du lot en cours peuvent recevoir l'email deux fois).
+    """
+
+    def __init__(self, concurrency: int = None, rate: float = None, chunk_size: int = None,
+                 send: Callable[..., Awaitable[Dict]] = None, db_factory=DatabaseService,
+                 clock: Callable[[], float] = time.monotonic):
+        self.concurrency = concurrency or settings.BULK_MAIL_CONCURRENCY
+        self.rate = settings.BULK_MAIL_RATE if rate is None else rate
+        self.chunk_size = chunk_size or settings.BULK_MAIL_CHUNK_SIZE
+        self.send = send or email_service.send_email_async
+        self.db_factory = db_factory
+        self.clock = clock
+
+    async def _with_db(self, fn, *args):
+        """Exécute un appel base de données bloquant hors de la boucle, sur sa propre session"""
+        def call():
+            db = self.db_factory()
+            try:
+                return fn(db, *args)
+            finally:
+                db.close()
+        return await asyncio.to_thread(call)
+
+    async def _deliver(self, job: MailingJob, recipient: Dict, slots: asyncio.Semaphore, limiter: RateLimiter) -> str:
+        try:
+            rendered = job.render(recipient)
+        except Exception as e:
+            logger.error(f"Erreur rendu {job.name} pour {recipient.get('email')}: {e}")
+            return "failed"
+        if rendered is None:
+            return "skipped"
+        subject, html_body, text_body = rendered
+        async with slots:
+            await limiter.acquire()
+            try:
+                result = await self.send(recipient["email"], subject, html_body, text_body)
+            except Exception as e:
+                result = {"success": False, "error": str(e)}
+        if not result.get("success"):
+            logger.warning(f"Échec envoi {job.name} à {recipient['email']}: {result.get('error')}")
+            return "failed"
+        return "sent"
+
+    async def run(self, job: MailingJob, run_key: str) -> Dict:
+        """Exécute (ou reprend) l'envoi `job` identifié par run_key et retourne le rapport de débit"""
+        run = await self._with_db(lambda db: db.get_or_create_mailing_run(job.name, run_key))
+        if run["status"] == "completed":
+            logger.info(f"Envoi {job.name} {run_key} déjà terminé")
+            return self._report(run, {"sent": 0, "failed": 0, "skipped": 0}, 0.0)
+
+        slots = asyncio.Semaphore(self.concurrency)
+        limiter = RateLimiter(self.rate, burst=self.concurrency, clock=self.clock)
+        totals = {"sent": 0, "failed": 0, "skipped": 0}
+        cursor = run["cursor"]
+        if cursor is not None:
+            logger.info(f"Reprise de l'envoi {job.name} {run_key} après {cursor}")
+
+        started = self.clock()
+        next_chunk = asyncio.ensure_future(self._with_db(job.fetch_chunk, cursor, self.chunk_size))
+        try:
+            while True:
+                chunk = await next_chunk
+                if not chunk:
+                    break
+                cursor = job.cursor(chunk[-1])
+                next_chunk = asyncio.ensure_future(self._with_db(job.fetch_chunk, cursor, self.chunk_size))
+
+                outcomes = await asyncio.gather(*(self._deliver(job, r, slots, limiter) for r in chunk))
+                counts = {outcome: outcomes.count(outcome) for outcome in totals}
+                await self._with_db(lambda db: db.checkpoint_mailing_run(run["id"], cursor, **counts))
+                for outcome, count in counts.items():
+                    totals[outcome] += count
+        except Exception:
+            next_chunk.cancel()
+            await self._with_db(lambda db: db.finish_mailing_run(run["id"], "failed"))
+            raise
+
+        run = await self._with_db(lambda db: db.finish_mailing_run(run["id"], "completed"))
+        report = self._report(run, totals, self.clock() - started)
+        logger.info(
+            f"Envoi {job.name} {run_key} terminé: {report['sent']} envoyés, {report['failed']} échecs, "
+            f"{report['skipped']} ignorés en {report['elapsed_seconds']}s ({report['messages_per_second']} msg/s)"
+        )
+        return report
+
+    def _report(self, run: Dict, totals: Dict, elapsed: float) -> Dict:
+        return {
+            "job": run["job"],
+            "run_key": run["run_key"],
+            "status": run["status"],
+            **totals,
+            "total_sent": run["sent"],
+            "elapsed_seconds": round(elapsed, 2),
+            "messages_per_second": round(totals["sent"] / elapsed, 2) if elapsed > 0 else 0.0
+        }
+
+def _fetch_inactive_users(db: DatabaseService, cursor: Optional[list], limit: int) -> List[Dict]:
+    after = (datetime.fromisoformat(cursor[0]), cursor[1]) if cursor else None
+    users = db.get_inactive_users(days=2, after=after, limit=limit)
+    return [{"id": user.id, "email": user.email, "credits": user.credits,
+             "last_active_at": user.last_active_at.isoformat()} for user in users]
+
+def weekly_report_period(run_key: str) -> Tuple[datetime, datetime]:
+    """Semaine ISO précédant celle de l'envoi : [lundi précédent, lundi de l'envoi)"""
+    year, week = run_key.split("-W")
+    monday = datetime.combine(date.fromisocalendar(int(year), int(week), 1), datetime.min.time())
+    return monday - timedelta(days=7), monday
+
+def weekly_report_job(run_key: str) -> MailingJob:
+    since, until = weekly_report_period(run_key)
+    return MailingJob(
+        name="weekly_report",
+        # Statistiques de tout un lot en une requête, utilisateurs sans activité exclus
+        fetch_chunk=lambda db, cursor, limit: db.get_weekly_stats_chunk(since, until, cursor or 0, limit, only_active=True),
+        render=_render_weekly_report
+    )
+
+def _render_weekly_report(recipient: Dict) -> RenderedEmail:
+    # Seulement pour les utilisateurs actifs cette semaine
+    if recipient["stats"].get("total_content", 0) <= 0:
+        return None
+    return email_service.build_weekly_report(recipient["stats"])
+
+DAILY_REMINDER_JOB = MailingJob(
+    name="daily_reminder",
+    fetch_chunk=_fetch_inactive_users,
+    render=lambda recipient: email_service.build_daily_reminder(recipient["credits"]),
+    cursor=lambda recipient: [recipient["last_active_at"], recipient["id"]]
+)
+
+# Instance globale
+bulk_mailer = BulkMailer()
+
+# Tâches automatisées asynchrones
+async def send_daily_reminders(run_key: str = None):
+    """Envoie des rappels quotidiens aux utilisateurs inactifs"""
+    try:
+        return await bulk_mailer.run(DAILY_REMINDER_JOB, run_key or date.today().isoformat())
+    except Exception as e:
+        logger.error(f"Erreur envoi rappels quotidiens: {e}")
+
+async def send_weekly_reports(run_key: str = None):
+    """Envoie les rapports hebdomadaires"""
+    if run_key is None:
+        year, week, _ = date.today().isocalendar()
+        run_key = f"{year}-W{week:02d}"
+    try:
+        return await bulk_mailer.run(weekly_report_job(run_key), run_key)
+    except Exception as e:
+        logger.error(f"Erreur envoi rapports hebdomadaires: {e}")
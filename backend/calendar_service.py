@@ -0,0 +1,105 @@
+import json
+from datetime import date, timedelta
+from itertools import groupby
+from typing import Callable, Dict, Iterator, List
+from logger import logger
+from config import settings
+from database import DatabaseService
+from content_templates import WEEKLY_PLAN
+
+WEEKDAYS = ["Lundi", "Mardi", "Mercredi", "Jeudi", "Vendredi", "Samedi", "Dimanche"]
+
+# Jours de publication du plan hebdomadaire (index de jour de la semaine -> position dans la semaine du plan)
+POSTING_DAYS = {WEEKDAYS.index(day): slot for slot, (_, day, _) in enumerate(WEEKLY_PLAN[0])}
+
+class CalendarService:
+    def __init__(self, insert_batch: int = None, db_factory: Callable[[], DatabaseService] = DatabaseService):
+        self.insert_batch = insert_batch or settings.CALENDAR_INSERT_BATCH
+        self.db_factory = db_factory
+
+    def iter_days(self, duration_days: int, start_date: date) -> Iterator[Dict]:
+        """Produit les publications jour par jour, sans construire le calendrier en mémoire"""
+        for day_index in range(duration_days):
+            post_date = start_date + timedelta(days=day_index)
+            slot = POSTING_DAYS.get(post_date.weekday())
+            if slot is None:
+                continue
+
+            week_number = day_index // 7 + 1
+            emoji, _, content = WEEKLY_PLAN[(week_number - 1) % len(WEEKLY_PLAN)][slot]
+            cycle = (week_number - 1) // len(WEEKLY_PLAN) + 1
+            if cycle > 1:
+                content = f"{content.strip()} (cycle {cycle})"
+
+            yield {
+                "day_index": day_index,
+                "post_date": post_date,
+                "week_number": week_number,
+                "weekday": WEEKDAYS[post_date.weekday()],
+                "emoji": emoji,
+                "content": content.strip()
+            }
+
+    def iter_weeks(self, duration_days: int, start_date: date) -> Iterator[List[Dict]]:
+        """Regroupe les publications par semaine, une semaine à la fois"""
+        days = self.iter_days(duration_days, start_date)
+        for _, entries in groupby(days, key=lambda entry: entry["week_number"]):
+            yield list(entries)
+
+    def stream_calendar(self, calendar: Dict) -> Iterator[str]:
+        """Génère, persiste par lots et renvoie le calendrier semaine par semaine en NDJSON"""
+        db = self.db_factory()
+        start_date = date.fromisoformat(calendar["start_date"])
+        weeks = self.iter_weeks(calendar["duration_days"], start_date)
+        pending: List[Dict] = []
+        total = 0
+        completed = False
+
+        def flush():
+            nonlocal total
+            total += db.add_calendar_entries(calendar["calendar_id"], pending)
+            pending.clear()
+
+        try:
+            yield json.dumps({"type": "calendar", **calendar}) + "\n"
+
+            for week in weeks:
+                pending.extend(week)
+                if len(pending) >= self.insert_batch:
+                    flush()
+                yield json.dumps({
+                    "type": "week",
+                    "week": week[0]["week_number"],
+                    "entries": [self._public_entry(entry) for entry in week]
+                }) + "\n"
+
+            flush()
+            db.complete_content_calendar(calendar["calendar_id"])
+            completed = True
+            yield json.dumps({"type": "summary", "calendar_id": calendar["calendar_id"], "entries": total}) + "\n"
+        finally:
+            if not completed:
+                # Client déconnecté : on termine la persistance pour la lecture paginée
+                try:
+                    for week in weeks:
+                        pending.extend(week)
+                        if len(pending) >= self.insert_batch:
+                            flush()
+                    flush()
+                    db.complete_content_calendar(calendar["calendar_id"])
+                except Exception as e:
+                    logger.error(f"Erreur finalisation calendrier {calendar['calendar_id']}: {e}")
+            db.close()
+
+    def _public_entry(self, entry: Dict) -> Dict:
+        return {
+            "day_index": entry["day_index"],
+            "date": entry["post_date"].isoformat(),
+            "week": entry["week_number"],
+            "weekday": entry["weekday"],
+            "emoji": entry["emoji"],
+            "content": entry["content"]
+        }
+
+# Instance globale
+calendar_service = CalendarService()
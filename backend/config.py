@@ -15,6 +15,7 @@ class Settings(BaseSettings):
     
     # API Keys
     OPENAI_API_KEY: Optional[str] = os.getenv("OPENAI_API_KEY")
+    OPENAI_BASE_URL: Optional[str] = os.getenv("OPENAI_BASE_URL")  # Ex: serveur local loadtest/fake_openai.py
     STRIPE_SECRET_KEY: Optional[str] = os.getenv("STRIPE_SECRET_KEY")
     STRIPE_PUBLIC_KEY: Optional[str] = os.getenv("STRIPE_PUBLIC_KEY")
     
@@ -23,7 +24,30 @@ class Settings(BaseSettings):
     SMTP_PORT: int = 587
     SMTP_USER: Optional[str] = None
     SMTP_PASSWORD: Optional[str] = None
+    SMTP_TIMEOUT: float = 30.0
+    SMTP_USE_TLS: bool = True  # STARTTLS (désactivé pour un serveur local sans TLS)
+    # Pool de connexions SMTP longues
+    SMTP_POOL_SIZE: int = 4
+    SMTP_MAX_MESSAGES_PER_CONNECTION: int = 100
+    SMTP_IDLE_TIMEOUT: float = 60.0
+    # Envois groupés (rappels quotidiens, rapports hebdomadaires)
+    BULK_MAIL_CONCURRENCY: int = 20
+    BULK_MAIL_RATE: float = 20.0  # Messages par seconde, tous envois confondus
+    BULK_MAIL_CHUNK_SIZE: int = 500
+    # Suivi d'activité (rappels aux utilisateurs inactifs) : écriture différée et regroupée
+    ACTIVITY_WRITE_INTERVAL_MINUTES: float = 15.0
+    ACTIVITY_FLUSH_SECONDS: float = 30.0
+    # Outbox des emails transactionnels (envoyés par un worker de fond)
+    OUTBOX_BATCH_SIZE: int = 50
+    OUTBOX_POLL_INTERVAL: float = 5.0
+    OUTBOX_MAX_ATTEMPTS: int = 6
+    OUTBOX_BACKOFF_BASE: float = 30.0
+    OUTBOX_BACKOFF_MAX: float = 3600.0
+    OUTBOX_LEASE_SECONDS: int = 300
     FROM_EMAIL: str = "noreply@smartsaas.com"
+    # Templates email : cache du bytecode compilé (dossier temporaire par défaut) et des rendus
+    EMAIL_TEMPLATE_CACHE_DIR: Optional[str] = None
+    EMAIL_RENDER_CACHE_SIZE: int = 4096
     
     # Frontend URL pour les liens dans les emails
     FRONTEND_URL: str = "https://smartsaas.com"
@@ -49,7 +73,71 @@ class Settings(BaseSettings):
         "https://*.replit.com"
     ]
     
+    # Requêtes par minute et par IP (SecurityMiddleware)
+    RATE_LIMIT: int = int(os.getenv("RATE_LIMIT", "100"))
+    
     # Debug mode
     DEBUG: bool = os.getenv("DEBUG", "False").lower() == "true"
 
+    # Jobs de génération en arrière-plan
+    JOB_WORKERS: int = 4
+    JOB_STALE_SECONDS: int = 600  # Un job 'running' sans progrès depuis ce délai est repris
+    JOB_SWEEP_SECONDS: float = 120.0  # Recherche périodique des jobs abandonnés (leader)
+
+    # Résilience des appels IA
+    AI_MAX_ATTEMPTS: int = 3
+    AI_CALL_DEADLINE: float = 90.0  # Délai global, retries compris (secondes)
+    AI_ATTEMPT_TIMEOUT: float = 60.0  # Délai par tentative (secondes)
+    AI_HEDGE_REQUESTS: bool = False  # Relance une requête couverte au-delà du p95
+    AI_BREAKER_FAILURES: int = 5
+    AI_BREAKER_RESET_SECONDS: float = 30.0
+
+    # Routage des modèles IA par tâche et par plan
+    AI_MODEL_ROUTING: bool = True
+    AI_MODEL_FAST: str = "gpt-4o-mini"
+    AI_MODEL_STANDARD: str = "gpt-4o"
+    AI_MODEL_PREMIUM: str = "gpt-4"
+    # Clé de cache de préfixe envoyée au fournisseur (désactiver si l'API compatible la refuse)
+    AI_PROMPT_CACHE_KEY: bool = True
+
+    # Génération groupée (/generate/batch)
+    BATCH_MAX_ITEMS: int = 500
+    BATCH_CONCURRENCY: int = 8
+
+    # Calendriers de contenu générés en flux
+    CALENDAR_MAX_DAYS: int = 365
+    CALENDAR_INSERT_BATCH: int = 100
+
+    # Images générées (stockage local adressé par contenu)
+    MEDIA_ROOT: str = "./media"
+    IMAGE_THUMBNAIL_SIZE: int = 256
+    IMAGE_DOWNLOAD_MAX_BYTES: int = 20 * 1024 * 1024
+    IMAGE_DOWNLOAD_TIMEOUT: float = 60.0
+    MEDIA_CACHE_MAX_AGE: int = 31536000
+
+    # Planificateur asyncio (rappels, rapports, automatisations)
+    SCHEDULER_MAX_CONCURRENCY: int = 4
+    SCHEDULER_MAX_SLEEP_SECONDS: float = 300.0
+    AUTOMATION_MAX_PARALLEL_ACTIONS: int = 4  # Actions indépendantes d'une même exécution
+    AUTOMATION_TEMPLATE_CACHE_SIZE: int = 10000  # Configs compilées ({{variables}}) gardées en mémoire
+    AUTOMATION_SYNC_SECONDS: float = 30.0  # Prise en compte des automatisations créées sur les autres workers
+
+    # Client HTTP partagé (webhooks des automatisations)
+    HTTP_CONNECT_TIMEOUT: float = 5.0
+    HTTP_READ_TIMEOUT: float = 15.0
+    HTTP_TOTAL_TIMEOUT: float = 45.0  # Retries compris
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    HTTP_KEEPALIVE_EXPIRY: float = 30.0
+    HTTP_PER_HOST_CONCURRENCY: int = 8
+    HTTP_MAX_ATTEMPTS: int = 3
+    HTTP_BACKOFF_BASE: float = 0.5
+    HTTP_BACKOFF_MAX: float = 8.0
+    HTTP_MAX_RESPONSE_BYTES: int = 1024 * 1024
+
+    # Élection du leader (un seul worker exécute les tâches planifiées)
+    LEADER_BACKEND: str = "auto"  # auto, advisory (verrou PostgreSQL), lease (bail en base, ex. SQLite)
+    LEADER_LEASE_SECONDS: float = 30.0
+    LEADER_RENEW_SECONDS: float = 10.0
+
 settings = Settings()
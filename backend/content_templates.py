@@ -0,0 +1,161 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Callable, Dict, Tuple
+from jinja2 import Environment, StrictUndefined
+
+# Environnement texte (pas d'échappement HTML) : les templates sont compilés une seule fois
+_env = Environment(autoescape=False, undefined=StrictUndefined, keep_trailing_newline=False)
+
+def _compile(source: str):
+    return _env.from_string(source)
+
+# === Contenu marketing par plateforme ===
+
+MARKETING_TEXT_TEMPLATES = {
+    "instagram": _compile("""✨ {{ business_title }} qui comprend ses clients !
+
+Spécialement conçu pour {{ target_audience }}, nous savons ce qui vous fait vibrer.
+
+Découvrez notre univers et rejoignez notre communauté !
+
+#Instagram #Marketing #{{ business_tag }}"""),
+
+    "linkedin": _compile("""🚀 Comment {{ business_type }} révolutionne l'expérience client
+
+Notre approche centrée sur {{ target_audience }} nous permet de créer des solutions innovantes qui répondent aux vrais besoins du marché.
+
+Découvrez notre vision et partagez votre avis en commentaire !
+
+#LinkedIn #Innovation #Business"""),
+
+    "default": _compile("""Nouveau chez {{ business_type }} !
+
+Parfait pour {{ target_audience }}, découvrez ce qui nous rend uniques.
+
+Suivez-nous pour plus de contenus exclusifs !""")
+}
+
+CAPTION_TEMPLATE = _compile("""🎯 Contenu spécialement créé pour {{ target_audience }}
+
+✅ Engageant et authentique
+✅ Optimisé pour {{ platform }}
+✅ Call-to-action intégré
+
+#Marketing #IA #{{ platform_title }} #{{ business_tag }}""")
+
+IMAGE_PROMPT_TEMPLATE = _compile(
+    "Marketing visuel moderne pour {{ business_type }}, style professionnel, couleurs attrayantes"
+)
+
+# === Calendrier de contenu par durée ===
+
+WEEKLY_PLAN = [
+    [
+        ("📱", "Lundi", "Post de présentation + Story behind the scenes"),
+        ("📸", "Mercredi", "Contenu produit/service + Carousel informatif  "),
+        ("🎥", "Vendredi", "Vidéo témoignage client + Post engagement"),
+    ],
+    [
+        ("💡", "Lundi", "Conseil/Astuce + Story interactive"),
+        ("🎯", "Mercredi", "Contenu éducatif + Post questions/réponses"),
+        ("🚀", "Vendredi", "Annonce/Nouveauté + Story countdown"),
+    ],
+    [
+        ("👥", "Lundi", "Contenu communauté + Story user-generated content"),
+        ("📊", "Mercredi", "Infographie/Statistiques + Post didactique"),
+        ("🎉", "Vendredi", "Contenu divertissant + Story quiz"),
+    ],
+    [
+        ("🔥", "Lundi", "Contenu tendance + Story sondage"),
+        ("💎", "Mercredi", "Contenu premium/exclusif + Post call-to-action"),
+        ("🌟", "Vendredi", "Récap de la semaine + Story remerciements"),
+    ],
+]
+
+CALENDAR_TEMPLATE = _compile("""📅 CALENDRIER DE CONTENU - {{ business_upper }} ({{ duration_days }} jours)
+{% for week in weeks %}
+SEMAINE {{ loop.index }}:
+{% for emoji, day, content in week %}{{ emoji }} {{ day }}: {{ content }}
+{% endfor %}{% endfor %}{% if cycles > 1 %}
+CYCLE: répétez ce plan de 4 semaines {{ cycles }} fois en renouvelant les thèmes.
+{% endif %}
+CONSEILS BONUS:
+- Postez aux heures de forte audience (11h-13h, 17h-19h)
+- Utilisez 3-5 hashtags stratégiques par post
+- Alternez entre contenu informatif, divertissant et promotionnel
+- Répondez aux commentaires dans les 2h""")
+
+def calendar_variant(duration_days: int) -> Tuple[int, int]:
+    """(semaines affichées, nombre de cycles de 4 semaines) selon la durée demandée"""
+    weeks = max(1, min(len(WEEKLY_PLAN), -(-duration_days // 7)))
+    cycles = max(1, round(duration_days / (7 * len(WEEKLY_PLAN))))
+    return weeks, cycles
+
+# === Rendu mémoïsé ===
+
+@lru_cache(maxsize=4096)
+def render_marketing_content(business_type: str, target_audience: str, platform: str) -> Tuple[str, str, str]:
+    """(texte, légende, prompt image) pour une combinaison donnée"""
+    variables = {
+        "business_type": business_type,
+        "business_title": business_type.title(),
+        "business_tag": business_type.replace(' ', ''),
+        "target_audience": target_audience,
+        "platform": platform,
+        "platform_title": platform.title()
+    }
+    template = MARKETING_TEXT_TEMPLATES.get(platform, MARKETING_TEXT_TEMPLATES["default"])
+    return (
+        template.render(variables),
+        CAPTION_TEMPLATE.render(variables),
+        IMAGE_PROMPT_TEMPLATE.render(variables)
+    )
+
+@lru_cache(maxsize=1024)
+def render_content_calendar(business_type: str, duration_days: int) -> str:
+    weeks, cycles = calendar_variant(duration_days)
+    return CALENDAR_TEMPLATE.render(
+        business_upper=business_type.upper(),
+        duration_days=duration_days,
+        weeks=WEEKLY_PLAN[:weeks],
+        cycles=cycles
+    )
+
+class TTLCache:
+    """Cache LRU borné avec expiration (les URLs d'images générées expirent côté fournisseur)"""
+
+    def __init__(self, maxsize: int = 1024, ttl_seconds: float = 1800):
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self._data: "OrderedDict[str, Tuple[float, Dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key: str, compute: Callable[[], Dict], cacheable: Callable[[Dict], bool]) -> Dict:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry and now - entry[0] < self.ttl_seconds:
+                self._data.move_to_end(key)
+                return entry[1]
+
+        value = compute()
+        if cacheable(value):
+            with self._lock:
+                self._data[key] = (now, value)
+                self._data.move_to_end(key)
+                while len(self._data) > self.maxsize:
+                    self._data.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+image_cache = TTLCache()
+
+def clear_caches():
+    render_marketing_content.cache_clear()
+    render_content_calendar.cache_clear()
+    image_cache.clear()
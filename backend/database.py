@@ -1,7 +1,9 @@
-from sqlalchemy.orm import Session
-from models import User, SaasToken, Payment, SessionLocal
+from sqlalchemy.orm import Session, aliased
+from models import (User, SaasToken, Payment, CreditTransaction, GenerationJob, ContentCalendar, CalendarEntry,
+                    ImageAsset, ImageGenerationClaim, GeneratedSaas, MailingRun, EmailOutbox, Automation, AutomationRun,
+                    LeaderLease, SessionLocal, ScopedSession)
 from passlib.context import CryptContext
-from datetime import datetime
+from datetime import datetime, timedelta
 import secrets
 import string
 from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Text, Boolean
@@ -10,37 +12,173 @@ from sqlalchemy.orm import relationship
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 import json
-from sqlalchemy import func
+from sqlalchemy import func, case, tuple_
+from typing import Any, Tuple
+from sqlalchemy.exc import IntegrityError
+from blob_codec import compress_json, decompress_json
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
-class DatabaseService:
-    def __init__(self):
-        self.db = SessionLocal()
+# Types de transactions de jetons comptés comme gains
+EARNED_TOKEN_TYPES = ["earned", "daily_login", "referral_signup", "referral_first_purchase", "welcome_bonus"]
+
+SAAS_SUMMARY_LENGTH = 300  # Longueur du résumé stocké en clair pour les listes
 
-    def get_inactive_users(self, days: int = 2):
-        """Récupère les utilisateurs inactifs depuis X jours"""
-        from datetime import datetime, timedelta
+class DatabaseService:
+    def __init__(self, session: Session = None):
+        self.db = session or SessionLocal()
+
+    def get_inactive_users(self, days: int = 2, after: Tuple[datetime, int] = None, limit: int = None):
+        """
+        Utilisateurs inactifs depuis X jours, triés par (last_active_at, id).
+        after : clé (last_active_at, id) du dernier utilisateur du lot précédent.
+        """
         cutoff_date = datetime.utcnow() - timedelta(days=days)
 
-        # Simulation pour la démo
-        return []
+        # Un seul parcours de l'index ix_users_last_active_at_id, de la clé after jusqu'à cutoff
+        query = self.db.query(User).filter(
+            User.last_active_at < cutoff_date,
+            User.is_active == True
+        )
+        if after is not None:
+            query = query.filter(tuple_(User.last_active_at, User.id) > tuple_(*after))
+        query = query.order_by(User.last_active_at, User.id)
+        if limit:
+            query = query.limit(limit)
+        return query.all()
+
+    def update_users_last_active(self, last_seen: dict) -> int:
+        """Écrit en une fois les dernières activités {user_id: datetime}"""
+        if not last_seen:
+            return 0
+        self.db.bulk_update_mappings(User, [
+            {"id": user_id, "last_active_at": seen_at} for user_id, seen_at in last_seen.items()
+        ])
+        self.db.commit()
+        return len(last_seen)
 
     def get_all_active_users(self):
         """Récupère tous les utilisateurs actifs"""
         return self.db.query(User).filter(User.is_active == True).all()
 
-    def get_user_weekly_stats(self, user_id: int):
-        """Statistiques hebdomadaires d'un utilisateur"""
-        # Simulation pour la démo
+    def _weekly_stats_query(self, since: datetime, until: datetime, only_active: bool = False,
+                            id_range: Tuple[int, int] = None):
+        """
+        Statistiques de la période [since, until) des utilisateurs actifs en une requête :
+        chaque source est agrégée par utilisateur (sommes conditionnelles) puis jointe à users.
+        id_range = (après, jusqu'à) : bornes d'id poussées dans chaque agrégation, pour
+        qu'un lot ne lise que les lignes de ses propres utilisateurs.
+
+        text_generations est une approximation : récompenses 'first_generation' (une
+        par appel à /generate) plus jobs SaaS terminés. Les générations groupées et
+        marketing ne laissent pas de trace par élément et ne sont pas comptées.
+        """
+        tokens = self.db.query(
+            SaasToken.user_id.label("user_id"),
+            func.sum(case((SaasToken.transaction_type.in_(EARNED_TOKEN_TYPES), SaasToken.amount), else_=0)).label("tokens_earned"),
+            func.sum(case((SaasToken.transaction_type == "first_generation", 1), else_=0)).label("text_generations")
+        ).filter(
+            SaasToken.created_at >= since, SaasToken.created_at < until
+        )
+
+        # Statut testé dans les sommes : le filtre reste sur (user_id, created_at) et son index
+        completed = GenerationJob.status == "completed"
+        jobs = self.db.query(
+            GenerationJob.user_id.label("user_id"),
+            func.sum(case((completed & (GenerationJob.kind == "image"), 1), else_=0)).label("image_generations"),
+            func.sum(case((completed & (GenerationJob.kind != "image"), 1), else_=0)).label("text_generations")
+        ).filter(
+            GenerationJob.created_at >= since, GenerationJob.created_at < until
+        )
+
+        # La date du parrainage n'est pas stockée : filleuls inscrits pendant la période
+        referred = aliased(User)
+        referrals = self.db.query(
+            referred.referred_by.label("referral_code"),
+            func.count(referred.id).label("new_referrals")
+        ).filter(
+            referred.referred_by.isnot(None), referred.created_at >= since, referred.created_at < until
+        )
+
+        if id_range is not None:
+            after_id, last_id = id_range
+            tokens = tokens.filter(SaasToken.user_id > after_id, SaasToken.user_id <= last_id)
+            jobs = jobs.filter(GenerationJob.user_id > after_id, GenerationJob.user_id <= last_id)
+            referrers = self.db.query(User.referral_code).filter(User.id > after_id, User.id <= last_id)
+            referrals = referrals.filter(referred.referred_by.in_(referrers.scalar_subquery()))
+        tokens = tokens.group_by(SaasToken.user_id).subquery()
+        jobs = jobs.group_by(GenerationJob.user_id).subquery()
+        referrals = referrals.group_by(referred.referred_by).subquery()
+
+        text_generations = func.coalesce(tokens.c.text_generations, 0) + func.coalesce(jobs.c.text_generations, 0)
+        image_generations = func.coalesce(jobs.c.image_generations, 0)
+        query = self.db.query(
+            User.id,
+            User.email,
+            text_generations.label("text_generations"),
+            image_generations.label("image_generations"),
+            func.coalesce(tokens.c.tokens_earned, 0).label("tokens_earned"),
+            func.coalesce(referrals.c.new_referrals, 0).label("new_referrals")
+        ).outerjoin(
+            tokens, tokens.c.user_id == User.id
+        ).outerjoin(
+            jobs, jobs.c.user_id == User.id
+        ).outerjoin(
+            referrals, referrals.c.referral_code == User.referral_code
+        ).filter(User.is_active == True)
+        if id_range is not None:
+            query = query.filter(User.id > id_range[0], User.id <= id_range[1])
+        if only_active:
+            # Utilisateurs sans contenu sur la période exclus en SQL
+            query = query.filter(text_generations + image_generations > 0)
+        return query.order_by(User.id)
+
+    def _serialize_weekly_stats(self, row) -> dict:
         return {
-            "total_content": 5,
-            "text_generations": 3,
-            "image_generations": 2,
-            "tokens_earned": 15,
-            "new_referrals": 1
+            "id": row.id,
+            "email": row.email,
+            "stats": {
+                "total_content": row.text_generations + row.image_generations,
+                "text_generations": row.text_generations,
+                "image_generations": row.image_generations,
+                "tokens_earned": row.tokens_earned,
+                "new_referrals": row.new_referrals
+            }
         }
 
+    def iter_weekly_stats(self, since: datetime, until: datetime, after_id: int = 0, batch_size: int = 1000):
+        """Statistiques de tous les utilisateurs actifs, lues en flux (yield_per)"""
+        rows = self._weekly_stats_query(since, until).filter(User.id > after_id).yield_per(batch_size)
+        for row in rows:
+            yield self._serialize_weekly_stats(row)
+
+    def get_weekly_stats_chunk(self, since: datetime, until: datetime, after_id: int = 0, limit: int = 500,
+                               only_active: bool = False) -> list:
+        """
+        Lot de statistiques d'id > after_id (pagination par clé pour les envois groupés).
+        Les agrégations ne portent que sur la plage d'id des `limit` utilisateurs suivants ;
+        avec only_active, les plages sans contenu sont sautées jusqu'à un lot non vide.
+        """
+        while True:
+            ids = self.db.query(User.id).filter(
+                User.is_active == True, User.id > after_id
+            ).order_by(User.id).limit(limit).all()
+            if not ids:
+                return []
+            id_range = (after_id, ids[-1].id)
+            rows = self._weekly_stats_query(since, until, only_active, id_range).all()
+            if rows or not only_active:
+                return [self._serialize_weekly_stats(row) for row in rows]
+            after_id = id_range[1]
+
+    def get_user_weekly_stats(self, user_id: int):
+        """Statistiques des 7 derniers jours d'un utilisateur"""
+        until = datetime.utcnow()
+        row = self._weekly_stats_query(until - timedelta(days=7), until, id_range=(user_id - 1, user_id)).first()
+        if not row:
+            return {"total_content": 0, "text_generations": 0, "image_generations": 0, "tokens_earned": 0, "new_referrals": 0}
+        return self._serialize_weekly_stats(row)["stats"]
+
     def get_user_by_email(self, email: str) -> User:
         return self.db.query(User).filter(User.email == email).first()
 
@@ -85,21 +223,69 @@ class DatabaseService:
             return True
         return False
 
-    def add_credits(self, user_id: int, amount: int) -> bool:
-        user = self.get_user_by_id(user_id)
-        if user:
-            user.credits += amount
+    def add_credits(self, user_id: int, amount: int, commit: bool = True) -> bool:
+        """Crédite en une seule écriture (sûr face aux débits concurrents, ex. restitution d'un job)"""
+        updated = self.db.query(User).filter(User.id == user_id).update(
+            {User.credits: User.credits + amount}, synchronize_session="fetch"
+        )
+        if commit:
             self.db.commit()
-            return True
-        return False
+        else:
+            self.db.flush()
+        return updated == 1
 
     def spend_credits(self, user_id: int, amount: int) -> bool:
-        user = self.get_user_by_id(user_id)
-        if user and user.credits >= amount:
-            user.credits -= amount
-            self.db.commit()
-            return True
-        return False
+        """Débite en une seule écriture conditionnelle : jamais de solde négatif ni de mise à jour perdue"""
+        updated = self.db.query(User).filter(
+            User.id == user_id,
+            User.credits >= amount
+        ).update({User.credits: User.credits - amount}, synchronize_session="fetch")
+        self.db.commit()
+        return updated == 1
+
+    def reserve_credits(self, user_id: int, amount: int, transaction_type: str, description: str = "") -> int:
+        """Réserve des crédits en une seule écriture et ouvre l'entrée du registre"""
+        reserved = self.db.query(User).filter(
+            User.id == user_id,
+            User.credits >= amount
+        ).update({User.credits: User.credits - amount}, synchronize_session=False)
+
+        if reserved != 1:
+            self.db.rollback()
+            return None
+
+        transaction = CreditTransaction(
+            user_id=user_id,
+            amount=amount,
+            reserved=amount,
+            transaction_type=transaction_type,
+            status="reserved",
+            description=description
+        )
+        self.db.add(transaction)
+        self.db.commit()
+        return transaction.id
+
+    def settle_credit_reservation(self, transaction_id: int, charged: int) -> int:
+        """Fixe le montant réellement débité et restitue le reste. Retourne les crédits restitués."""
+        transaction = self.db.query(CreditTransaction).filter(
+            CreditTransaction.id == transaction_id,
+            CreditTransaction.status == "reserved"
+        ).first()
+        if not transaction:
+            return 0
+
+        refund = max(transaction.reserved - charged, 0)
+        if refund:
+            self.db.query(User).filter(User.id == transaction.user_id).update(
+                {User.credits: User.credits + refund}, synchronize_session=False
+            )
+
+        transaction.amount = transaction.reserved - refund
+        transaction.status = "settled"
+        transaction.settled_at = datetime.utcnow()
+        self.db.commit()
+        return refund
 
     def get_user_saas_tokens(self, user_id: int) -> dict:
         """Récupère le solde et l'historique des jetons SaaS"""
@@ -110,7 +296,7 @@ class DatabaseService:
         history = []
 
         for token in tokens:
-            if token.transaction_type in ["earned", "daily_login", "referral_signup", "referral_first_purchase", "welcome_bonus"]:
+            if token.transaction_type in EARNED_TOKEN_TYPES:
                 balance += token.amount
                 total_earned += token.amount
             elif token.transaction_type == "spent":
@@ -129,8 +315,9 @@ class DatabaseService:
             "history": sorted(history, key=lambda x: x["date"], reverse=True)
         }
 
-    def add_saas_tokens(self, user_id: int, amount: int, transaction_type: str, description: str = "") -> bool:
-        """Ajoute des jetons SaaS à un utilisateur"""
+    def add_saas_tokens(self, user_id: int, amount: int, transaction_type: str, description: str = "",
+                        commit: bool = True) -> bool:
+        """Ajoute des jetons SaaS à un utilisateur (commit=False : validé avec la transaction de l'appelant)"""
         token = SaasToken(
             user_id=user_id,
             amount=amount,
@@ -138,7 +325,8 @@ class DatabaseService:
             description=description
         )
         self.db.add(token)
-        self.db.commit()
+        if commit:
+            self.db.commit()
         return True
 
     def spend_saas_tokens(self, user_id: int, amount: int, description: str = "") -> bool:
@@ -171,8 +359,11 @@ class DatabaseService:
             "referred_users": [{"email": u.email, "created_at": u.created_at} for u in referred_users]
         }
 
-    def process_referral(self, referrer_user_id: int, referred_email: str) -> dict:
-        """Traite un nouveau parrainage"""
+    def process_referral(self, referrer_user_id: int, referred_email: str, commit: bool = True) -> dict:
+        """
+        Traite un nouveau parrainage : filleul marqué et parrain récompensé dans une
+        même transaction. commit=False : validée par l'appelant (ex. avec l'email de notification).
+        """
         referrer = self.get_user_by_id(referrer_user_id)
         referred = self.get_user_by_email(referred_email)
 
@@ -182,12 +373,13 @@ class DatabaseService:
         if referred.referred_by:
             return {"success": False, "error": "Cet utilisateur a déjà été parrainé"}
 
-        # Marquer l'utilisateur comme parrainé
+        # Marquer l'utilisateur comme parrainé et récompenser le parrain
         referred.referred_by = referrer.referral_code
-        self.db.commit()
-
-        # Récompenser le parrain
-        self.add_saas_tokens(referrer_user_id, 25, "referral_signup", f"Parrainage de {referred_email}")
+        self.add_saas_tokens(referrer_user_id, 25, "referral_signup", f"Parrainage de {referred_email}", commit=False)
+        if commit:
+            self.db.commit()
+        else:
+            self.db.flush()  # Le solde ci-dessous inclut la récompense
 
         return {
             "success": True,
@@ -241,8 +433,591 @@ class DatabaseService:
             return user.wallet_address
         return None
 
+    # === Jobs de génération asynchrones ===
+
+    def _serialize_generation_job(self, job: GenerationJob) -> dict:
+        return {
+            "job_id": job.id,
+            "user_id": job.user_id,
+            "kind": job.kind,
+            "status": job.status,
+            "current_stage": job.current_stage,
+            "payload": json.loads(job.payload or "{}"),
+            "results": json.loads(job.results or "{}"),
+            "error": job.error,
+            "attempts": job.attempts,
+            "created_at": job.created_at,
+            "updated_at": job.updated_at
+        }
+
+    def create_generation_job(self, job_id: str, user_id: int, kind: str, payload: dict) -> dict:
+        """Enregistre un nouveau job de génération en attente"""
+        job = GenerationJob(
+            id=job_id,
+            user_id=user_id,
+            kind=kind,
+            status="pending",
+            payload=json.dumps(payload),
+            results="{}"
+        )
+        self.db.add(job)
+        self.db.commit()
+        self.db.refresh(job)
+        return self._serialize_generation_job(job)
+
+    def get_generation_job(self, job_id: str) -> dict:
+        job = self.db.query(GenerationJob).filter(GenerationJob.id == job_id).first()
+        if not job:
+            return None
+        return self._serialize_generation_job(job)
+
+    def claim_generation_job(self, job_id: str, stale_after_seconds: int) -> bool:
+        """Passe un job en 'running' s'il est en attente ou abandonné par un worker"""
+        from datetime import timedelta
+        now = datetime.utcnow()
+        stale_cutoff = now - timedelta(seconds=stale_after_seconds)
+
+        claimed = self.db.query(GenerationJob).filter(
+            GenerationJob.id == job_id,
+            (GenerationJob.status == "pending") |
+            ((GenerationJob.status == "running") & (GenerationJob.updated_at < stale_cutoff))
+        ).update({
+            GenerationJob.status: "running",
+            GenerationJob.attempts: GenerationJob.attempts + 1,
+            GenerationJob.updated_at: now
+        }, synchronize_session=False)
+        self.db.commit()
+        return claimed == 1
+
+    def save_generation_job_stage(self, job_id: str, stage: str, value) -> bool:
+        """Persiste le résultat d'une étape terminée"""
+        job = self.db.query(GenerationJob).filter(GenerationJob.id == job_id).first()
+        if not job:
+            return False
+        results = json.loads(job.results or "{}")
+        results[stage] = value
+        results.pop("_partial", None)
+        job.results = json.dumps(results)
+        job.current_stage = stage
+        job.updated_at = datetime.utcnow()
+        self.db.commit()
+        return True
+
+    def save_generation_job_partial(self, job_id: str, stage: str, fields: dict) -> bool:
+        """Persiste les champs déjà reçus de l'étape en cours (lus par le polling / SSE)"""
+        job = self.db.query(GenerationJob).filter(GenerationJob.id == job_id).first()
+        if not job:
+            return False
+        results = json.loads(job.results or "{}")
+        results["_partial"] = {"stage": stage, "fields": fields}
+        job.results = json.dumps(results)
+        job.current_stage = stage
+        job.updated_at = datetime.utcnow()
+        self.db.commit()
+        return True
+
+    def update_generation_job_status(self, job_id: str, status: str, error: str = None) -> bool:
+        job = self.db.query(GenerationJob).filter(GenerationJob.id == job_id).first()
+        if not job:
+            return False
+        job.status = status
+        job.error = error
+        job.updated_at = datetime.utcnow()
+        self.db.commit()
+        return True
+
+    def get_resumable_generation_jobs(self, stale_after_seconds: int) -> list:
+        """Identifiants des jobs en attente ou abandonnés (crash du worker)"""
+        from datetime import timedelta
+        stale_cutoff = datetime.utcnow() - timedelta(seconds=stale_after_seconds)
+
+        rows = self.db.query(GenerationJob.id).filter(
+            (GenerationJob.status == "pending") |
+            ((GenerationJob.status == "running") & (GenerationJob.updated_at < stale_cutoff))
+        ).order_by(GenerationJob.created_at).all()
+        return [row.id for row in rows]
+
+    # === Calendriers de contenu ===
+
+    def _serialize_content_calendar(self, calendar: ContentCalendar) -> dict:
+        return {
+            "calendar_id": calendar.id,
+            "user_id": calendar.user_id,
+            "business_type": calendar.business_type,
+            "duration_days": calendar.duration_days,
+            "start_date": calendar.start_date.isoformat(),
+            "status": calendar.status,
+            "entries_count": calendar.entries_count,
+            "created_at": calendar.created_at.isoformat() if calendar.created_at else None
+        }
+
+    def create_content_calendar(self, user_id: int, business_type: str, duration_days: int, start_date) -> dict:
+        calendar = ContentCalendar(
+            user_id=user_id,
+            business_type=business_type,
+            duration_days=duration_days,
+            start_date=start_date,
+            status="generating"
+        )
+        self.db.add(calendar)
+        self.db.commit()
+        self.db.refresh(calendar)
+        return self._serialize_content_calendar(calendar)
+
+    def get_content_calendar(self, calendar_id: int, user_id: int) -> dict:
+        calendar = self.db.query(ContentCalendar).filter(
+            ContentCalendar.id == calendar_id,
+            ContentCalendar.user_id == user_id
+        ).first()
+        if not calendar:
+            return None
+        return self._serialize_content_calendar(calendar)
+
+    def add_calendar_entries(self, calendar_id: int, entries: list) -> int:
+        """Insère un lot d'entrées en une seule requête et met à jour le compteur"""
+        if not entries:
+            return 0
+        self.db.bulk_insert_mappings(CalendarEntry, [{**entry, "calendar_id": calendar_id} for entry in entries])
+        self.db.query(ContentCalendar).filter(ContentCalendar.id == calendar_id).update(
+            {ContentCalendar.entries_count: ContentCalendar.entries_count + len(entries)},
+            synchronize_session=False
+        )
+        self.db.commit()
+        return len(entries)
+
+    def complete_content_calendar(self, calendar_id: int) -> bool:
+        updated = self.db.query(ContentCalendar).filter(ContentCalendar.id == calendar_id).update(
+            {ContentCalendar.status: "completed"}, synchronize_session=False
+        )
+        self.db.commit()
+        return updated == 1
+
+    def get_calendar_entries(self, calendar_id: int, after_day: int = -1, limit: int = 50) -> list:
+        """Page d'entrées après un jour donné (pagination par clé, sans OFFSET)"""
+        rows = self.db.query(CalendarEntry).filter(
+            CalendarEntry.calendar_id == calendar_id,
+            CalendarEntry.day_index > after_day
+        ).order_by(CalendarEntry.day_index).limit(limit).all()
+        return [
+            {
+                "day_index": row.day_index,
+                "date": row.post_date.isoformat(),
+                "week": row.week_number,
+                "weekday": row.weekday,
+                "emoji": row.emoji,
+                "content": row.content
+            }
+            for row in rows
+        ]
+
+    # === SaaS générés ===
+
+    def create_generated_saas(self, user_id: int, name: str, data: dict, commit: bool = True) -> int:
+        """
+        Enregistre un SaaS généré : métadonnées en clair, contenu complet compressé.
+        commit=False : l'id est attribué (flush) mais la ligne n'est validée qu'avec
+        la transaction de l'appelant.
+        """
+        description = str(data.get("saas_idea", {}).get("description", ""))
+        blob, codec, raw_size = compress_json(data)
+        saas = GeneratedSaas(
+            user_id=user_id,
+            name=name,
+            description=description[:SAAS_SUMMARY_LENGTH],
+            payload=blob,
+            codec=codec,
+            payload_size=raw_size
+        )
+        self.db.add(saas)
+        if commit:
+            self.db.commit()
+        else:
+            self.db.flush()
+        return saas.id
+
+    def get_user_generated_saas(self, user_id: int, before: Tuple[datetime, int] = None, limit: int = 50) -> list:
+        """
+        Page des SaaS d'un utilisateur, du plus récent au plus ancien, sans lire ni
+        décompresser le contenu. before = (created_at, id) du dernier élément reçu.
+        """
+        query = self.db.query(
+            GeneratedSaas.id, GeneratedSaas.name, GeneratedSaas.description, GeneratedSaas.created_at
+        ).filter(GeneratedSaas.user_id == user_id)
+        if before is not None:
+            query = query.filter(tuple_(GeneratedSaas.created_at, GeneratedSaas.id) < tuple_(*before))
+        rows = query.order_by(GeneratedSaas.created_at.desc(), GeneratedSaas.id.desc()).limit(limit).all()
+        return [
+            {"id": row.id, "name": row.name, "description": row.description, "created_at": row.created_at}
+            for row in rows
+        ]
+
+    def count_user_generated_saas(self, user_id: int) -> int:
+        return self.db.query(func.count(GeneratedSaas.id)).filter(GeneratedSaas.user_id == user_id).scalar()
+
+    def get_generated_saas_by_id(self, saas_id: int, user_id: int) -> dict:
+        """Détail complet d'un SaaS de l'utilisateur (décompression à la demande)"""
+        saas = self.db.query(GeneratedSaas).filter(
+            GeneratedSaas.id == saas_id,
+            GeneratedSaas.user_id == user_id
+        ).first()
+        if not saas:
+            return None
+        return {
+            "id": saas.id,
+            "name": saas.name,
+            "created_at": saas.created_at,
+            **decompress_json(saas.payload, saas.codec)
+        }
+
+    # === Images générées ===
+
+    def _serialize_image_asset(self, asset: ImageAsset) -> dict:
+        return {
+            "asset_id": asset.id,
+            "prompt": asset.prompt,
+            "size": asset.size,
+            "quality": asset.quality,
+            "content_hash": asset.content_hash,
+            "thumbnail_hash": asset.thumbnail_hash,
+            "mime_type": asset.mime_type,
+            "byte_size": asset.byte_size,
+            "image_url": f"/media/{asset.content_hash}",
+            "thumbnail_url": f"/media/{asset.thumbnail_hash or asset.content_hash}"
+        }
+
+    def get_image_asset_by_prompt_hash(self, prompt_hash: str) -> dict:
+        asset = self.db.query(ImageAsset).filter(ImageAsset.prompt_hash == prompt_hash).first()
+        if not asset:
+            return None
+        return self._serialize_image_asset(asset)
+
+    def create_image_asset(self, prompt_hash: str, prompt: str, size: str, quality: str,
+                           content_hash: str, thumbnail_hash: str, mime_type: str, byte_size: int) -> dict:
+        """Enregistre une image stockée ; si le même prompt a été enregistré entre-temps, retourne l'existante"""
+        asset = ImageAsset(
+            prompt_hash=prompt_hash,
+            prompt=prompt,
+            size=size,
+            quality=quality,
+            content_hash=content_hash,
+            thumbnail_hash=thumbnail_hash,
+            mime_type=mime_type,
+            byte_size=byte_size
+        )
+        self.db.add(asset)
+        try:
+            self.db.commit()
+        except IntegrityError:
+            self.db.rollback()
+            return self.get_image_asset_by_prompt_hash(prompt_hash)
+        self.db.refresh(asset)
+        return self._serialize_image_asset(asset)
+
+    def claim_image_prompt(self, prompt_hash: str, job_id: str, stale_after_seconds: float) -> bool:
+        """Réserve la génération d'un prompt pour job_id, sauf si un autre job actif la détient déjà"""
+        now = datetime.utcnow()
+        updated = self.db.query(ImageGenerationClaim).filter(
+            ImageGenerationClaim.prompt_hash == prompt_hash,
+            (ImageGenerationClaim.job_id == job_id) |
+            (ImageGenerationClaim.claimed_at < now - timedelta(seconds=stale_after_seconds))
+        ).update({
+            ImageGenerationClaim.job_id: job_id,
+            ImageGenerationClaim.claimed_at: now
+        }, synchronize_session=False)
+        self.db.commit()
+        if updated:
+            return True
+
+        self.db.add(ImageGenerationClaim(prompt_hash=prompt_hash, job_id=job_id, claimed_at=now))
+        try:
+            self.db.commit()
+            return True
+        except IntegrityError:
+            # Prompt déjà en cours de génération par un autre job
+            self.db.rollback()
+            return False
+
+    def release_image_prompt(self, prompt_hash: str, job_id: str) -> bool:
+        """Libère la réservation (image stockée ou job en échec)"""
+        deleted = self.db.query(ImageGenerationClaim).filter(
+            ImageGenerationClaim.prompt_hash == prompt_hash,
+            ImageGenerationClaim.job_id == job_id
+        ).delete(synchronize_session=False)
+        self.db.commit()
+        return deleted > 0
+
+    def _serialize_mailing_run(self, run: MailingRun) -> dict:
+        return {
+            "id": run.id,
+            "job": run.job,
+            "run_key": run.run_key,
+            "status": run.status,
+            "cursor": json.loads(run.cursor) if run.cursor else None,
+            "sent": run.sent or 0,
+            "failed": run.failed or 0,
+            "skipped": run.skipped or 0,
+            "started_at": run.started_at,
+            "completed_at": run.completed_at
+        }
+
+    def get_or_create_mailing_run(self, job: str, run_key: str) -> dict:
+        """Envoi groupé (job, run_key) existant à reprendre, ou nouvel envoi"""
+        run = self.db.query(MailingRun).filter(MailingRun.job == job, MailingRun.run_key == run_key).first()
+        if run:
+            if run.status == "failed":
+                run.status = "running"
+                self.db.commit()
+            return self._serialize_mailing_run(run)
+        run = MailingRun(job=job, run_key=run_key, status="running")
+        self.db.add(run)
+        try:
+            self.db.commit()
+        except IntegrityError:
+            # Créé en parallèle par un autre processus
+            self.db.rollback()
+            run = self.db.query(MailingRun).filter(MailingRun.job == job, MailingRun.run_key == run_key).first()
+        self.db.refresh(run)
+        return self._serialize_mailing_run(run)
+
+    def checkpoint_mailing_run(self, run_id: int, cursor: Any, sent: int, failed: int, skipped: int) -> bool:
+        """Enregistre la progression d'un lot terminé (clé de reprise JSON, compteurs incrémentés)"""
+        updated = self.db.query(MailingRun).filter(MailingRun.id == run_id).update({
+            MailingRun.cursor: json.dumps(cursor),
+            MailingRun.sent: MailingRun.sent + sent,
+            MailingRun.failed: MailingRun.failed + failed,
+            MailingRun.skipped: MailingRun.skipped + skipped,
+            MailingRun.updated_at: datetime.utcnow()
+        }, synchronize_session=False)
+        self.db.commit()
+        return updated > 0
+
+    def finish_mailing_run(self, run_id: int, status: str = "completed") -> dict:
+        run = self.db.query(MailingRun).filter(MailingRun.id == run_id).first()
+        if not run:
+            return None
+        run.status = status
+        run.updated_at = datetime.utcnow()
+        if status == "completed":
+            run.completed_at = datetime.utcnow()
+        self.db.commit()
+        return self._serialize_mailing_run(run)
+
+    def queue_email(self, to_email: str, kind: str, params: dict = None, commit: bool = True) -> EmailOutbox:
+        """
+        Ajoute un email à l'outbox. Avec commit=False, la ligne est validée par
+        le prochain commit de la session, dans la même transaction que l'écriture métier.
+        """
+        email = EmailOutbox(to_email=to_email, kind=kind, params=json.dumps(params or {}), status="pending",
+                            next_attempt_at=datetime.utcnow())
+        self.db.add(email)
+        if commit:
+            self.db.commit()
+        return email
+
+    def claim_outbox_batch(self, limit: int, lease_seconds: int) -> list:
+        """
+        Réserve un lot d'emails à envoyer (en attente, ou dont le bail d'envoi a expiré).
+        Chaque email est pris par un UPDATE conditionnel : si un autre worker l'a
+        réservé entre la lecture et l'écriture, la condition ne correspond plus
+        (rowcount 0) et l'email est laissé à ce worker. FOR UPDATE SKIP LOCKED
+        évite en plus l'attente sur PostgreSQL ; il est ignoré par SQLite.
+        """
+        now = datetime.utcnow()
+        claimable = (
+            ((EmailOutbox.status == "pending") & (EmailOutbox.next_attempt_at <= now)) |
+            ((EmailOutbox.status == "sending") & (EmailOutbox.locked_until < now))
+        )
+        rows = self.db.query(
+            EmailOutbox.id, EmailOutbox.to_email, EmailOutbox.kind, EmailOutbox.params, EmailOutbox.attempts
+        ).filter(claimable).order_by(EmailOutbox.id).limit(limit).with_for_update(skip_locked=True).all()
+
+        claimed = []
+        for row in rows:
+            updated = self.db.query(EmailOutbox).filter(EmailOutbox.id == row.id, claimable).update({
+                EmailOutbox.status: "sending",
+                EmailOutbox.locked_until: now + timedelta(seconds=lease_seconds),
+                EmailOutbox.attempts: EmailOutbox.attempts + 1
+            }, synchronize_session=False)
+            if updated != 1:
+                continue
+            claimed.append({
+                "id": row.id,
+                "to_email": row.to_email,
+                "kind": row.kind,
+                "params": json.loads(row.params or "{}"),
+                "attempts": (row.attempts or 0) + 1
+            })
+        self.db.commit()
+        return claimed
+
+    def mark_outbox_sent(self, email_ids: list) -> int:
+        if not email_ids:
+            return 0
+        updated = self.db.query(EmailOutbox).filter(EmailOutbox.id.in_(email_ids)).update({
+            EmailOutbox.status: "sent",
+            EmailOutbox.sent_at: datetime.utcnow(),
+            EmailOutbox.locked_until: None,
+            EmailOutbox.last_error: None
+        }, synchronize_session=False)
+        self.db.commit()
+        return updated
+
+    def mark_outbox_failed(self, email_id: int, error: str, retry_at: datetime = None) -> bool:
+        """Replanifie un email en échec à retry_at, ou le passe en 'dead' si retry_at est None"""
+        updated = self.db.query(EmailOutbox).filter(EmailOutbox.id == email_id).update({
+            EmailOutbox.status: "pending" if retry_at else "dead",
+            EmailOutbox.next_attempt_at: retry_at,
+            EmailOutbox.locked_until: None,
+            EmailOutbox.last_error: (error or "")[:1000]
+        }, synchronize_session=False)
+        self.db.commit()
+        return updated > 0
+
+    def get_outbox_stats(self) -> dict:
+        rows = self.db.query(EmailOutbox.status, func.count(EmailOutbox.id)).group_by(EmailOutbox.status).all()
+        return {status: count for status, count in rows}
+
+    # === Automatisations ===
+
+    def _serialize_automation(self, automation: Automation) -> dict:
+        return {
+            "id": automation.id,
+            "user_id": automation.user_id,
+            "name": automation.name,
+            "config": json.loads(automation.config or "{}"),
+            "is_active": automation.is_active,
+            "next_run_at": automation.next_run_at,
+            "last_run_at": automation.last_run_at,
+            "run_count": automation.run_count or 0,
+            "created_at": automation.created_at,
+            "updated_at": automation.updated_at
+        }
+
+    def create_automation(self, automation_id: str, user_id: int, name: str, config: dict,
+                          trigger: dict = None, next_run_at: datetime = None) -> dict:
+        """Enregistre une automatisation ; next_run_at est None pour une automatisation manuelle"""
+        automation = Automation(
+            id=automation_id,
+            user_id=user_id,
+            name=name,
+            config=json.dumps(config),
+            trigger=json.dumps(trigger) if trigger else None,
+            is_active=True,
+            next_run_at=next_run_at
+        )
+        self.db.add(automation)
+        self.db.commit()
+        self.db.refresh(automation)
+        return self._serialize_automation(automation)
+
+    def get_automation(self, automation_id: str) -> dict:
+        automation = self.db.query(Automation).filter(Automation.id == automation_id).first()
+        if not automation:
+            return None
+        return self._serialize_automation(automation)
+
+    def get_user_automations(self, user_id: int) -> list:
+        automations = self.db.query(Automation).filter(
+            Automation.user_id == user_id
+        ).order_by(Automation.created_at.desc()).all()
+        return [self._serialize_automation(automation) for automation in automations]
+
+    def update_automation_last_run(self, automation_id: str, next_run_at: datetime = None) -> bool:
+        """Note une exécution ; next_run_at (exécution planifiée) remplace la prochaine échéance s'il est fourni"""
+        values = {
+            Automation.last_run_at: datetime.utcnow(),
+            Automation.run_count: func.coalesce(Automation.run_count, 0) + 1
+        }
+        if next_run_at is not None:
+            values[Automation.next_run_at] = next_run_at
+        updated = self.db.query(Automation).filter(Automation.id == automation_id).update(
+            values, synchronize_session=False)
+        self.db.commit()
+        return updated > 0
+
+    def iter_scheduled_automations(self, batch_size: int = 5000):
+        """(id, déclencheur JSON, next_run_at) des automatisations planifiées, par échéance croissante (index next_run_at)"""
+        rows = self.db.query(Automation.id, Automation.trigger, Automation.next_run_at).filter(
+            Automation.next_run_at != None
+        ).order_by(Automation.next_run_at).yield_per(batch_size)
+        for row in rows:
+            yield row.id, row.trigger, row.next_run_at
+
+    def iter_automations_updated_since(self, since: datetime):
+        """(id, déclencheur JSON, next_run_at) des automatisations créées ou modifiées depuis `since`"""
+        rows = self.db.query(Automation.id, Automation.trigger, Automation.next_run_at).filter(
+            Automation.updated_at >= since
+        ).order_by(Automation.updated_at)
+        for row in rows:
+            yield row.id, row.trigger, row.next_run_at
+
+    def create_automation_run(self, automation_id: str, source: str = "schedule") -> int:
+        run = AutomationRun(automation_id=automation_id, source=source, status="running")
+        self.db.add(run)
+        self.db.commit()
+        return run.id
+
+    def finish_automation_run(self, run_id: int, status: str, results: list = None, error: str = None) -> bool:
+        updated = self.db.query(AutomationRun).filter(AutomationRun.id == run_id).update({
+            AutomationRun.status: status,
+            AutomationRun.results: json.dumps(results or [], default=str),
+            AutomationRun.error: error,
+            AutomationRun.finished_at: datetime.utcnow()
+        }, synchronize_session=False)
+        self.db.commit()
+        return updated > 0
+
+    def get_automation_runs(self, automation_id: str, limit: int = 20) -> list:
+        runs = self.db.query(AutomationRun).filter(
+            AutomationRun.automation_id == automation_id
+        ).order_by(AutomationRun.started_at.desc(), AutomationRun.id.desc()).limit(limit).all()
+        return [{
+            "id": run.id,
+            "source": run.source,
+            "status": run.status,
+            "results": json.loads(run.results or "[]"),
+            "error": run.error,
+            "started_at": run.started_at,
+            "finished_at": run.finished_at
+        } for run in runs]
+
+    # === Élection du leader ===
+
+    def acquire_leader_lease(self, name: str, holder: str, lease_seconds: float) -> bool:
+        """Prend ou renouvelle le bail `name` s'il est libre, expiré ou déjà détenu par holder"""
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=lease_seconds)
+        updated = self.db.query(LeaderLease).filter(
+            LeaderLease.name == name,
+            (LeaderLease.holder == holder) | (LeaderLease.expires_at < now)
+        ).update({
+            LeaderLease.acquired_at: case((LeaderLease.holder == holder, LeaderLease.acquired_at), else_=now),
+            LeaderLease.holder: holder,
+            LeaderLease.expires_at: expires_at
+        }, synchronize_session=False)
+        self.db.commit()
+        if updated:
+            return True
+
+        self.db.add(LeaderLease(name=name, holder=holder, expires_at=expires_at, acquired_at=now))
+        try:
+            self.db.commit()
+            return True
+        except IntegrityError:
+            # Bail existant, détenu par un autre worker
+            self.db.rollback()
+            return False
+
+    def release_leader_lease(self, name: str, holder: str) -> bool:
+        """Libère le bail (expiré immédiatement) pour qu'un autre worker le reprenne sans attendre"""
+        updated = self.db.query(LeaderLease).filter(
+            LeaderLease.name == name, LeaderLease.holder == holder
+        ).update({LeaderLease.expires_at: datetime.utcnow() - timedelta(seconds=1)}, synchronize_session=False)
+        self.db.commit()
+        return updated > 0
+
     def close(self):
         self.db.close()
 
-# Instance globale
-db_service = DatabaseService()
\ No newline at end of file
+# Instance globale, partagée par les requêtes concurrentes via une session par requête
+db_service = DatabaseService(ScopedSession)
\ No newline at end of file
@@ -0,0 +1,135 @@
+import asyncio
+import random
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
+from config import settings
+from database import DatabaseService
+from email_service import email_service
+from logger import logger
+
+# Types d'emails acceptés dans l'outbox -> constructeur (sujet, html, texte)
+EMAIL_BUILDERS: Dict[str, Callable] = {
+    "welcome_email": email_service.build_welcome_email,
+    "token_reward": email_service.build_token_reward_notification,
+    "referral_success": email_service.build_referral_success,
+}
+
+class OutboxWorker:
+    """
+    Vide la table email_outbox par lots : réservation avec bail (un worker
+    arrêté en plein envoi libère ses emails à l'expiration du bail), envois
+    concurrents, nouvelles tentatives avec backoff exponentiel, puis statut
+    'dead' après max_attempts échecs.
+    """
+
+    def __init__(self, batch_size: int = None, poll_interval: float = None, max_attempts: int = None,
+                 backoff_base: float = None, backoff_max: float = None, lease_seconds: int = None,
+                 send: Callable = None, db_factory=DatabaseService):
+        self.batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+        self.poll_interval = poll_interval or settings.OUTBOX_POLL_INTERVAL
+        self.max_attempts = max_attempts or settings.OUTBOX_MAX_ATTEMPTS
+        self.backoff_base = backoff_base or settings.OUTBOX_BACKOFF_BASE
+        self.backoff_max = backoff_max or settings.OUTBOX_BACKOFF_MAX
+        self.lease_seconds = lease_seconds or settings.OUTBOX_LEASE_SECONDS
+        self.send = send or email_service.send_email_async
+        self.db_factory = db_factory
+        self._loop = None
+        self._wakeup = None
+        self._task = None
+        self.stats = {"sent": 0, "retried": 0, "dead": 0}
+
+    async def _with_db(self, fn, *args):
+        def call():
+            db = self.db_factory()
+            try:
+                return fn(db, *args)
+            finally:
+                db.close()
+        return await asyncio.to_thread(call)
+
+    def retry_at(self, attempts: int) -> Optional[datetime]:
+        """Date de la prochaine tentative, None si l'email doit passer en 'dead'"""
+        if attempts >= self.max_attempts:
+            return None
+        delay = min(self.backoff_max, self.backoff_base * (2 ** (attempts - 1)))
+        return datetime.utcnow() + timedelta(seconds=random.uniform(delay / 2, delay))
+
+    async def _deliver(self, email: Dict) -> Optional[str]:
+        """Envoie un email réservé ; retourne l'erreur en cas d'échec"""
+        builder = EMAIL_BUILDERS.get(email["kind"])
+        if builder is None:
+            return f"Type d'email inconnu: {email['kind']}"
+        try:
+            subject, html_body, text_body = builder(**email["params"])
+            result = await self.send(email["to_email"], subject, html_body, text_body)
+        except Exception as e:
+            return str(e)
+        return None if result.get("success") else result.get("error", "Échec d'envoi")
+
+    async def drain_once(self) -> int:
+        """Envoie un lot ; retourne le nombre d'emails traités"""
+        batch = await self._with_db(lambda db: db.claim_outbox_batch(self.batch_size, self.lease_seconds))
+        if not batch:
+            return 0
+
+        errors = await asyncio.gather(*(self._deliver(email) for email in batch))
+        sent_ids = [email["id"] for email, error in zip(batch, errors) if error is None]
+        await self._with_db(lambda db: db.mark_outbox_sent(sent_ids))
+        self.stats["sent"] += len(sent_ids)
+
+        for email, error in zip(batch, errors):
+            if error is None:
+                continue
+            retry_at = self.retry_at(email["attempts"])
+            await self._with_db(lambda db: db.mark_outbox_failed(email["id"], error, retry_at))
+            if retry_at:
+                self.stats["retried"] += 1
+                logger.warning(f"Email {email['kind']} #{email['id']} en échec (tentative {email['attempts']}): {error}")
+            else:
+                self.stats["dead"] += 1
+                logger.error(f"Email {email['kind']} #{email['id']} abandonné après {email['attempts']} tentatives: {error}")
+        return len(batch)
+
+    async def run_forever(self):
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        logger.info("Worker outbox email démarré")
+        while True:
+            try:
+                processed = await self.drain_once()
+            except Exception as e:
+                logger.error(f"Erreur worker outbox email: {e}")
+                processed = 0
+            if processed >= self.batch_size:
+                continue  # Lot plein : il reste probablement des emails
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def wake(self):
+        """Réveille le worker après un ajout à l'outbox (appelable depuis n'importe quel thread)"""
+        if self._loop is not None and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def start(self):
+        """Démarre le worker dans la boucle asyncio courante"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self.run_forever())
+        return self._task
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def snapshot(self) -> Dict:
+        return dict(self.stats)
+
+# Instance globale
+outbox_worker = OutboxWorker()
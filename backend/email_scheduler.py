@@ -1,51 +1,31 @@
+from scheduler import Daily, Weekly, scheduler
+from bulk_mailer import send_daily_reminders, send_weekly_reports
 
-import asyncio
-import schedule
-import time
-from datetime import datetime
-import threading
-from email_service import email_service, send_daily_reminders, send_weekly_reports
+DAILY_REMINDERS_JOB_ID = "email:daily_reminders"
+WEEKLY_REPORTS_JOB_ID = "email:weekly_reports"
 
 class EmailScheduler:
-    def __init__(self):
+    def __init__(self, scheduler=scheduler):
+        self.scheduler = scheduler
         self.running = False
-        
+
     def start_scheduler(self):
-        """Démarre le planificateur d'emails"""
+        """Programme les emails automatiques dans le planificateur asyncio"""
         self.running = True
-        
+
         # Planifier les emails quotidiens à 10h
-        schedule.every().day.at("10:00").do(self.run_daily_reminders)
-        
+        self.scheduler.add_job(DAILY_REMINDERS_JOB_ID, send_daily_reminders, Daily("10:00"))
+
         # Planifier les rapports hebdomadaires le lundi à 9h
-        schedule.every().monday.at("09:00").do(self.run_weekly_reports)
-        
-        # Démarrer le planificateur dans un thread séparé
-        scheduler_thread = threading.Thread(target=self._run_scheduler)
-        scheduler_thread.daemon = True
-        scheduler_thread.start()
-        
+        self.scheduler.add_job(WEEKLY_REPORTS_JOB_ID, send_weekly_reports, Weekly("monday", "09:00"))
+
         print("📧 Planificateur d'emails démarré !")
-    
-    def _run_scheduler(self):
-        """Exécute le planificateur en arrière-plan"""
-        while self.running:
-            schedule.run_pending()
-            time.sleep(60)  # Vérifier chaque minute
-    
-    def run_daily_reminders(self):
-        """Lance les rappels quotidiens"""
-        print("📧 Envoi des rappels quotidiens...")
-        asyncio.create_task(send_daily_reminders())
-    
-    def run_weekly_reports(self):
-        """Lance les rapports hebdomadaires"""
-        print("📊 Envoi des rapports hebdomadaires...")
-        asyncio.create_task(send_weekly_reports())
-    
+
     def stop_scheduler(self):
-        """Arrête le planificateur"""
+        """Retire les emails automatiques du planificateur"""
         self.running = False
+        self.scheduler.remove_job(DAILY_REMINDERS_JOB_ID)
+        self.scheduler.remove_job(WEEKLY_REPORTS_JOB_ID)
         print("📧 Planificateur d'emails arrêté.")
 
 # Instance globale
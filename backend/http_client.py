@@ -0,0 +1,176 @@
+import asyncio
+import random
+import uuid
+from dataclasses import dataclass
+from typing import Dict
+from urllib.parse import urlsplit
+import httpx
+from config import settings
+from logger import logger
+from resilience import is_retryable, retry_after_seconds
+
+# Méthodes retentées avec un en-tête Idempotency-Key stable
+NON_IDEMPOTENT_METHODS = {"POST", "PATCH"}
+
+class ResponseTooLarge(Exception):
+    """La réponse dépasse la taille maximale autorisée ; la lecture est interrompue"""
+    pass
+
+@dataclass
+class HTTPResponse:
+    status_code: int
+    headers: Dict[str, str]
+    content: bytes
+
+    @property
+    def text(self) -> str:
+        return self.content.decode("utf-8", errors="replace")
+
+class HTTPClient:
+    """
+    Client HTTP asynchrone partagé (webhooks des automatisations) :
+
+    - un seul httpx.AsyncClient : connexions gardées ouvertes (keep-alive) et
+      réutilisées par hôte, plus de DNS/TCP/TLS à chaque appel ;
+    - au plus per_host_concurrency requêtes simultanées par hôte, pour qu'un
+      endpoint lent n'accapare pas tout le pool ;
+    - délais de connexion et de lecture séparés, plus un délai global (retries
+      compris) ;
+    - retries avec backoff exponentiel et jitter sur les erreurs réseau, 429 et
+      5xx (Retry-After respecté) ;
+    - corps de réponse lu en flux et limité à max_response_bytes.
+    """
+
+    def __init__(self, connect_timeout: float = None, read_timeout: float = None, total_timeout: float = None,
+                 max_connections: int = None, max_keepalive: int = None, keepalive_expiry: float = None,
+                 per_host_concurrency: int = None, max_attempts: int = None, backoff_base: float = None,
+                 backoff_max: float = None, max_response_bytes: int = None, transport: httpx.AsyncBaseTransport = None):
+        self.connect_timeout = connect_timeout or settings.HTTP_CONNECT_TIMEOUT
+        self.read_timeout = read_timeout or settings.HTTP_READ_TIMEOUT
+        self.total_timeout = total_timeout or settings.HTTP_TOTAL_TIMEOUT
+        self.max_connections = max_connections or settings.HTTP_MAX_CONNECTIONS
+        self.max_keepalive = max_keepalive or settings.HTTP_MAX_KEEPALIVE_CONNECTIONS
+        self.keepalive_expiry = keepalive_expiry or settings.HTTP_KEEPALIVE_EXPIRY
+        self.per_host_concurrency = per_host_concurrency or settings.HTTP_PER_HOST_CONCURRENCY
+        self.max_attempts = max_attempts or settings.HTTP_MAX_ATTEMPTS
+        self.backoff_base = backoff_base if backoff_base is not None else settings.HTTP_BACKOFF_BASE
+        self.backoff_max = backoff_max if backoff_max is not None else settings.HTTP_BACKOFF_MAX
+        self.max_response_bytes = max_response_bytes or settings.HTTP_MAX_RESPONSE_BYTES
+        self.transport = transport
+        self._client = None
+        self._loop = None
+        self._host_slots: Dict[str, asyncio.Semaphore] = {}
+        self.stats = {"requests": 0, "retries": 0, "failures": 0, "too_large": 0, "clients": 0}
+
+    async def _get_client(self) -> httpx.AsyncClient:
+        # Le client et les sémaphores sont liés à la boucle asyncio qui les utilise
+        loop = asyncio.get_running_loop()
+        if self._client is not None and self._loop is not loop:
+            # Nouvelle boucle : l'ancien client est fermé pour libérer son pool de connexions
+            await self._close_client(self._client, self._loop)
+            self._client = None
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_keepalive,
+                                    keepalive_expiry=self.keepalive_expiry),
+                transport=self.transport,
+                follow_redirects=False
+            )
+            self._loop = loop
+            self._host_slots = {}
+            self.stats["clients"] += 1
+        return self._client
+
+    async def _close_client(self, client: httpx.AsyncClient, loop: asyncio.AbstractEventLoop):
+        if loop is not None and loop.is_running() and not loop.is_closed():
+            # Boucle encore active dans un autre thread : fermeture dans sa propre boucle
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+            return
+        try:
+            await client.aclose()
+        except RuntimeError as e:
+            # Boucle d'origine déjà fermée : ses transports ne peuvent plus être fermés
+            # proprement, les sockets sont libérés avec le client abandonné
+            logger.info(f"Ancien client HTTP abandonné ({e})")
+
+    def _host_slot(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc.lower()
+        slot = self._host_slots.get(host)
+        if slot is None:
+            slot = self._host_slots[host] = asyncio.Semaphore(self.per_host_concurrency)
+        return slot
+
+    def backoff_delay(self, attempt: int) -> float:
+        """Backoff exponentiel avec 'full jitter'"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** (attempt - 1))))
+
+    async def request(self, method: str, url: str, *, json=None, params: Dict = None, headers: Dict = None,
+                      max_response_bytes: int = None) -> HTTPResponse:
+        """
+        Envoie la requête avec retries. Les réponses 4xx définitives sont
+        renvoyées telles quelles ; lève l'erreur de la dernière tentative si
+        toutes échouent, asyncio.TimeoutError si le délai global est dépassé.
+        Les POST/PATCH reçoivent un en-tête Idempotency-Key (sauf s'il est fourni).
+        """
+        self.stats["requests"] += 1
+        headers = dict(headers or {})
+        if method.upper() in NON_IDEMPOTENT_METHODS and not any(k.lower() == "idempotency-key" for k in headers):
+            # Même clé pour toutes les tentatives : le destinataire peut ignorer les doublons
+            headers["Idempotency-Key"] = uuid.uuid4().hex
+        try:
+            async with asyncio.timeout(self.total_timeout):
+                return await self._request_with_retries(method.upper(), url, json, params, headers,
+                                                        max_response_bytes or self.max_response_bytes)
+        except Exception:
+            self.stats["failures"] += 1
+            raise
+
+    async def _request_with_retries(self, method, url, json, params, headers, max_bytes) -> HTTPResponse:
+        client = await self._get_client()
+        slot = self._host_slot(url)
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                async with slot:
+                    response = await self._send(client, method, url, json, params, headers, max_bytes)
+                if response.status_code >= 500 or response.status_code == 429:
+                    raise httpx.HTTPStatusError(f"HTTP {response.status_code}", request=None, response=response)
+                return response
+            except httpx.HTTPError as e:
+                retryable = isinstance(e, httpx.TransportError) or is_retryable(e)
+                if not retryable or attempt == self.max_attempts:
+                    if isinstance(e, httpx.HTTPStatusError):
+                        return e.response  # Dernière réponse 5xx/429 : l'appelant décide
+                    raise
+                delay = retry_after_seconds(e)
+                delay = min(delay, self.backoff_max) if delay is not None else self.backoff_delay(attempt)
+                self.stats["retries"] += 1
+                logger.warning(f"Requête {method} {url} en échec ({e}), nouvel essai dans {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def _send(self, client, method, url, json, params, headers, max_bytes) -> HTTPResponse:
+        async with client.stream(method, url, json=json, params=params, headers=headers) as response:
+            declared = response.headers.get("content-length")
+            if declared and declared.isdigit() and int(declared) > max_bytes:
+                self.stats["too_large"] += 1
+                raise ResponseTooLarge(f"Réponse de {declared} octets (max {max_bytes})")
+            body = bytearray()
+            async for chunk in response.aiter_bytes():
+                body.extend(chunk)
+                if len(body) > max_bytes:
+                    self.stats["too_large"] += 1
+                    raise ResponseTooLarge(f"Réponse supérieure à {max_bytes} octets")
+            return HTTPResponse(response.status_code, dict(response.headers), bytes(body))
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._loop = None
+
+    def snapshot(self) -> Dict:
+        return {**self.stats, "hosts": len(self._host_slots)}
+
+# Instance globale : un pool de connexions partagé par toutes les automatisations
+http_client = HTTPClient()
@@ -0,0 +1,91 @@
+import re
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, List, Set
+
+# {{ variable }} : identifiant simple, espaces tolérés
+PLACEHOLDER = re.compile(r"\{\{\s*([A-Za-z_][A-Za-z0-9_]*)\s*\}\}")
+# Accolades restantes : placeholder mal formé ({{ a.b }}, {{ }}, ...)
+MALFORMED = re.compile(r"\{\{.*?\}\}")
+
+class TemplateError(ValueError):
+    """Variable inconnue, manquante ou placeholder invalide"""
+    pass
+
+class CompiledTemplate:
+    """
+    Config (dict, liste ou texte) compilée une fois en fonction de rendu :
+    les chaînes sans placeholder sont conservées telles quelles, les autres
+    sont découpées en segments fixes et variables. Le rendu ne fait plus que
+    des recherches dans le contexte et des concaténations. Une chaîne réduite à
+    un seul placeholder ("{{data}}") reçoit la valeur telle quelle (dict,
+    nombre...).
+    """
+
+    def __init__(self, source: Any):
+        self.source = source
+        self.variables: Set[str] = set()
+        self._render = self._compile(source)
+
+    def _compile(self, value: Any) -> Callable[[Dict], Any]:
+        if isinstance(value, str):
+            return self._compile_text(value)
+        if isinstance(value, dict):
+            items = [(key, self._compile(item)) for key, item in value.items()]
+            return lambda context: {key: render(context) for key, render in items}
+        if isinstance(value, list):
+            items = [self._compile(item) for item in value]
+            return lambda context: [render(context) for render in items]
+        return lambda context: value
+
+    def _compile_text(self, text: str) -> Callable[[Dict], Any]:
+        if "{{" not in text:
+            return lambda context: text
+        pieces = PLACEHOLDER.split(text)  # [fixe, variable, fixe, variable, ..., fixe]
+        for fixed in pieces[::2]:
+            malformed = MALFORMED.search(fixed)
+            if malformed:
+                raise TemplateError(f"Placeholder invalide: {malformed.group(0)}")
+        names = pieces[1::2]
+        self.variables.update(names)
+
+        if len(names) == 1 and pieces[0] == "" and pieces[2] == "":
+            name = names[0]
+            return lambda context: _lookup(context, name)
+
+        def render(context: Dict) -> str:
+            parts = list(pieces)
+            for index in range(1, len(parts), 2):
+                value = _lookup(context, parts[index])
+                parts[index] = value if isinstance(value, str) else str(value)
+            return "".join(parts)
+        return render
+
+    def validate(self, allowed: Iterable[str]):
+        """Rejette dès la compilation les variables absentes de allowed"""
+        unknown = self.variables.difference(allowed)
+        if unknown:
+            raise TemplateError(f"Variables inconnues: {', '.join(sorted(unknown))}")
+
+    def render(self, context: Dict) -> Any:
+        return self._render(context)
+
+def _lookup(context: Dict, name: str) -> Any:
+    try:
+        return context[name]
+    except KeyError:
+        raise TemplateError(f"Variable manquante: {name}") from None
+
+def compile_template(source: Any, allowed: Iterable[str] = None) -> CompiledTemplate:
+    """Compile source et valide ses variables si allowed est fourni"""
+    template = CompiledTemplate(source)
+    if allowed is not None:
+        template.validate(allowed)
+    return template
+
+@lru_cache(maxsize=1024)
+def compile_text(text: str) -> CompiledTemplate:
+    """Texte compilé et mémoïsé, réservé aux templates fixes du serveur (jamais à un texte utilisateur)"""
+    return CompiledTemplate(text)
+
+def template_variables(source: Any) -> List[str]:
+    return sorted(CompiledTemplate(source).variables)
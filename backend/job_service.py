@@ -0,0 +1,296 @@
+import uuid
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+from logger import logger
+from config import settings
+from database import DatabaseService
+
+# Une étape reçoit (db, job) et retourne un résultat sérialisable en JSON
+Stage = Tuple[str, Callable]
+
+class JobStageError(Exception):
+    """Erreur fatale d'une étape : le job passe en 'failed'"""
+    pass
+
+class JobService:
+    def __init__(self, max_workers: int = None, stale_after_seconds: int = None,
+                 db_factory: Callable[[], DatabaseService] = DatabaseService):
+        self.max_workers = max_workers or settings.JOB_WORKERS
+        self.stale_after_seconds = stale_after_seconds or settings.JOB_STALE_SECONDS
+        self.db_factory = db_factory
+        self.pipelines: Dict[str, dict] = {}
+        self.executor = None
+        self._lock = threading.Lock()
+        self._queued = set()  # Jobs planifiés sur ce pool et pas encore démarrés
+
+    def register_pipeline(self, kind: str, stages: List[Stage], on_failure: Callable = None):
+        """Déclare les étapes ordonnées d'un type de job"""
+        self.pipelines[kind] = {"stages": stages, "on_failure": on_failure}
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="job-worker"
+                )
+            return self.executor
+
+    def submit(self, user_id: int, kind: str, payload: Dict) -> Dict:
+        """Crée un job et le planifie sur le pool de workers"""
+        if kind not in self.pipelines:
+            raise ValueError(f"Type de job inconnu: {kind}")
+
+        job_id = uuid.uuid4().hex
+        db = self.db_factory()
+        try:
+            job = db.create_generation_job(job_id, user_id, kind, payload)
+        finally:
+            db.close()
+
+        self._schedule(job_id)
+        logger.info(f"Job {kind} {job_id} planifié")
+        return self.public_view(job)
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        db = self.db_factory()
+        try:
+            return db.get_generation_job(job_id)
+        finally:
+            db.close()
+
+    def _schedule(self, job_id: str) -> bool:
+        with self._lock:
+            if job_id in self._queued:
+                return False
+            self._queued.add(job_id)
+        self._get_executor().submit(self.run_job, job_id)
+        return True
+
+    def resume_interrupted_jobs(self) -> int:
+        """
+        Relance les jobs en attente ou abandonnés (worker tombé) : au démarrage puis
+        périodiquement. Un job déjà dans la file de ce pool n'est pas replanifié.
+        """
+        db = self.db_factory()
+        try:
+            job_ids = db.get_resumable_generation_jobs(self.stale_after_seconds)
+        finally:
+            db.close()
+
+        job_ids = [job_id for job_id in job_ids if self._schedule(job_id)]
+
+        if job_ids:
+            logger.info(f"🔁 {len(job_ids)} jobs de génération repris")
+        return len(job_ids)
+
+    def run_job(self, job_id: str):
+        """Exécute les étapes restantes d'un job, à partir de la dernière terminée"""
+        with self._lock:
+            self._queued.discard(job_id)
+        db = self.db_factory()
+        try:
+            if not db.claim_generation_job(job_id, self.stale_after_seconds):
+                return  # Déjà pris en charge par un autre worker
+
+            job = db.get_generation_job(job_id)
+            pipeline = self.pipelines.get(job["kind"])
+            if pipeline is None:
+                db.update_generation_job_status(job_id, "failed", f"Type de job inconnu: {job['kind']}")
+                return
+
+            for stage_name, stage_fn in pipeline["stages"]:
+                if stage_name in job["results"]:
+                    continue  # Étape déjà persistée lors d'une exécution précédente
+
+                value = stage_fn(db, job)
+                db.save_generation_job_stage(job_id, stage_name, value)
+                job["results"][stage_name] = value
+
+            db.update_generation_job_status(job_id, "completed")
+            logger.info(f"Job {job['kind']} {job_id} terminé")
+
+        except Exception as e:
+            logger.error(f"Erreur job {job_id}: {e}")
+            db.db.rollback()
+            db.update_generation_job_status(job_id, "failed", str(e))
+            job = db.get_generation_job(job_id)
+            pipeline = self.pipelines.get(job["kind"]) if job else None
+            if pipeline and pipeline["on_failure"]:
+                try:
+                    pipeline["on_failure"](db, job)
+                except Exception as hook_error:
+                    logger.error(f"Erreur compensation job {job_id}: {hook_error}")
+        finally:
+            db.close()
+
+    def public_view(self, job: Dict) -> Dict:
+        """Représentation d'un job renvoyée aux clients"""
+        pipeline = self.pipelines.get(job["kind"], {"stages": []})
+        stage_names = [name for name, _ in pipeline["stages"]]
+        completed = [name for name in stage_names if name in job["results"]]
+        results = {name: value for name, value in job["results"].items() if name != "_partial"}
+
+        return {
+            "job_id": job["job_id"],
+            "kind": job["kind"],
+            "status": job["status"],
+            "current_stage": job["current_stage"],
+            "stages": stage_names,
+            "stages_completed": completed,
+            "progress": round(len(completed) / len(stage_names), 2) if stage_names else 0,
+            "results": results,
+            "partial": job["results"].get("_partial"),
+            "error": job["error"],
+            "created_at": job["created_at"].isoformat() if job["created_at"] else None,
+            "updated_at": job["updated_at"].isoformat() if job["updated_at"] else None
+        }
+
+    def shutdown(self):
+        with self._lock:
+            if self.executor is not None:
+                self.executor.shutdown(wait=False)
+                self.executor = None
+
+# === Pipeline de génération d'idée SaaS ===
+
+SAAS_GENERATION_COST = 15
+SAAS_GENERATION_REWARD = 50
+
+def _partial_saver(db: DatabaseService, job: Dict, stage: str):
+    """Rappel qui publie les champs JSON reçus au fil du flux de l'étape"""
+    def save(name, value, fields):
+        db.save_generation_job_partial(job["job_id"], stage, fields)
+    return save
+
+def _stage_saas_idea(db: DatabaseService, job: Dict):
+    from ai_service import ai_service
+    payload = job["payload"]
+    result = ai_service.generate_saas_idea(
+        payload["prompt"], payload.get("target_audience", ""), payload.get("tech_stack", ""),
+        plan=payload.get("plan", "free"), on_partial=_partial_saver(db, job, "saas_idea")
+    )
+    if not result["success"]:
+        raise JobStageError(result["error"])
+    return result["saas_idea"]
+
+def _stage_code_structure(db: DatabaseService, job: Dict):
+    from ai_service import ai_service
+    result = ai_service.generate_code_structure(
+        job["results"]["saas_idea"], plan=job["payload"].get("plan", "free"),
+        on_partial=_partial_saver(db, job, "code_structure")
+    )
+    return result.get("code_structure", {})
+
+def _stage_marketing_strategy(db: DatabaseService, job: Dict):
+    from ai_service import ai_service
+    result = ai_service.generate_marketing_strategy(
+        job["results"]["saas_idea"], plan=job["payload"].get("plan", "free"),
+        on_partial=_partial_saver(db, job, "marketing_strategy")
+    )
+    return result.get("marketing_strategy", {})
+
+def _stage_save(db: DatabaseService, job: Dict):
+    """
+    Rien n'est validé ici : le SaaS, la récompense et le résultat de l'étape
+    sont commités ensemble par save_generation_job_stage. Un crash avant ce
+    commit ne laisse rien en base et l'étape rejouée ne crée pas de doublon.
+    """
+    results = job["results"]
+    saas_id = db.create_generated_saas(
+        job["user_id"],
+        results["saas_idea"].get("name", "SaaS sans nom"),
+        {
+            "saas_idea": results["saas_idea"],
+            "code_structure": results["code_structure"],
+            "marketing_strategy": results["marketing_strategy"]
+        },
+        commit=False
+    )
+    db.add_saas_tokens(job["user_id"], SAAS_GENERATION_REWARD, "saas_generation", "Génération d'idée SaaS complète",
+                       commit=False)
+    return {"saas_id": saas_id}
+
+def _refund_saas_generation(db: DatabaseService, job: Dict):
+    """Les crédits sont débités à la soumission : on les restitue en cas d'échec"""
+    db.add_credits(job["user_id"], SAAS_GENERATION_COST)
+
+# === Pipeline de génération d'images ===
+
+IMAGE_GENERATION_COST = 3
+IMAGE_CLAIM_POLL_SECONDS = 1.0
+
+def _image_prompt_hash(payload: Dict) -> str:
+    from media_store import normalize_prompt_hash
+    return normalize_prompt_hash(payload["prompt"], payload["size"], payload["quality"])
+
+def _stage_image(db: DatabaseService, job: Dict):
+    """
+    Réutilise l'image d'un prompt identique, sinon la fait générer. Le prompt est
+    réservé avant l'appel à l'API : un job concurrent sur le même prompt attend
+    l'image du premier (ou reprend la réservation s'il échoue ou l'abandonne).
+    Une image réutilisée n'est pas facturée : la restitution est commitée avec
+    le résultat de l'étape.
+    """
+    from openai_client import generate_image
+    payload = job["payload"]
+    prompt_hash = _image_prompt_hash(payload)
+
+    while True:
+        asset = db.get_image_asset_by_prompt_hash(prompt_hash)
+        if asset:
+            db.add_credits(job["user_id"], IMAGE_GENERATION_COST, commit=False)
+            return {"prompt_hash": prompt_hash, "reused": True, "asset": asset}
+        if db.claim_image_prompt(prompt_hash, job["job_id"], settings.JOB_STALE_SECONDS):
+            break
+        time.sleep(IMAGE_CLAIM_POLL_SECONDS)
+
+    result = generate_image(payload["prompt"], payload["size"], payload["quality"])
+    if not result["success"]:
+        raise JobStageError(result["error"])
+    return {"prompt_hash": prompt_hash, "reused": False, "source_url": result["image_url"]}
+
+def _stage_store_image(db: DatabaseService, job: Dict):
+    """Télécharge l'image dans le stockage local et crée sa miniature"""
+    from media_store import media_store, guess_mime_type
+    generated = job["results"]["image"]
+    if generated["reused"]:
+        return generated["asset"]
+
+    payload = job["payload"]
+    content_hash, data = media_store.download(generated["source_url"])
+    asset = db.create_image_asset(
+        generated["prompt_hash"], payload["prompt"], payload["size"], payload["quality"],
+        content_hash, media_store.make_thumbnail(data), guess_mime_type(data[:16]), len(data)
+    )
+    db.release_image_prompt(generated["prompt_hash"], job["job_id"])
+    return asset
+
+def _refund_image_generation(db: DatabaseService, job: Dict):
+    if job["results"].get("image", {}).get("reused"):
+        return  # Déjà restitués à la réutilisation
+    db.release_image_prompt(_image_prompt_hash(job["payload"]), job["job_id"])
+    db.add_credits(job["user_id"], IMAGE_GENERATION_COST)
+
+# Instance globale
+job_service = JobService()
+job_service.register_pipeline(
+    "saas_idea",
+    [
+        ("saas_idea", _stage_saas_idea),
+        ("code_structure", _stage_code_structure),
+        ("marketing_strategy", _stage_marketing_strategy),
+        ("save", _stage_save)
+    ],
+    on_failure=_refund_saas_generation
+)
+job_service.register_pipeline(
+    "image",
+    [
+        ("image", _stage_image),
+        ("store", _stage_store_image)
+    ],
+    on_failure=_refund_image_generation
+)
@@ -0,0 +1,182 @@
+import json
+from typing import Dict, List, Tuple
+
+# Schémas des objets JSON attendus par tâche : champ -> types acceptés
+TEXT = (str, int, float)
+TASK_SCHEMAS = {
+    "saas_idea": {
+        "name": (str,),
+        "description": (str,),
+        "features": (list,),
+        "tech_stack": (str, list, dict),
+        "monetization": (str, list, dict),
+        "target_market": (str, list),
+        "mvp_timeline": TEXT,
+        "estimated_cost": TEXT
+    },
+    "code_structure": {
+        "file_structure": (str, list, dict),
+        "main_files": (str, list, dict),
+        "database_schema": (str, list, dict),
+        "api_endpoints": (list, dict, str),
+        "frontend_components": (list, dict, str),
+        "deployment_config": (str, list, dict)
+    },
+    "marketing_strategy": {
+        "positioning": (str, dict),
+        "target_personas": (list, dict, str),
+        "channels": (list, dict, str),
+        "content_strategy": (str, list, dict),
+        "pricing_strategy": (str, list, dict),
+        "launch_plan": (str, list, dict),
+        "kpis": (list, dict, str)
+    }
+}
+
+# Champs indispensables par tâche ; les autres peuvent manquer sans faire échouer la génération
+TASK_REQUIRED_FIELDS = {
+    "saas_idea": ("description",),
+    "code_structure": ("file_structure", "main_files"),
+    "marketing_strategy": ("positioning", "channels")
+}
+
+class StreamingJSONError(ValueError):
+    """Flux qui n'est pas un objet JSON valide ou qui ne respecte pas le schéma"""
+    pass
+
+class IncrementalJSONParser:
+    """
+    Analyse un objet JSON au fil des tokens et retourne chaque champ de premier
+    niveau dès que sa valeur est complète. Le texte avant la première accolade
+    (ex. une clôture ```json) est ignoré.
+    """
+
+    def __init__(self, schema: Dict[str, Tuple[type, ...]] = None, required: Tuple[str, ...] = None):
+        self.schema = schema or {}
+        self.required = tuple(self.schema) if required is None else required
+        self.buffer = ""
+        self.position = 0
+        self.state = "before_object"
+        self.fields: Dict = {}
+        self.closed = False
+        self._key = None
+        self._start = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    @property
+    def missing_fields(self) -> List[str]:
+        """Champs indispensables pas encore reçus"""
+        return [name for name in self.required if name not in self.fields]
+
+    @property
+    def schema_complete(self) -> bool:
+        """Vrai dès que tous les champs du schéma sont complets (inutile d'attendre la suite)"""
+        return bool(self.schema) and all(name in self.fields for name in self.schema)
+
+    def feed(self, chunk: str) -> List[Tuple[str, object]]:
+        """Ajoute un morceau du flux et retourne les champs devenus complets"""
+        self.buffer += chunk
+        completed = []
+        while self.position < len(self.buffer) and not self.closed:
+            char = self.buffer[self.position]
+            field = self._step(char)
+            if field is not None:
+                completed.append(field)
+            self.position += 1
+        return completed
+
+    def _step(self, char: str):
+        state = self.state
+
+        if state == "before_object":
+            if char == "{":
+                self.state = "expect_key"
+            return None
+
+        if state == "expect_key":
+            if char == '"':
+                self.state, self._start, self._escape = "key", self.position, False
+            elif char == "}":
+                self.closed = True
+            elif not (char.isspace() or char == ","):
+                raise StreamingJSONError(f"Clé attendue, caractère inattendu: {char!r}")
+            return None
+
+        if state == "key":
+            if self._escape:
+                self._escape = False
+            elif char == "\\":
+                self._escape = True
+            elif char == '"':
+                self._key = json.loads(self.buffer[self._start:self.position + 1])
+                self.state = "expect_colon"
+            return None
+
+        if state == "expect_colon":
+            if char == ":":
+                self.state = "expect_value"
+            elif not char.isspace():
+                raise StreamingJSONError(f"':' attendu après la clé {self._key!r}")
+            return None
+
+        if state == "expect_value":
+            if char.isspace():
+                return None
+            self.state, self._start, self._depth = "value", self.position, 0
+            self._in_string, self._escape = False, False
+            # Le premier caractère de la valeur est traité ci-dessous
+
+        if state == "after_value":
+            if char == ",":
+                self.state = "expect_key"
+            elif char == "}":
+                self.closed = True
+            elif not char.isspace():
+                raise StreamingJSONError(f"',' ou '}}' attendu, caractère inattendu: {char!r}")
+            return None
+
+        # state == "value"
+        if self._in_string:
+            if self._escape:
+                self._escape = False
+            elif char == "\\":
+                self._escape = True
+            elif char == '"':
+                self._in_string = False
+                if self._depth == 0:
+                    return self._complete_value(self.position + 1, "after_value")
+            return None
+
+        if char == '"':
+            self._in_string = True
+        elif char in "{[":
+            self._depth += 1
+        elif char in "}]":
+            if self._depth == 0:
+                # Fin de l'objet racine après une valeur scalaire
+                field = self._complete_value(self.position, "expect_key")
+                self.closed = True
+                return field
+            self._depth -= 1
+            if self._depth == 0:
+                return self._complete_value(self.position + 1, "after_value")
+        elif char == "," and self._depth == 0:
+            return self._complete_value(self.position, "expect_key")
+        return None
+
+    def _complete_value(self, end: int, next_state: str):
+        raw = self.buffer[self._start:end].strip()
+        try:
+            value = json.loads(raw)
+        except json.JSONDecodeError as e:
+            raise StreamingJSONError(f"Valeur invalide pour {self._key!r}: {e}")
+
+        expected = self.schema.get(self._key)
+        if expected and not isinstance(value, expected):
+            raise StreamingJSONError(f"Type invalide pour {self._key!r}: {type(value).__name__}")
+
+        self.state = next_state
+        self.fields[self._key] = value
+        return self._key, value
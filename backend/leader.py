@@ -0,0 +1,156 @@
+import asyncio
+import hashlib
+import os
+import socket
+import uuid
+from typing import Awaitable, Callable, Dict
+from sqlalchemy import text
+from config import settings
+from database import DatabaseService
+from logger import logger
+from models import engine
+
+class LeaderElection:
+    """
+    Élection d'un leader entre workers (plusieurs processus uvicorn, voire
+    plusieurs hôtes) sans coordinateur externe :
+
+    - advisory : verrou consultatif PostgreSQL tenu par une connexion dédiée,
+      libéré par le serveur dès que le processus leader meurt ;
+    - lease : bail en base (table leader_leases) renouvelé toutes les
+      renew_interval secondes ; s'il n'est plus renouvelé, un autre worker le
+      reprend à son expiration (lease_seconds).
+
+    Les autres workers retentent à chaque intervalle. Un leader qui ne peut
+    plus confirmer son verrou ou son bail se retire.
+    """
+
+    def __init__(self, name: str = "scheduler", backend: str = None, lease_seconds: float = None,
+                 renew_interval: float = None, holder: str = None, engine=engine, db_factory=DatabaseService):
+        self.name = name
+        backend = backend or settings.LEADER_BACKEND
+        if backend == "auto":
+            backend = "advisory" if engine.dialect.name == "postgresql" else "lease"
+        self.backend = backend
+        self.lease_seconds = lease_seconds or settings.LEADER_LEASE_SECONDS
+        self.renew_interval = renew_interval or settings.LEADER_RENEW_SECONDS
+        self.holder = holder or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.engine = engine
+        self.db_factory = db_factory
+        # Clé 64 bits stable dérivée du nom (pg_try_advisory_lock(bigint))
+        self.lock_key = int.from_bytes(hashlib.sha256(name.encode()).digest()[:8], "big", signed=True)
+        self.is_leader = False
+        self._connection = None
+        self._task = None
+        self._on_revoked = None
+        self.stats = {"elections": 0, "revocations": 0}
+
+    def try_acquire(self) -> bool:
+        """Prend ou confirme le leadership (appel bloquant) ; False si la base est injoignable"""
+        try:
+            if self.backend == "advisory":
+                return self._try_advisory_lock()
+            return self._try_lease()
+        except Exception as e:
+            logger.error(f"Erreur élection du leader {self.name}: {e}")
+            self._close_connection()
+            return False
+
+    def _try_lease(self) -> bool:
+        db = self.db_factory()
+        try:
+            return db.acquire_leader_lease(self.name, self.holder, self.lease_seconds)
+        finally:
+            db.close()
+
+    def _try_advisory_lock(self) -> bool:
+        if self._connection is not None:
+            # Verrou tenu tant que la connexion est vivante
+            self._connection.execute(text("SELECT 1"))
+            return True
+        # Autocommit : pas de transaction ouverte pendant toute la durée du leadership
+        connection = self.engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+        try:
+            acquired = connection.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": self.lock_key}).scalar()
+        except Exception:
+            connection.close()
+            raise
+        if not acquired:
+            connection.close()
+            return False
+        self._connection = connection
+        return True
+
+    def _close_connection(self):
+        if self._connection is not None:
+            try:
+                self._connection.close()
+            except Exception:
+                pass
+            self._connection = None
+
+    def release(self):
+        """Rend le leadership pour qu'un autre worker le reprenne sans attendre l'expiration"""
+        try:
+            if self.backend == "advisory":
+                if self._connection is not None:
+                    self._connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": self.lock_key})
+            else:
+                db = self.db_factory()
+                try:
+                    db.release_leader_lease(self.name, self.holder)
+                finally:
+                    db.close()
+        except Exception as e:
+            logger.error(f"Erreur libération du leadership {self.name}: {e}")
+        finally:
+            self._close_connection()
+
+    async def run_forever(self, on_elected: Callable[[], Awaitable], on_revoked: Callable[[], Awaitable]):
+        while True:
+            held = await asyncio.to_thread(self.try_acquire)
+            if held and not self.is_leader:
+                self.is_leader = True
+                self.stats["elections"] += 1
+                logger.info(f"Worker {self.holder} élu leader ({self.name}, {self.backend})")
+                await self._notify(on_elected)
+            elif not held and self.is_leader:
+                self.is_leader = False
+                self.stats["revocations"] += 1
+                logger.warning(f"Worker {self.holder} n'est plus leader ({self.name})")
+                await self._notify(on_revoked)
+            await asyncio.sleep(self.renew_interval)
+
+    async def _notify(self, callback: Callable[[], Awaitable]):
+        try:
+            await callback()
+        except Exception as e:
+            logger.error(f"Erreur changement de leader {self.name}: {e}")
+
+    def start(self, on_elected: Callable[[], Awaitable], on_revoked: Callable[[], Awaitable]):
+        """Participe à l'élection dans la boucle asyncio courante"""
+        self._on_revoked = on_revoked
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self.run_forever(on_elected, on_revoked))
+        return self._task
+
+    async def stop(self):
+        """Quitte l'élection ; un leader arrête son travail puis rend la main"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.is_leader:
+            self.is_leader = False
+            await self._notify(self._on_revoked)
+        await asyncio.to_thread(self.release)
+
+    def snapshot(self) -> Dict:
+        return {"name": self.name, "backend": self.backend, "holder": self.holder, "is_leader": self.is_leader,
+                **self.stats}
+
+# Instance globale : le planificateur ne tourne que sur le worker leader
+leader_election = LeaderElection()
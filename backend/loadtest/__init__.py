@@ -0,0 +1 @@
+# Outils de test de charge et benchmarks SmartSaaS
@@ -0,0 +1,64 @@
+"""
+Microbenchmark du rendu des contenus marketing et calendriers.
+
+Compare le rendu à froid (caches vidés à chaque appel) au rendu mémoïsé,
+sur un jeu de combinaisons (business_type, audience, plateforme, durée) :
+
+    cd backend && python -m loadtest.bench_content_templates --iterations 20000
+"""
+
+import argparse
+import itertools
+import time
+from typing import Callable, List, Tuple
+
+import content_templates
+from openai_client import generate_marketing_content, generate_content_calendar
+
+BUSINESS_TYPES = ["restaurant", "salle de sport", "agence web", "boulangerie", "coach sportif"]
+AUDIENCES = ["jeunes actifs", "familles", "PME"]
+PLATFORMS = ["instagram", "linkedin", "facebook"]
+DURATIONS = [7, 14, 30, 90]
+
+def measure(name: str, iterations: int, fn: Callable[[int], None]) -> Tuple[str, float, float]:
+    started = time.perf_counter()
+    for i in range(iterations):
+        fn(i)
+    elapsed = time.perf_counter() - started
+    return name, iterations / elapsed, elapsed / iterations * 1_000_000
+
+def run(iterations: int) -> List[Tuple[str, float, float]]:
+    combos = list(itertools.product(BUSINESS_TYPES, AUDIENCES, PLATFORMS))
+    calendars = list(itertools.product(BUSINESS_TYPES, DURATIONS))
+
+    def marketing_cold(i):
+        content_templates.clear_caches()
+        generate_marketing_content(*combos[i % len(combos)])
+
+    def marketing_hot(i):
+        generate_marketing_content(*combos[i % len(combos)])
+
+    def calendar_cold(i):
+        content_templates.render_content_calendar.cache_clear()
+        generate_content_calendar(*calendars[i % len(calendars)])
+
+    def calendar_hot(i):
+        generate_content_calendar(*calendars[i % len(calendars)])
+
+    results = [measure("marketing (froid)", iterations, marketing_cold)]
+    results.append(measure("marketing (mémoïsé)", iterations, marketing_hot))
+    results.append(measure("calendrier (froid)", iterations, calendar_cold))
+    results.append(measure("calendrier (mémoïsé)", iterations, calendar_hot))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark du rendu des templates de contenu")
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f"{'chemin':<24}{'appels/s':>14}{'µs/appel':>12}")
+    for name, rate, micros in run(args.iterations):
+        print(f"{name:<24}{rate:>14,.0f}{micros:>12.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Benchmark des envois d'emails contre le puits SMTP local.
+
+Démarre loadtest.smtp_sink dans un thread du processus (start_sink_in_thread), crée une base SQLite temporaire
+peuplée d'utilisateurs inactifs et actifs la semaine précédente, puis mesure :
+
+1. EmailService.send_email (synchrone, un envoi à la fois)
+2. EmailService.send_email_async (envois concurrents sur le pool)
+3. rappels quotidiens (BulkMailer + DAILY_REMINDER_JOB)
+4. rapports hebdomadaires (BulkMailer + weekly_report_job)
+
+Pour chacun : messages/s, connexions SMTP ouvertes, pic de connexions
+simultanées et latence d'envoi p50/p99.
+
+    cd backend && python -m loadtest.bench_email --users 2000 --pool-size 8 --data-latency lognormal:40,0.5
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, List
+
+from loadtest.smtp_sink import SMTPSinkConfig, start_sink_in_thread
+
+def percentile(values: List[float], pct: int) -> float:
+    if len(values) < 2:
+        return values[0] if values else 0.0
+    return statistics.quantiles(values, n=100)[pct - 1]
+
+class TimedSend:
+    """Enveloppe send_email_async pour mesurer la latence de chaque envoi"""
+
+    def __init__(self, send):
+        self.send = send
+        self.latencies: List[float] = []
+        self.sent = 0
+
+    async def __call__(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            result = await self.send(*args, **kwargs)
+        finally:
+            self.latencies.append(time.perf_counter() - started)
+        if result.get("success"):
+            self.sent += 1
+        return result
+
+def seed_database(users: int, run_key: str):
+    """Utilisateurs inactifs depuis 10 jours, la moitié avec des jetons gagnés la semaine précédente"""
+    from bulk_mailer import weekly_report_period
+    from models import SessionLocal, SaasToken, User, create_tables
+
+    create_tables()
+    since, _ = weekly_report_period(run_key)
+    inactive_since = datetime.utcnow() - timedelta(days=10)
+    db = SessionLocal()
+    try:
+        db.bulk_insert_mappings(User, [
+            {"email": f"bench{i}@example.com", "hashed_password": "x", "referral_code": f"BENCH{i}",
+             "credits": i % 10, "created_at": inactive_since, "last_active_at": inactive_since}
+            for i in range(1, users + 1)
+        ])
+        db.bulk_insert_mappings(SaasToken, [
+            {"user_id": i, "amount": 1 + i % 5, "transaction_type": "first_generation",
+             "created_at": since + timedelta(days=i % 7)}
+            for i in range(1, users + 1, 2)
+        ])
+        db.commit()
+    finally:
+        db.close()
+
+def measure(name: str, sink, timed: TimedSend, elapsed: float, sent: int) -> Dict:
+    stats = sink.snapshot()
+    return {
+        "name": name,
+        "sent": sent,
+        "rate": sent / elapsed if elapsed > 0 else 0.0,
+        "connections": stats["connections"],
+        "peak": stats["peak_connections"],
+        "p50": percentile(timed.latencies, 50) * 1000,
+        "p99": percentile(timed.latencies, 99) * 1000,
+    }
+
+async def bench(args, sink) -> List[Dict]:
+    from bulk_mailer import BulkMailer, DAILY_REMINDER_JOB, weekly_report_job
+    from email_service import email_service
+
+    subject, html_body, text_body = email_service.build_daily_reminder(5)
+    results = []
+
+    # 1. Synchrone : un envoi à la fois, depuis un thread (comme les anciens appels bloquants)
+    sink.reset_stats()
+    timed = TimedSend(lambda *a: asyncio.to_thread(email_service.send_email, *a))
+    started = time.perf_counter()
+    for i in range(args.sync_messages):
+        await timed(f"sync{i}@example.com", subject, html_body, text_body)
+    results.append(measure("send_email (synchrone)", sink, timed, time.perf_counter() - started, timed.sent))
+
+    # 2. Asynchrone concurrent : concurrence bornée par le pool
+    sink.reset_stats()
+    timed = TimedSend(email_service.send_email_async)
+    started = time.perf_counter()
+    await asyncio.gather(*(timed(f"async{i}@example.com", subject, html_body, text_body)
+                           for i in range(args.messages)))
+    results.append(measure("send_email_async (concurrent)", sink, timed, time.perf_counter() - started, timed.sent))
+
+    # 3 et 4. Envois groupés depuis la base
+    for name, job in (("rappels quotidiens", DAILY_REMINDER_JOB), ("rapports hebdomadaires", weekly_report_job(args.run_key))):
+        sink.reset_stats()
+        timed = TimedSend(email_service.send_email_async)
+        mailer = BulkMailer(concurrency=args.concurrency, rate=args.rate, chunk_size=args.chunk_size, send=timed)
+        report = await mailer.run(job, f"{args.run_key}-bench")
+        results.append(measure(name, sink, timed, report["elapsed_seconds"], report["sent"]))
+
+    email_service.transport.close()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark des envois d'emails contre le puits SMTP local")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--messages", type=int, default=1000, help="envois directs concurrents")
+    parser.add_argument("--sync-messages", type=int, default=100, help="envois directs synchrones")
+    parser.add_argument("--pool-size", type=int, default=8)
+    parser.add_argument("--concurrency", type=int, default=20, help="envois simultanés des envois groupés")
+    parser.add_argument("--rate", type=float, default=0.0, help="débit max des envois groupés (0 = illimité)")
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--port", type=int, default=8025)
+    parser.add_argument("--connect-latency", default=SMTPSinkConfig.connect_latency)
+    parser.add_argument("--data-latency", default=SMTPSinkConfig.data_latency)
+    parser.add_argument("--transient-failure-rate", type=float, default=0.0)
+    parser.add_argument("--disconnect-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    year, week, _ = date.today().isocalendar()
+    args.run_key = f"{year}-W{week:02d}"
+
+    sink = start_sink_in_thread(SMTPSinkConfig(
+        connect_latency=args.connect_latency,
+        data_latency=args.data_latency,
+        transient_failure_rate=args.transient_failure_rate,
+        disconnect_rate=args.disconnect_rate
+    ), port=args.port)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Configuration lue à l'import de models / email_service
+        os.environ.update({
+            "DATABASE_URL": f"sqlite:///{tmp}/bench_email.db",
+            "SMTP_HOST": "127.0.0.1",
+            "SMTP_PORT": str(args.port),
+            "SMTP_USER": "bench",
+            "SMTP_PASSWORD": "bench",
+            "SMTP_USE_TLS": "false",
+            "SMTP_POOL_SIZE": str(args.pool_size),
+        })
+        seed_database(args.users, args.run_key)
+        results = asyncio.run(bench(args, sink))
+
+    print(f"{args.users:,} utilisateurs, pool SMTP de {args.pool_size} connexions, latence DATA {args.data_latency}")
+    print(f"{'scénario':<32}{'envoyés':>9}{'msg/s':>10}{'connexions':>12}{'pic':>6}{'p50 ms':>9}{'p99 ms':>9}")
+    for r in results:
+        print(f"{r['name']:<32}{r['sent']:>9,}{r['rate']:>10.1f}{r['connections']:>12}{r['peak']:>6}{r['p50']:>9.1f}{r['p99']:>9.1f}")
+
+if __name__ == "__main__":
+    main()
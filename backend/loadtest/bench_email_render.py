@@ -0,0 +1,130 @@
+"""
+Benchmark du rendu des rapports hebdomadaires.
+
+Rend N rapports (100 000 par défaut) avec des statistiques réalistes (petits
+entiers, beaucoup de combinaisons identiques) selon quatre chemins :
+
+1. f-string inline (ancien send_weekly_report)
+2. Jinja chargé à chaque envoi (ancien render_template : get_template + auto_reload)
+3. template précompilé, sans mémoïsation
+4. EmailService.build_weekly_report (précompilé + rendus mémoïsés)
+
+Mesure aussi le chargement des templates au démarrage, à froid puis depuis
+le cache de bytecode :
+
+    cd backend && python -m loadtest.bench_email_render --reports 100000
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+from typing import Callable, Dict, List, Tuple
+
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, select_autoescape
+
+from email_service import email_service
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "templates")
+DASHBOARD_URL = email_service.base_urls["dashboard"]
+
+def legacy_weekly_report(stats: Dict) -> str:
+    return f"""
+        <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto; padding: 30px;">
+            <h1>📊 Votre semaine en chiffres</h1>
+            <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 20px; border-radius: 10px; text-align: center; margin: 20px 0;">
+                <h2>🏆 Vous avez généré {stats.get('total_content', 0)} contenus cette semaine !</h2>
+            </div>
+            <h3>📈 Détails de votre activité :</h3>
+            <div style="background: #f8f9ff; padding: 15px; margin: 10px 0; border-radius: 5px; display: flex; justify-content: space-between;">
+                <span>🤖 Générations de texte :</span>
+                <strong>{stats.get('text_generations', 0)}</strong>
+            </div>
+            <div style="background: #f8f9ff; padding: 15px; margin: 10px 0; border-radius: 5px; display: flex; justify-content: space-between;">
+                <span>🎨 Images créées :</span>
+                <strong>{stats.get('image_generations', 0)}</strong>
+            </div>
+            <div style="background: #f8f9ff; padding: 15px; margin: 10px 0; border-radius: 5px; display: flex; justify-content: space-between;">
+                <span>🪙 Jetons SaaS gagnés :</span>
+                <strong>+{stats.get('tokens_earned', 0)}</strong>
+            </div>
+            <div style="background: #f8f9ff; padding: 15px; margin: 10px 0; border-radius: 5px; display: flex; justify-content: space-between;">
+                <span>👥 Nouveaux parrainages :</span>
+                <strong>{stats.get('new_referrals', 0)}</strong>
+            </div>
+            <h3>🎯 Objectif de la semaine prochaine :</h3>
+            <p>Essayez de générer du contenu pour 5 plateformes différentes pour diversifier votre stratégie marketing !</p>
+            <a href="{DASHBOARD_URL}" style="display: inline-block; padding: 12px 30px; background: #667eea; color: white; text-decoration: none; border-radius: 5px;">
+                Continuer à créer
+            </a>
+        </div>
+        """
+
+def make_stats(count: int, seed: int = 42) -> List[Dict]:
+    rng = random.Random(seed)
+    stats = []
+    for _ in range(count):
+        text, images = rng.randint(0, 12), rng.randint(0, 6)
+        stats.append({
+            "total_content": text + images,
+            "text_generations": text,
+            "image_generations": images,
+            "tokens_earned": rng.choice([0, 1, 2, 5, 7, 10, 25]),
+            "new_referrals": rng.choice([0, 0, 0, 1, 2])
+        })
+    return stats
+
+def measure(name: str, items: List[Dict], fn: Callable[[Dict], str]) -> Tuple[str, float, float]:
+    started = time.perf_counter()
+    for item in items:
+        fn(item)
+    elapsed = time.perf_counter() - started
+    return name, len(items) / elapsed, elapsed
+
+def bench_startup() -> Tuple[float, float]:
+    """Chargement de tous les templates : compilation à froid, puis depuis le cache de bytecode"""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        timings = []
+        for _ in range(2):
+            env = Environment(loader=FileSystemLoader(TEMPLATE_DIR), bytecode_cache=FileSystemBytecodeCache(cache_dir),
+                              auto_reload=False, autoescape=select_autoescape(["html"]))
+            started = time.perf_counter()
+            for name in env.list_templates():
+                env.get_template(name)
+            timings.append((time.perf_counter() - started) * 1000)
+    return timings[0], timings[1]
+
+def run(reports: int) -> List[Tuple[str, float, float]]:
+    stats = make_stats(reports)
+    reload_env = Environment(loader=FileSystemLoader(TEMPLATE_DIR), autoescape=select_autoescape(["html"]))
+    compiled = email_service.templates["weekly_report.html"]
+
+    def per_send_lookup(item):
+        return reload_env.get_template("weekly_report.html").render(**item, dashboard_url=DASHBOARD_URL)
+
+    email_service._render_cached.cache_clear()
+    return [
+        measure("f-string inline", stats, legacy_weekly_report),
+        measure("jinja chargé par envoi", stats, per_send_lookup),
+        measure("jinja précompilé", stats, lambda item: compiled.render(item)),
+        measure("précompilé + mémoïsé", stats, email_service.build_weekly_report),
+    ]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark du rendu des rapports hebdomadaires")
+    parser.add_argument("--reports", type=int, default=100000)
+    args = parser.parse_args()
+
+    cold, warm = bench_startup()
+    print(f"Chargement des templates : {cold:.1f} ms à froid, {warm:.1f} ms depuis le cache de bytecode\n")
+
+    print(f"{args.reports:,} rapports hebdomadaires")
+    print(f"{'chemin':<26}{'rapports/s':>14}{'total s':>10}")
+    for name, rate, elapsed in run(args.reports):
+        print(f"{name:<26}{rate:>14,.0f}{elapsed:>10.2f}")
+    info = email_service._render_cached.cache_info()
+    print(f"\nCache de rendu : {info.hits:,} hits, {info.misses:,} rendus effectifs")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Benchmark des prompts système précalculés et du cache de préfixe.
+
+1. Préparation locale : prompt système reconstruit et re-tokenisé à chaque appel
+   (ancien comportement) contre les messages précalculés de ai_service.
+2. Bout en bout contre le serveur OpenAI local, avec et sans cache de préfixe :
+   latence p50/p95 et part des tokens de prompt servis depuis le cache.
+
+    cd backend && python -m loadtest.bench_prompt_cache --calls 60
+
+Les prompts système actuels font ~110 tokens, sous le seuil de 1024 tokens
+d'OpenAI : le benchmark abaisse ce seuil (--min-cached-tokens) pour mesurer
+l'effet attendu lorsque les préfixes dépassent la taille minimale.
+"""
+
+import argparse
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+import httpx
+import uvicorn
+
+from config import settings
+from loadtest.fake_openai import FakeOpenAIConfig, create_app
+from model_router import count_message_tokens, count_tokens
+
+LEGACY_SAAS_SYSTEM_PROMPT = """Tu es un expert en création de SaaS. Génère une idée complète de micro-SaaS basée sur le prompt utilisateur.
+
+            Retourne un JSON avec:
+            - name: nom du SaaS
+            - description: description détaillée
+            - features: liste des fonctionnalités principales
+            - tech_stack: technologies recommandées
+            - monetization: modèle de monétisation
+            - target_market: marché cible
+            - mvp_timeline: timeline pour le MVP (en semaines)
+            - estimated_cost: coût estimé de développement
+            """
+
+def bench_local(iterations: int) -> Dict[str, float]:
+    from ai_service import SYSTEM_MESSAGES, SAAS_IDEA_USER_TEMPLATE
+    uncached_count = count_tokens.__wrapped__
+
+    started = time.perf_counter()
+    for i in range(iterations):
+        system_prompt = LEGACY_SAAS_SYSTEM_PROMPT
+        user_prompt = f"Idée de base: outil {i}"
+        sum(uncached_count(text) + 4 for text in (system_prompt, user_prompt))
+    legacy = (time.perf_counter() - started) / iterations * 1_000_000
+
+    started = time.perf_counter()
+    for i in range(iterations):
+        messages = [
+            SYSTEM_MESSAGES["saas_idea"],
+            {"role": "user", "content": SAAS_IDEA_USER_TEMPLATE.format(prompt=f"outil {i}", target_audience="", tech_stack="")}
+        ]
+        count_message_tokens(messages)
+    precomputed = (time.perf_counter() - started) / iterations * 1_000_000
+
+    return {
+        "legacy_us": legacy,
+        "precomputed_us": precomputed,
+        "legacy_tokens": uncached_count(LEGACY_SAAS_SYSTEM_PROMPT),
+        "precomputed_tokens": SYSTEM_MESSAGES["saas_idea"].token_count
+    }
+
+def start_fake_server(port: int, config: FakeOpenAIConfig) -> uvicorn.Server:
+    server = uvicorn.Server(uvicorn.Config(create_app(config), host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+def bench_end_to_end(port: int, calls: int, concurrency: int) -> Dict[str, float]:
+    from ai_service import AIService
+
+    settings.OPENAI_BASE_URL = f"http://127.0.0.1:{port}/v1"
+    service = AIService()
+    latencies: List[float] = []
+
+    def one_call(i: int):
+        started = time.perf_counter()
+        result = service.generate_code_structure({"name": f"SaaS {i % 5}"})
+        latencies.append(time.perf_counter() - started)
+        return result["success"]
+
+    # Échauffement (connexions, encodeur de tokens) hors mesure
+    service.generate_code_structure({"name": "échauffement"})
+    before = httpx.get(f"http://127.0.0.1:{port}/_stats").json()
+    latencies.clear()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        succeeded = sum(pool.map(one_call, range(calls)))
+
+    # Compteurs du serveur : les flux coupés tôt ne reçoivent pas le bloc d'usage
+    after = httpx.get(f"http://127.0.0.1:{port}/_stats").json()
+    stats = {name: after[name] - before[name] for name in ("prompt_tokens", "cached_prompt_tokens")}
+    ordered = sorted(latencies)
+    return {
+        "succeeded": succeeded,
+        "p50_ms": statistics.median(ordered) * 1000,
+        "p95_ms": ordered[min(int(0.95 * len(ordered)), len(ordered) - 1)] * 1000,
+        "prompt_tokens": stats["prompt_tokens"],
+        "cached_prompt_tokens": stats["cached_prompt_tokens"]
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark des prompts précalculés et du cache de préfixe")
+    parser.add_argument("--calls", type=int, default=60)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--latency", default="fixed:400")
+    parser.add_argument("--min-cached-tokens", type=int, default=64)
+    parser.add_argument("--local-iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    # ai_service instancie un client au chargement : le pointer sur le serveur local
+    settings.OPENAI_BASE_URL = "http://127.0.0.1:8021/v1"
+    local = bench_local(args.local_iterations)
+    print("Préparation du prompt (saas_idea)")
+    print(f"  reconstruit + tokenisé : {local['legacy_us']:8.1f} µs/appel, {local['legacy_tokens']} tokens système")
+    print(f"  précalculé             : {local['precomputed_us']:8.1f} µs/appel, {local['precomputed_tokens']} tokens système")
+
+    print(f"\nBout en bout (code_structure, {args.calls} appels, concurrence {args.concurrency})")
+    print(f"{'mode':<18}{'p50 ms':>10}{'p95 ms':>10}{'tokens prompt':>15}{'en cache':>10}")
+    for port, enabled in ((8021, False), (8022, True)):
+        start_fake_server(port, FakeOpenAIConfig(
+            latency=args.latency,
+            token_delay_ms=0,
+            prefix_cache=enabled,
+            prefix_cache_min_tokens=args.min_cached_tokens
+        ))
+        result = bench_end_to_end(port, args.calls, args.concurrency)
+        ratio = result["cached_prompt_tokens"] / result["prompt_tokens"] if result["prompt_tokens"] else 0
+        label = "cache de préfixe" if enabled else "sans cache"
+        print(f"{label:<18}{result['p50_ms']:>10.0f}{result['p95_ms']:>10.0f}"
+              f"{result['prompt_tokens']:>15}{ratio:>9.0%}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+"""
+Serveur OpenAI local pour les tests de charge.
+
+Implémente /v1/chat/completions (avec streaming SSE), /v1/images/generations
+et /v1/models avec une latence configurable, de l'injection d'erreurs, une
+limite de débit et un cache de préfixe de prompt simulé. Pointer l'application dessus avec :
+
+    OPENAI_BASE_URL=http://localhost:8010/v1 python start.py
+
+Lancement :
+
+    cd backend && python -m loadtest.fake_openai --latency lognormal:800,0.4 --error-rate 0.02
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import random
+import re
+import struct
+import threading
+import time
+import uuid
+import zlib
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+@dataclass
+class FakeOpenAIConfig:
+    latency: str = "lognormal:600,0.4"  # fixed:ms | uniform:min,max | normal:mean,std | lognormal:median,sigma
+    token_delay_ms: float = 15.0  # Délai entre deux chunks en streaming
+    error_rate: float = 0.0  # Proportion de réponses en erreur
+    error_codes: List[int] = field(default_factory=lambda: [500, 503])
+    rate_limit_rpm: int = 0  # 0 = illimité
+    retry_after_seconds: int = 1
+    prefix_cache: bool = True  # Simule le cache de préfixe de prompt d'OpenAI
+    prefix_cache_min_tokens: int = 1024  # En dessous, OpenAI ne met pas le préfixe en cache
+    prefix_cache_ttl: float = 300.0
+    prefix_cache_speedup: float = 0.5  # Part du temps jusqu'au premier token économisée si tout le prompt est en cache
+
+class LatencyModel:
+    """Tire une latence (en secondes) selon la distribution configurée"""
+
+    def __init__(self, spec: str):
+        kind, _, params = spec.partition(":")
+        self.kind = kind
+        self.params = [float(value) for value in params.split(",") if value]
+
+    def sample(self) -> float:
+        if self.kind == "fixed":
+            milliseconds = self.params[0]
+        elif self.kind == "uniform":
+            milliseconds = random.uniform(self.params[0], self.params[1])
+        elif self.kind == "normal":
+            milliseconds = random.gauss(self.params[0], self.params[1])
+        elif self.kind == "lognormal":
+            median, sigma = self.params
+            milliseconds = median * random.lognormvariate(0, sigma)
+        else:
+            raise ValueError(f"Distribution de latence inconnue: {self.kind}")
+        return max(milliseconds, 0) / 1000
+
+class RateLimiter:
+    """Fenêtre glissante d'une minute, comme les limites RPM d'OpenAI"""
+
+    def __init__(self, rpm: int):
+        self.rpm = rpm
+        self.requests: List[float] = []
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        if self.rpm <= 0:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            self.requests = [t for t in self.requests if now - t < 60]
+            if len(self.requests) >= self.rpm:
+                return False
+            self.requests.append(now)
+            return True
+
+class PrefixCache:
+    """
+    Cache de préfixe simplifié : les préfixes de messages déjà vus (même modèle)
+    sont servis depuis le cache, par tranches de 128 tokens comme chez OpenAI.
+    """
+
+    def __init__(self, min_tokens: int, ttl: float):
+        self.min_tokens = min_tokens
+        self.ttl = ttl
+        self.entries: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, model: str, messages: List[Dict]) -> str:
+        return hashlib.sha256(json.dumps([model, messages], sort_keys=True).encode()).hexdigest()
+
+    def lookup_and_store(self, model: str, messages: List[Dict]) -> int:
+        """Nombre de tokens du plus long préfixe en cache, puis mémorise les préfixes de cette requête"""
+        now = time.monotonic()
+        prefixes = []
+        tokens = 0
+        for index, message in enumerate(messages):
+            tokens += count_tokens(str(message.get("content", "")))
+            prefixes.append((self._key(model, messages[:index + 1]), tokens))
+
+        cached = 0
+        with self._lock:
+            for key, prefix_tokens in prefixes:
+                if prefix_tokens < self.min_tokens:
+                    continue
+                expires = self.entries.get(key)
+                if expires and expires > now:
+                    cached = prefix_tokens
+                self.entries[key] = now + self.ttl
+        if cached < self.min_tokens:
+            return 0
+        return self.min_tokens + (cached - self.min_tokens) // 128 * 128
+
+LOREM = ("Notre solution aide les entrepreneurs à automatiser leur marketing grâce à l'IA "
+         "et à transformer chaque idée en contenu engageant pour leur audience cible").split()
+
+def count_tokens(text: str) -> int:
+    """Approximation du nombre de tokens (≈ 4 caractères par token)"""
+    return max(len(text) // 4, 1)
+
+def fake_text(word_count: int) -> str:
+    return " ".join(LOREM[i % len(LOREM)] for i in range(word_count))
+
+def fake_json_for_prompt(system_prompt: str, word_budget: int) -> str:
+    """Construit un JSON avec les champs listés dans le prompt système ('- champ: ...')"""
+    fields = re.findall(r"^\s*-\s*([a-z_]+)\s*:", system_prompt, flags=re.MULTILINE)
+    if not fields:
+        return json.dumps({"content": fake_text(word_budget)}, ensure_ascii=False)
+    words_per_field = max(word_budget // len(fields), 3)
+    payload = {}
+    for name in fields:
+        if name in ("features", "channels", "kpis", "target_personas", "api_endpoints", "frontend_components"):
+            payload[name] = [fake_text(4) for _ in range(3)]
+        else:
+            payload[name] = fake_text(words_per_field)
+    return json.dumps(payload, ensure_ascii=False)
+
+def fake_png(width: int = 64, height: int = 64) -> bytes:
+    """Génère une image PNG unie (sans dépendance externe)"""
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xffffffff)
+
+    row = b"\x00" + bytes([79, 70, 229]) * width
+    raw = row * height
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw))
+            + chunk(b"IEND", b""))
+
+def create_app(config: FakeOpenAIConfig = None) -> FastAPI:
+    config = config or FakeOpenAIConfig()
+    latency = LatencyModel(config.latency)
+    limiter = RateLimiter(config.rate_limit_rpm)
+    prefix_cache = PrefixCache(config.prefix_cache_min_tokens, config.prefix_cache_ttl)
+    stats: Dict[str, int] = {"chat": 0, "chat_stream": 0, "images": 0, "errors": 0, "rate_limited": 0,
+                             "prompt_tokens": 0, "cached_prompt_tokens": 0}
+    app = FastAPI(title="Fake OpenAI")
+    app.state.config = config
+    app.state.stats = stats
+
+    def injected_error() -> Optional[JSONResponse]:
+        if not limiter.allow():
+            stats["rate_limited"] += 1
+            return JSONResponse(
+                status_code=429,
+                headers={"retry-after": str(config.retry_after_seconds)},
+                content={"error": {"message": "Rate limit reached", "type": "rate_limit_error"}}
+            )
+        if config.error_rate and random.random() < config.error_rate:
+            stats["errors"] += 1
+            code = random.choice(config.error_codes)
+            return JSONResponse(status_code=code, content={"error": {"message": "Injected failure", "type": "server_error"}})
+        return None
+
+    @app.get("/v1/models")
+    async def list_models():
+        return {"object": "list", "data": [{"id": m, "object": "model"} for m in ("gpt-4", "gpt-4o", "gpt-4o-mini")]}
+
+    @app.get("/_stats")
+    async def get_stats():
+        return stats
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        error = injected_error()
+        if error:
+            return error
+
+        messages = body.get("messages", [])
+        model = body.get("model", "gpt-4")
+        system_prompt = next((m["content"] for m in messages if m.get("role") == "system"), "")
+        prompt_text = "".join(str(m.get("content", "")) for m in messages)
+        max_tokens = body.get("max_tokens") or body.get("max_completion_tokens") or 256
+        word_budget = max(min(max_tokens * 3 // 4, 400), 5)
+
+        if "JSON" in system_prompt:
+            content = fake_json_for_prompt(system_prompt, word_budget)
+        else:
+            content = fake_text(word_budget)
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+        prompt_tokens = count_tokens(prompt_text)
+        cached_tokens = prefix_cache.lookup_and_store(model, messages) if config.prefix_cache else 0
+        cached_tokens = min(cached_tokens, prompt_tokens)
+        stats["prompt_tokens"] += prompt_tokens
+        stats["cached_prompt_tokens"] += cached_tokens
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": count_tokens(content),
+            "total_tokens": prompt_tokens + count_tokens(content),
+            "prompt_tokens_details": {"cached_tokens": cached_tokens}
+        }
+
+        # Temps jusqu'au premier token, réduit par la part du prompt servie depuis le cache
+        cache_saving = config.prefix_cache_speedup * cached_tokens / prompt_tokens
+        await asyncio.sleep(latency.sample() * (1 - cache_saving))
+
+        if not body.get("stream"):
+            stats["chat"] += 1
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop"
+                }],
+                "usage": usage
+            }
+
+        stats["chat_stream"] += 1
+
+        async def event_stream():
+            pieces = re.findall(r"\S+\s*", content)
+            for index, piece in enumerate(pieces):
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{
+                        "index": 0,
+                        "delta": {"role": "assistant", "content": piece} if index == 0 else {"content": piece},
+                        "finish_reason": None
+                    }]
+                }
+                yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+                if config.token_delay_ms:
+                    await asyncio.sleep(config.token_delay_ms / 1000)
+
+            final = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]
+            }
+            if (body.get("stream_options") or {}).get("include_usage"):
+                final["usage"] = usage
+            yield f"data: {json.dumps(final)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+    @app.post("/v1/images/generations")
+    async def images_generations(request: Request):
+        body = await request.json()
+        error = injected_error()
+        if error:
+            return error
+
+        await asyncio.sleep(latency.sample())
+        stats["images"] += 1
+        count = body.get("n", 1)
+        base_url = str(request.base_url).rstrip("/")
+        data = []
+        for _ in range(count):
+            if body.get("response_format") == "b64_json":
+                data.append({"b64_json": base64.b64encode(fake_png()).decode(), "revised_prompt": body.get("prompt")})
+            else:
+                data.append({"url": f"{base_url}/v1/files/{uuid.uuid4().hex}.png", "revised_prompt": body.get("prompt")})
+        return {"created": int(time.time()), "data": data}
+
+    @app.get("/v1/files/{name}")
+    async def get_file(name: str):
+        return Response(content=fake_png(), media_type="image/png")
+
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description="Serveur OpenAI local pour les tests de charge")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8010)
+    parser.add_argument("--latency", default=FakeOpenAIConfig.latency)
+    parser.add_argument("--token-delay-ms", type=float, default=FakeOpenAIConfig.token_delay_ms)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-codes", default="500,503")
+    parser.add_argument("--rate-limit-rpm", type=int, default=0)
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--no-prefix-cache", action="store_true")
+    parser.add_argument("--prefix-cache-min-tokens", type=int, default=FakeOpenAIConfig.prefix_cache_min_tokens)
+    args = parser.parse_args()
+
+    config = FakeOpenAIConfig(
+        latency=args.latency,
+        token_delay_ms=args.token_delay_ms,
+        error_rate=args.error_rate,
+        error_codes=[int(code) for code in args.error_codes.split(",")],
+        rate_limit_rpm=args.rate_limit_rpm,
+        retry_after_seconds=args.retry_after,
+        prefix_cache=not args.no_prefix_cache,
+        prefix_cache_min_tokens=args.prefix_cache_min_tokens
+    )
+
+    import uvicorn
+    print(f"🤖 Fake OpenAI sur http://{args.host}:{args.port}/v1 (latence {config.latency})")
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""
+Scénarios de charge de bout en bout contre l'API SmartSaaS.
+
+Chaque utilisateur virtuel s'inscrit, reçoit des crédits puis enchaîne les
+requêtes du scénario choisi jusqu'à la fin de la durée. Avec --start-servers,
+le serveur OpenAI local et l'API sont lancés automatiquement :
+
+    cd backend && python -m loadtest.scenarios --start-servers --scenario mixed --users 20 --duration 60
+
+Sinon, démarrer l'API avec OPENAI_BASE_URL pointant sur loadtest/fake_openai.py
+et un RATE_LIMIT élevé, puis passer --base-url.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import uuid
+from collections import defaultdict
+from typing import Callable, Dict, List, Tuple
+
+import httpx
+
+class Recorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+
+    def record(self, name: str, seconds: float, ok: bool):
+        self.latencies[name].append(seconds)
+        if not ok:
+            self.errors[name] += 1
+
+    def report(self, elapsed: float) -> str:
+        lines = [f"{'scénario':<22}{'requêtes':>10}{'erreurs':>9}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"]
+        for name, samples in sorted(self.latencies.items()):
+            ordered = sorted(samples)
+
+            def pct(q):
+                return ordered[min(int(q * len(ordered)), len(ordered) - 1)] * 1000
+
+            lines.append(
+                f"{name:<22}{len(ordered):>10}{self.errors[name]:>9}{len(ordered) / elapsed:>9.1f}"
+                f"{pct(0.5):>10.0f}{pct(0.95):>10.0f}{pct(0.99):>10.0f}"
+            )
+        return "\n".join(lines)
+
+async def timed(recorder: Recorder, name: str, coro) -> httpx.Response:
+    started = time.perf_counter()
+    try:
+        response = await coro
+        recorder.record(name, time.perf_counter() - started, response.status_code < 400)
+        return response
+    except httpx.HTTPError:
+        recorder.record(name, time.perf_counter() - started, False)
+        return None
+
+# === Étapes des scénarios ===
+
+async def step_generate(client, headers, recorder):
+    await timed(recorder, "generate", client.post(
+        "/generate", json={"prompt": "Écris un post LinkedIn sur l'IA"}, headers=headers))
+
+async def step_marketing(client, headers, recorder):
+    await timed(recorder, "marketing", client.post("/generate-marketing-content", json={
+        "business_type": random.choice(["restaurant", "salle de sport", "agence web"]),
+        "target_audience": "jeunes actifs",
+        "platform": random.choice(["instagram", "linkedin", "facebook"])
+    }, headers=headers))
+
+async def step_saas_idea(client, headers, recorder):
+    await timed(recorder, "saas_idea_sync", client.post("/ai/generate-saas-idea", json={
+        "prompt": "Outil de planification pour freelances"
+    }, headers=headers))
+
+async def step_saas_job(client, headers, recorder):
+    """Soumission asynchrone puis polling jusqu'à la fin du job (latence de bout en bout)"""
+    started = time.perf_counter()
+    response = await timed(recorder, "saas_job_submit", client.post("/ai/generate-saas-idea", json={
+        "prompt": "Outil de planification pour freelances", "async_job": True
+    }, headers=headers))
+    if response is None or response.status_code != 202:
+        return
+
+    job_id = response.json()["job_id"]
+    status = "pending"
+    while status not in ("completed", "failed"):
+        await asyncio.sleep(0.5)
+        poll = await client.get(f"/ai/jobs/{job_id}", headers=headers)
+        status = poll.json().get("status") if poll.status_code == 200 else "failed"
+    recorder.record("saas_job_end_to_end", time.perf_counter() - started, status == "completed")
+
+async def step_batch(client, headers, recorder):
+    items = [{"type": "text", "prompt": f"Post LinkedIn #{i}"} for i in range(20)]
+    started = time.perf_counter()
+    ok = False
+    try:
+        async with client.stream("POST", "/generate/batch", json={"items": items}, headers=headers) as response:
+            async for line in response.aiter_lines():
+                if line and json.loads(line).get("type") == "summary":
+                    ok = True
+    except httpx.HTTPError:
+        pass
+    recorder.record("batch_20", time.perf_counter() - started, ok)
+
+SCENARIOS: Dict[str, List[Tuple[Callable, int]]] = {
+    "generate": [(step_generate, 1)],
+    "marketing": [(step_marketing, 1)],
+    "saas_idea": [(step_saas_idea, 1)],
+    "saas_job": [(step_saas_job, 1)],
+    "batch": [(step_batch, 1)],
+    "mixed": [(step_generate, 6), (step_marketing, 3), (step_saas_job, 1), (step_batch, 1)]
+}
+
+def grant_credits(email: str, amount: int):
+    """Crédite directement l'utilisateur de test (même DATABASE_URL que l'API)"""
+    from database import DatabaseService
+    db = DatabaseService()
+    try:
+        user = db.get_user_by_email(email)
+        db.add_credits(user.id, amount)
+    finally:
+        db.close()
+
+async def virtual_user(base_url: str, scenario: str, deadline: float, credits: int, recorder: Recorder):
+    steps, weights = zip(*SCENARIOS[scenario])
+    async with httpx.AsyncClient(base_url=base_url, timeout=120) as client:
+        email = f"load_{uuid.uuid4().hex[:12]}@example.com"
+        response = await timed(recorder, "register", client.post(
+            "/auth/register", json={"email": email, "password": "loadtest123"}))
+        if response is None or response.status_code != 200:
+            return
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        if credits:
+            await asyncio.to_thread(grant_credits, email, credits)
+
+        while time.monotonic() < deadline:
+            step = random.choices(steps, weights=weights)[0]
+            await step(client, headers, recorder)
+
+async def run_load(base_url: str, scenario: str, users: int, duration: float, credits: int) -> Recorder:
+    recorder = Recorder()
+    deadline = time.monotonic() + duration
+    started = time.perf_counter()
+    await asyncio.gather(*(virtual_user(base_url, scenario, deadline, credits, recorder) for _ in range(users)))
+    print(recorder.report(time.perf_counter() - started))
+    return recorder
+
+def wait_until_up(url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.3)
+    raise RuntimeError(f"{url} ne répond pas")
+
+def start_servers(api_port: int, fake_port: int, fake_args: List[str]) -> List[subprocess.Popen]:
+    """Lance le serveur OpenAI local puis l'API configurée pour l'utiliser"""
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    fake = subprocess.Popen(
+        [sys.executable, "-m", "loadtest.fake_openai", "--port", str(fake_port), *fake_args],
+        cwd=backend_dir
+    )
+    env = {
+        **os.environ,
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{fake_port}/v1",
+        "RATE_LIMIT": "1000000",
+        "DATABASE_URL": os.environ.get("DATABASE_URL", "sqlite:///./loadtest.db")
+    }
+    api = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(api_port), "--log-level", "warning"],
+        cwd=backend_dir, env=env
+    )
+    wait_until_up(f"http://127.0.0.1:{fake_port}/v1/models")
+    wait_until_up(f"http://127.0.0.1:{api_port}/")
+    os.environ["DATABASE_URL"] = env["DATABASE_URL"]
+    return [fake, api]
+
+def main():
+    parser = argparse.ArgumentParser(description="Tests de charge SmartSaaS")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="mixed")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--grant-credits", type=int, default=10000, help="Crédits ajoutés à chaque utilisateur (0 = aucun)")
+    parser.add_argument("--start-servers", action="store_true")
+    parser.add_argument("--fake-latency", default="lognormal:600,0.4")
+    parser.add_argument("--fake-error-rate", default="0.0")
+    args = parser.parse_args()
+
+    processes = []
+    base_url = args.base_url
+    if args.start_servers:
+        processes = start_servers(8000, 8010, ["--latency", args.fake_latency, "--error-rate", args.fake_error_rate])
+        base_url = "http://127.0.0.1:8000"
+
+    try:
+        asyncio.run(run_load(base_url, args.scenario, args.users, args.duration, args.grant_credits))
+    finally:
+        for process in processes:
+            process.terminate()
+
+if __name__ == "__main__":
+    main()
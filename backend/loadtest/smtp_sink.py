@@ -0,0 +1,221 @@
+"""
+Serveur SMTP local (« puits ») pour mesurer les envois d'emails sans compte réel.
+
+Accepte EHLO, AUTH PLAIN/LOGIN (tout identifiant), MAIL, RCPT, DATA, RSET,
+NOOP et QUIT, et jette les messages reçus. Latences configurables (connexion,
+commandes, fin de DATA) et injection d'erreurs : refus temporaires (451),
+destinataires refusés (550), coupures de connexion et limite de connexions.
+Pointer l'application dessus avec :
+
+    SMTP_HOST=127.0.0.1 SMTP_PORT=8025 SMTP_USE_TLS=false python start.py
+
+Lancement :
+
+    cd backend && python -m loadtest.smtp_sink --port 8025 --data-latency lognormal:40,0.5 --transient-failure-rate 0.01
+"""
+
+import argparse
+import asyncio
+import threading
+import random
+import time
+from dataclasses import dataclass
+from typing import Dict
+
+from loadtest.fake_openai import LatencyModel
+
+@dataclass
+class SMTPSinkConfig:
+    connect_latency: str = "fixed:30"  # Délai avant la bannière (poignée de main TLS/serveur distant)
+    command_latency: str = "fixed:0"  # Délai par commande
+    data_latency: str = "lognormal:40,0.5"  # Délai d'acceptation d'un message (fin de DATA)
+    transient_failure_rate: float = 0.0  # 451 en fin de DATA
+    permanent_failure_rate: float = 0.0  # 550 sur RCPT
+    disconnect_rate: float = 0.0  # Coupure de la connexion en fin de DATA, sans réponse
+    max_connections: int = 0  # 0 = illimité, sinon 421 à la connexion
+    max_messages_per_connection: int = 0  # 0 = illimité, sinon 421 puis fermeture
+
+class SMTPSink:
+    def __init__(self, config: SMTPSinkConfig = None):
+        self.config = config or SMTPSinkConfig()
+        self.connect_latency = LatencyModel(self.config.connect_latency)
+        self.command_latency = LatencyModel(self.config.command_latency)
+        self.data_latency = LatencyModel(self.config.data_latency)
+        self.server = None
+        self.active_connections = 0
+        self.stats = {
+            "connections": 0, "peak_connections": 0, "messages": 0, "bytes": 0,
+            "transient_failures": 0, "permanent_failures": 0, "disconnects": 0, "refused_connections": 0
+        }
+
+    def snapshot(self) -> Dict:
+        return {**self.stats, "active_connections": self.active_connections}
+
+    def reset_stats(self):
+        for name in self.stats:
+            self.stats[name] = 0
+        self.stats["peak_connections"] = self.active_connections
+
+    async def _delay(self, model: LatencyModel):
+        seconds = model.sample()
+        if seconds > 0:
+            await asyncio.sleep(seconds)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        async def reply(line: str):
+            writer.write(line.encode() + b"\r\n")
+            await writer.drain()
+
+        if self.config.max_connections and self.active_connections >= self.config.max_connections:
+            self.stats["refused_connections"] += 1
+            await reply("421 4.7.0 Trop de connexions, réessayez plus tard")
+            writer.close()
+            return
+
+        self.active_connections += 1
+        self.stats["connections"] += 1
+        self.stats["peak_connections"] = max(self.stats["peak_connections"], self.active_connections)
+        messages = 0
+        try:
+            await self._delay(self.connect_latency)
+            await reply("220 smtp-sink ESMTP prêt")
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                command, _, argument = line.decode("utf-8", "replace").strip().partition(" ")
+                command = command.upper()
+                await self._delay(self.command_latency)
+
+                if command in ("EHLO", "HELO"):
+                    if command == "HELO":
+                        await reply("250 smtp-sink")
+                    else:
+                        for extension in ("250-smtp-sink", "250-PIPELINING", "250-8BITMIME", "250-SMTPUTF8",
+                                          "250-SIZE 52428800", "250 AUTH PLAIN LOGIN"):
+                            await reply(extension)
+                elif command == "AUTH":
+                    mechanism = argument.split(" ")[0].upper()
+                    if mechanism == "LOGIN":
+                        for prompt in ("334 VXNlcm5hbWU6", "334 UGFzc3dvcmQ6"):
+                            await reply(prompt)
+                            await reader.readline()
+                    elif mechanism == "PLAIN" and " " not in argument:
+                        await reply("334 ")
+                        await reader.readline()
+                    await reply("235 2.7.0 Authentification réussie")
+                elif command == "MAIL":
+                    await reply("250 2.1.0 OK")
+                elif command == "RCPT":
+                    if random.random() < self.config.permanent_failure_rate:
+                        self.stats["permanent_failures"] += 1
+                        await reply("550 5.1.1 Destinataire inconnu")
+                    else:
+                        await reply("250 2.1.5 OK")
+                elif command == "DATA":
+                    await reply("354 Fin des données par <CRLF>.<CRLF>")
+                    size = 0
+                    while True:
+                        data_line = await reader.readline()
+                        if not data_line or data_line == b".\r\n":
+                            break
+                        size += len(data_line)
+                    await self._delay(self.data_latency)
+                    if random.random() < self.config.disconnect_rate:
+                        self.stats["disconnects"] += 1
+                        break
+                    if random.random() < self.config.transient_failure_rate:
+                        self.stats["transient_failures"] += 1
+                        await reply("451 4.3.0 Erreur temporaire, réessayez")
+                        continue
+                    messages += 1
+                    self.stats["messages"] += 1
+                    self.stats["bytes"] += size
+                    await reply(f"250 2.0.0 OK id={self.stats['messages']}")
+                    if self.config.max_messages_per_connection and messages >= self.config.max_messages_per_connection:
+                        await reply("421 4.7.0 Trop de messages sur cette connexion")
+                        break
+                elif command == "RSET":
+                    await reply("250 2.0.0 OK")
+                elif command == "NOOP":
+                    await reply("250 2.0.0 OK")
+                elif command == "QUIT":
+                    await reply("221 2.0.0 Au revoir")
+                    break
+                else:
+                    await reply("502 5.5.2 Commande non reconnue")
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.active_connections -= 1
+            writer.close()
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8025):
+        self.server = await asyncio.start_server(self.handle, host, port)
+        return self.server
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+def start_sink_in_thread(config: SMTPSinkConfig = None, host: str = "127.0.0.1", port: int = 8025) -> SMTPSink:
+    """Lance le puits SMTP dans sa propre boucle asyncio (pour les benchmarks en processus)"""
+    sink = SMTPSink(config)
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+
+    def run():
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(sink.start(host, port))
+        started.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, name="smtp-sink", daemon=True).start()
+    started.wait()
+    return sink
+
+def main():
+    parser = argparse.ArgumentParser(description="Serveur SMTP local pour les tests de charge")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8025)
+    parser.add_argument("--connect-latency", default=SMTPSinkConfig.connect_latency)
+    parser.add_argument("--command-latency", default=SMTPSinkConfig.command_latency)
+    parser.add_argument("--data-latency", default=SMTPSinkConfig.data_latency)
+    parser.add_argument("--transient-failure-rate", type=float, default=0.0)
+    parser.add_argument("--permanent-failure-rate", type=float, default=0.0)
+    parser.add_argument("--disconnect-rate", type=float, default=0.0)
+    parser.add_argument("--max-connections", type=int, default=0)
+    parser.add_argument("--max-messages-per-connection", type=int, default=0)
+    parser.add_argument("--stats-interval", type=float, default=10.0)
+    args = parser.parse_args()
+
+    sink = SMTPSink(SMTPSinkConfig(
+        connect_latency=args.connect_latency,
+        command_latency=args.command_latency,
+        data_latency=args.data_latency,
+        transient_failure_rate=args.transient_failure_rate,
+        permanent_failure_rate=args.permanent_failure_rate,
+        disconnect_rate=args.disconnect_rate,
+        max_connections=args.max_connections,
+        max_messages_per_connection=args.max_messages_per_connection
+    ))
+
+    async def serve():
+        await sink.start(args.host, args.port)
+        print(f"Puits SMTP sur {args.host}:{args.port}")
+        previous = 0
+        while True:
+            await asyncio.sleep(args.stats_interval)
+            stats = sink.snapshot()
+            rate = (stats["messages"] - previous) / args.stats_interval
+            previous = stats["messages"]
+            print(f"{time.strftime('%H:%M:%S')} {rate:8.1f} msg/s  {stats}")
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
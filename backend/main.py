@@ -1,13 +1,15 @@
 
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Query, Request, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.responses import JSONResponse, StreamingResponse, FileResponse, Response
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from openai_client import generate_text, generate_image, generate_marketing_content, generate_content_calendar
 from database import db_service
 from models import (PromptRequest, UserCreate, UserResponse, PaymentRequest, 
                    ImageRequest, MarketingRequest, CalendarRequest, ReferralRequest,
-                   create_tables, get_db)
+                   BatchGenerateRequest, CalendarCreateRequest, create_tables, get_db)
 
 # Modèles Web3
 class WalletConnectRequest(BaseModel):
@@ -25,15 +27,70 @@ class TokenMintRequest(BaseModel):
     reason: str
 from stripe_config import create_checkout_session, verify_payment, STRIPE_PLANS
 from email_service import email_service
+from email_outbox import outbox_worker
+from activity_tracker import activity_tracker
 from web3_service import web3_service
-from datetime import timedelta, datetime
+from job_service import job_service, SAAS_GENERATION_COST, IMAGE_GENERATION_COST
+from media_store import media_store, parse_byte_range
+from batch_service import batch_service
+from calendar_service import calendar_service
+from scheduler import Interval, scheduler
+from automation_service import automation_service
+from leader import leader_election
+from http_client import http_client
+from interpolation import TemplateError, compile_template, template_variables
+from contextlib import asynccontextmanager
+from typing import Dict
+from datetime import timedelta, datetime, date
 from jose import JWTError, jwt
+import asyncio
+import json
 import os
 
 # Créer les tables au démarrage
 create_tables()
 
+STALE_JOBS_SWEEP_ID = "jobs:resume_stale"
+
+async def start_scheduled_work():
+    """Le worker vient d'être élu leader : recharge les automatisations et démarre le planificateur"""
+    await asyncio.to_thread(automation_service.load_scheduled_automations)
+    scheduler.start()
+
+async def stop_scheduled_work():
+    await scheduler.stop()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Reprend les jobs de génération interrompus par un redémarrage, puis périodiquement
+    # (par le leader) ceux abandonnés par un worker tombé pendant que les autres tournent
+    job_service.resume_interrupted_jobs()
+    scheduler.add_job(STALE_JOBS_SWEEP_ID, job_service.resume_interrupted_jobs, Interval(settings.JOB_SWEEP_SECONDS))
+    # Envoie les emails en attente dans l'outbox (y compris ceux d'avant le redémarrage). Tourne sur
+    # chaque worker : la réservation par UPDATE conditionnel empêche un double envoi.
+    outbox_worker.start()
+    activity_tracker.start()
+
+    # Démarrer l'automatisation des emails
+    try:
+        from email_scheduler import start_email_automation
+        start_email_automation()
+    except ImportError:
+        print("⚠️ Module email_scheduler non trouvé - emails automatiques désactivés")
+    # Tâches planifiées exécutées par un seul worker (le leader)
+    leader_election.start(start_scheduled_work, stop_scheduled_work)
+
+    yield
+
+    await leader_election.stop()
+    # Écrit les dernières activités avant l'arrêt
+    await activity_tracker.stop()
+    await outbox_worker.stop()
+    await http_client.aclose()
+    job_service.shutdown()
+
 app = FastAPI(
+    lifespan=lifespan,
     title="SmartSaaS API",
     version="1.0.0",
     description="""
@@ -62,18 +119,11 @@ app = FastAPI(
     }
 )
 
-# Démarrer l'automatisation des emails
-try:
-    from email_scheduler import start_email_automation
-    start_email_automation()
-except ImportError:
-    print("⚠️ Module email_scheduler non trouvé - emails automatiques désactivés")
-
 from config import settings
-from middleware import SecurityMiddleware, LoggingMiddleware
+from middleware import SecurityMiddleware, LoggingMiddleware, DBSessionMiddleware
 
 # Ajouter les middlewares de sécurité
-app.add_middleware(SecurityMiddleware, rate_limit=100)
+app.add_middleware(SecurityMiddleware, rate_limit=settings.RATE_LIMIT)
 app.add_middleware(LoggingMiddleware)
 
 app.add_middleware(
@@ -84,6 +134,9 @@ app.add_middleware(
     allow_headers=["Authorization", "Content-Type"],
 )
 
+# Session de base de données isolée par requête (ajouté en dernier = middleware le plus externe)
+app.add_middleware(DBSessionMiddleware)
+
 # Configuration JWT
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here")
 ALGORITHM = "HS256"
@@ -91,6 +144,9 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
 security = HTTPBearer()
 
+# Intervalle de rafraîchissement du flux SSE des jobs
+JOB_EVENTS_POLL_SECONDS = 1.0
+
 # Récompenses en jetons SaaS
 TOKEN_REWARDS = {
     "daily_login": 1,
@@ -131,8 +187,14 @@ def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(securit
     user = db_service.get_user_by_email(email)
     if user is None:
         raise credentials_exception
+    activity_tracker.touch(user.id)
     return user
 
+def get_admin_user(current_user = Depends(get_current_user)):
+    if current_user.email != "admin@smartsaas.com":
+        raise HTTPException(status_code=403, detail="Accès admin requis")
+    return current_user
+
 def calculate_level(total_earned: int) -> dict:
     """Calcule le niveau basé sur les jetons gagnés"""
     levels = [
@@ -160,16 +222,12 @@ def register(user_data: UserCreate):
     if existing_user:
         raise HTTPException(status_code=400, detail="Email déjà utilisé")
     
+    # Email de bienvenue validé dans la même transaction que l'utilisateur
+    db_service.queue_email(user_data.email, "welcome_email", {"user_email": user_data.email}, commit=False)
     user = db_service.create_user(user_data.email, user_data.password)
+    outbox_worker.wake()
     access_token = create_access_token(data={"sub": user.email})
     
-    # Envoyer l'email de bienvenue
-    try:
-        email_service.send_welcome_email(user.email)
-        print(f"Email de bienvenue envoyé à {user.email}")
-    except Exception as e:
-        print(f"Erreur envoi email bienvenue: {e}")
-    
     return {
         "access_token": access_token,
         "token_type": "bearer",
@@ -189,6 +247,7 @@ def login(user_data: UserCreate):
             status_code=401,
             detail="Email ou mot de passe incorrect"
         )
+    activity_tracker.touch(user.id)
     
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
@@ -221,7 +280,7 @@ def generate(prompt: PromptRequest, current_user = Depends(get_current_user)):
     if current_user.credits <= 0:
         raise HTTPException(status_code=403, detail="Crédits insuffisants")
     
-    response = generate_text(prompt.prompt)
+    response = generate_text(prompt.prompt, plan=current_user.plan)
     db_service.spend_credits(current_user.id, 1)
     
     # Récompenser la première génération de la journée
@@ -233,12 +292,57 @@ def generate(prompt: PromptRequest, current_user = Depends(get_current_user)):
         "credits_left": current_user.credits - 1
     }
 
+@app.post("/generate/batch")
+def generate_batch(request: BatchGenerateRequest, current_user = Depends(get_current_user)):
+    """Génère un lot de contenus (texte ou marketing) et renvoie les résultats en NDJSON"""
+    if not request.items:
+        raise HTTPException(status_code=400, detail="Aucun élément à générer")
+    if len(request.items) > settings.BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Maximum {settings.BATCH_MAX_ITEMS} éléments par lot")
+    
+    try:
+        cost = batch_service.estimate_cost(request.items)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # Une seule réservation pour tout le lot, ajustée à la fin selon les éléments réussis
+    transaction_id = db_service.reserve_credits(
+        current_user.id, cost, "batch_generation",
+        f"Génération groupée ({len(request.items)} éléments)"
+    )
+    if transaction_id is None:
+        raise HTTPException(status_code=403, detail=f"Crédits insuffisants ({cost} requis)")
+    
+    return StreamingResponse(
+        batch_service.stream_batch(current_user.id, request.items, transaction_id, plan=current_user.plan),
+        media_type="application/x-ndjson"
+    )
+
 @app.post("/generate-image")
 def generate_image_endpoint(request: ImageRequest, current_user = Depends(get_current_user)):
     """Génère une image avec DALL-E"""
     if current_user.credits < 3:
         raise HTTPException(status_code=403, detail="Crédits insuffisants (3 requis)")
 
+    if request.async_job:
+        # Débit à la soumission, restitution si le job échoue
+        if not db_service.spend_credits(current_user.id, IMAGE_GENERATION_COST):
+            raise HTTPException(status_code=403, detail="Crédits insuffisants (3 requis)")
+        
+        job = job_service.submit(current_user.id, "image", {
+            "prompt": request.prompt,
+            "size": request.size,
+            "quality": request.quality
+        })
+        return JSONResponse(status_code=202, content={
+            "success": True,
+            "job_id": job["job_id"],
+            "status": job["status"],
+            "poll_url": f"/ai/jobs/{job['job_id']}",
+            "events_url": f"/ai/jobs/{job['job_id']}/events",
+            "credits_left": current_user.credits  # Déjà débité ci-dessus
+        })
+
     result = generate_image(request.prompt, request.size, request.quality)
     if result["success"]:
         db_service.spend_credits(current_user.id, 3)
@@ -246,6 +350,39 @@ def generate_image_endpoint(request: ImageRequest, current_user = Depends(get_cu
     else:
         raise HTTPException(status_code=400, detail=result["error"])
 
+@app.get("/media/{content_hash}")
+def get_media(content_hash: str, request: Request):
+    """Sert un média stocké (adressé par contenu, donc immuable) avec support des plages"""
+    info = media_store.open_info(content_hash)
+    if info is None:
+        raise HTTPException(status_code=404, detail="Média non trouvé")
+    path, file_size, mime_type = info
+    
+    headers = {
+        "ETag": f'"{content_hash}"',
+        "Cache-Control": f"public, max-age={settings.MEDIA_CACHE_MAX_AGE}, immutable",
+        "Accept-Ranges": "bytes"
+    }
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    
+    range_header = request.headers.get("range")
+    if range_header and request.headers.get("if-range", headers["ETag"]) == headers["ETag"]:
+        try:
+            byte_range = parse_byte_range(range_header, file_size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{file_size}"})
+        if byte_range:
+            start, end = byte_range
+            with open(path, "rb") as media_file:
+                media_file.seek(start)
+                content = media_file.read(end - start + 1)
+            return Response(content=content, status_code=206, media_type=mime_type, headers={
+                **headers, "Content-Range": f"bytes {start}-{end}/{file_size}"
+            })
+    
+    return FileResponse(path, media_type=mime_type, headers=headers)
+
 @app.post("/generate-marketing-content")
 def generate_marketing_endpoint(request: MarketingRequest, current_user = Depends(get_current_user)):
     """Génère du contenu marketing complet"""
@@ -272,6 +409,46 @@ def generate_calendar_endpoint(request: CalendarRequest, current_user = Depends(
     else:
         raise HTTPException(status_code=400, detail=result["error"])
 
+@app.post("/calendars")
+def create_calendar(request: CalendarCreateRequest, current_user = Depends(get_current_user)):
+    """Génère un calendrier de contenu structuré, renvoyé semaine par semaine en NDJSON"""
+    if not 1 <= request.duration_days <= settings.CALENDAR_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"Durée entre 1 et {settings.CALENDAR_MAX_DAYS} jours")
+    if not db_service.spend_credits(current_user.id, 10):
+        raise HTTPException(status_code=403, detail="Crédits insuffisants (10 requis)")
+    
+    calendar = db_service.create_content_calendar(
+        current_user.id, request.business_type, request.duration_days, request.start_date or date.today()
+    )
+    return StreamingResponse(
+        calendar_service.stream_calendar(calendar),
+        media_type="application/x-ndjson"
+    )
+
+@app.get("/calendars/{calendar_id}")
+def get_calendar(calendar_id: int, current_user = Depends(get_current_user)):
+    """Métadonnées d'un calendrier de contenu"""
+    calendar = db_service.get_content_calendar(calendar_id, current_user.id)
+    if not calendar:
+        raise HTTPException(status_code=404, detail="Calendrier non trouvé")
+    return calendar
+
+@app.get("/calendars/{calendar_id}/entries")
+def get_calendar_entries(calendar_id: int, after_day: int = -1, limit: int = Query(50, ge=1, le=500),
+                         current_user = Depends(get_current_user)):
+    """Entrées d'un calendrier, paginées par jour (after_day = dernier day_index reçu)"""
+    calendar = db_service.get_content_calendar(calendar_id, current_user.id)
+    if not calendar:
+        raise HTTPException(status_code=404, detail="Calendrier non trouvé")
+    
+    entries = db_service.get_calendar_entries(calendar_id, after_day, limit)
+    return {
+        "calendar_id": calendar_id,
+        "status": calendar["status"],
+        "entries": entries,
+        "next_after_day": entries[-1]["day_index"] if len(entries) == limit else None
+    }
+
 @app.get("/tokens/balance")
 def get_token_balance(current_user = Depends(get_current_user)):
     """Récupère le solde de jetons SaaS de l'utilisateur"""
@@ -288,26 +465,22 @@ def get_token_balance(current_user = Depends(get_current_user)):
 @app.post("/tokens/daily-reward")
 def claim_daily_reward(current_user = Depends(get_current_user)):
     """Réclame la récompense quotidienne"""
+    new_balance = db_service.get_user_saas_tokens(current_user.id)["balance"] + TOKEN_REWARDS["daily_login"]
+
+    # Notification email validée avec la récompense (même transaction)
+    db_service.queue_email(current_user.email, "token_reward", {
+        "reward_amount": TOKEN_REWARDS["daily_login"],
+        "reason": "Récompense quotidienne",
+        "new_balance": new_balance
+    }, commit=False)
     db_service.add_saas_tokens(current_user.id, TOKEN_REWARDS["daily_login"], 
                               "daily_login", "Connexion quotidienne")
-    
-    tokens_data = db_service.get_user_saas_tokens(current_user.id)
-    
-    # Envoyer notification email pour la récompense
-    try:
-        email_service.send_token_reward_notification(
-            current_user.email, 
-            TOKEN_REWARDS["daily_login"], 
-            "Récompense quotidienne", 
-            tokens_data["balance"]
-        )
-    except Exception as e:
-        print(f"Erreur notification email: {e}")
+    outbox_worker.wake()
     
     return {
         "success": True,
         "reward": TOKEN_REWARDS["daily_login"],
-        "new_balance": tokens_data["balance"],
+        "new_balance": new_balance,
         "message": f"Vous avez gagné {TOKEN_REWARDS['daily_login']} jetons SaaS !"
     }
 
@@ -330,18 +503,16 @@ def get_referral_data(current_user = Depends(get_current_user)):
 @app.post("/tokens/refer")
 def refer_user(referral: ReferralRequest, current_user = Depends(get_current_user)):
     """Traite un nouveau parrainage"""
-    result = db_service.process_referral(current_user.id, referral.referred_email)
+    result = db_service.process_referral(current_user.id, referral.referred_email, commit=False)
 
     if result["success"]:
-        # Envoyer notification email de parrainage réussi
-        try:
-            email_service.send_referral_success(
-                current_user.email, 
-                referral.referred_email, 
-                result["referrer_reward"]
-            )
-        except Exception as e:
-            print(f"Erreur notification parrainage: {e}")
+        # Notification email validée avec la récompense (même transaction), envoyée par le worker outbox
+        db_service.queue_email(current_user.email, "referral_success", {
+            "referred_email": referral.referred_email,
+            "reward": result["referrer_reward"]
+        }, commit=False)
+        db_service.db.commit()
+        outbox_worker.wake()
         
         return {
             "success": True,
@@ -488,12 +659,8 @@ def get_transaction_status(tx_hash: str):
     return web3_service.get_transaction_status(tx_hash)
 
 @app.post("/web3/admin/mint")
-def admin_mint_tokens(request: TokenMintRequest, current_user = Depends(get_current_user)):
+def admin_mint_tokens(request: TokenMintRequest, current_user = Depends(get_admin_user)):
     """Mint des jetons (admin seulement)"""
-    # Vérifier que l'utilisateur est admin (à implémenter)
-    if current_user.email != "admin@smartsaas.com":
-        raise HTTPException(status_code=403, detail="Accès admin requis")
-    
     if not web3_service.is_connected():
         raise HTTPException(status_code=503, detail="Service blockchain indisponible")
     
@@ -633,7 +800,7 @@ def get_available_rewards():
 def send_welcome_email_manual(email: str, current_user = Depends(get_current_user)):
     """Envoie manuellement un email de bienvenue (admin)"""
     try:
-        result = email_service.send_welcome_email(email)
+        result = email_service.run(email_service.send_welcome_email(email))
         return result
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -642,7 +809,7 @@ def send_welcome_email_manual(email: str, current_user = Depends(get_current_use
 def send_reminder_manual(current_user = Depends(get_current_user)):
     """Envoie un rappel manuel à l'utilisateur"""
     try:
-        result = email_service.send_daily_reminder(current_user.email, current_user.credits)
+        result = email_service.run(email_service.send_daily_reminder(current_user.email, current_user.credits))
         return result
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -685,6 +852,7 @@ class SaasGenerationRequest(BaseModel):
     prompt: str
     target_audience: str = ""
     tech_stack: str = ""
+    async_job: bool = False  # Retourne immédiatement un job_id au lieu d'attendre la génération
 
 @app.post("/ai/generate-saas-idea")
 def generate_saas_idea_endpoint(request: SaasGenerationRequest, current_user = Depends(get_current_user)):
@@ -692,19 +860,40 @@ def generate_saas_idea_endpoint(request: SaasGenerationRequest, current_user = D
     if current_user.credits < 15:
         raise HTTPException(status_code=403, detail="Crédits insuffisants (15 requis)")
     
+    if request.async_job:
+        # Les crédits sont débités à la soumission et restitués si le job échoue
+        if not db_service.spend_credits(current_user.id, SAAS_GENERATION_COST):
+            raise HTTPException(status_code=403, detail="Crédits insuffisants (15 requis)")
+        
+        job = job_service.submit(current_user.id, "saas_idea", {
+            "prompt": request.prompt,
+            "target_audience": request.target_audience,
+            "tech_stack": request.tech_stack,
+            "plan": current_user.plan
+        })
+        return JSONResponse(status_code=202, content={
+            "success": True,
+            "job_id": job["job_id"],
+            "status": job["status"],
+            "poll_url": f"/ai/jobs/{job['job_id']}",
+            "events_url": f"/ai/jobs/{job['job_id']}/events",
+            "credits_left": current_user.credits  # Déjà débité ci-dessus
+        })
+    
     from ai_service import ai_service
     
     # Générer l'idée SaaS
-    saas_idea = ai_service.generate_saas_idea(request.prompt, request.target_audience, request.tech_stack)
+    saas_idea = ai_service.generate_saas_idea(request.prompt, request.target_audience, request.tech_stack,
+                                              plan=current_user.plan)
     
     if not saas_idea["success"]:
         raise HTTPException(status_code=400, detail=saas_idea["error"])
     
     # Générer la structure de code
-    code_structure = ai_service.generate_code_structure(saas_idea["saas_idea"])
+    code_structure = ai_service.generate_code_structure(saas_idea["saas_idea"], plan=current_user.plan)
     
     # Générer la stratégie marketing
-    marketing_strategy = ai_service.generate_marketing_strategy(saas_idea["saas_idea"])
+    marketing_strategy = ai_service.generate_marketing_strategy(saas_idea["saas_idea"], plan=current_user.plan)
     
     # Sauvegarder en base
     saas_data = {
@@ -732,16 +921,80 @@ def generate_saas_idea_endpoint(request: SaasGenerationRequest, current_user = D
         "credits_left": current_user.credits - 15
     }
 
+@app.get("/ai/metrics")
+def get_ai_metrics(current_user = Depends(get_admin_user)):
+    """État des disjoncteurs et compteurs des appels IA (admin)"""
+    from ai_service import ai_service
+    return ai_service.get_metrics()
+
+def _get_user_job(job_id: str, user_id: int) -> dict:
+    job = job_service.get_job(job_id)
+    if not job or job["user_id"] != user_id:
+        raise HTTPException(status_code=404, detail="Job non trouvé")
+    return job
+
+@app.get("/ai/jobs/{job_id}")
+def get_generation_job(job_id: str, current_user = Depends(get_current_user)):
+    """État et résultats intermédiaires d'un job de génération"""
+    job = _get_user_job(job_id, current_user.id)
+    return job_service.public_view(job)
+
+@app.get("/ai/jobs/{job_id}/events")
+async def stream_generation_job(job_id: str, current_user = Depends(get_current_user)):
+    """Progression d'un job de génération en Server-Sent Events"""
+    job = await run_in_threadpool(_get_user_job, job_id, current_user.id)
+    
+    async def event_stream():
+        last_state = None
+        current = job
+        while True:
+            view = job_service.public_view(current)
+            partial = view["partial"] or {}
+            # Nouvel événement à chaque étape terminée et à chaque champ JSON reçu en flux
+            state = (view["status"], tuple(view["stages_completed"]),
+                     partial.get("stage"), tuple(partial.get("fields", {})))
+            if state != last_state:
+                last_state = state
+                yield f"event: progress\ndata: {json.dumps(view)}\n\n"
+            
+            if view["status"] in ("completed", "failed"):
+                yield f"event: done\ndata: {json.dumps({'status': view['status']})}\n\n"
+                return
+            
+            await asyncio.sleep(JOB_EVENTS_POLL_SECONDS)
+            current = await run_in_threadpool(job_service.get_job, job_id)
+            if current is None:
+                return
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/ai/my-saas")
-def get_my_generated_saas(current_user = Depends(get_current_user)):
-    """Récupère tous les SaaS générés par l'utilisateur"""
-    saas_list = db_service.get_user_generated_saas(current_user.id)
-    return {"saas_list": saas_list}
+def get_my_generated_saas(before: str = None, limit: int = Query(50, ge=1, le=200),
+                          current_user = Depends(get_current_user)):
+    """SaaS générés par l'utilisateur, paginés du plus récent au plus ancien (before = next_before reçu)"""
+    cursor = None
+    if before:
+        try:
+            created_at, _, saas_id = before.rpartition(",")
+            cursor = (datetime.fromisoformat(created_at), int(saas_id))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Curseur invalide")
+    
+    saas_list = db_service.get_user_generated_saas(current_user.id, cursor, limit)
+    last = saas_list[-1] if len(saas_list) == limit else None
+    return {
+        "saas_list": saas_list,
+        "next_before": f"{last['created_at'].isoformat()},{last['id']}" if last else None
+    }
 
 @app.get("/ai/saas/{saas_id}")
 def get_saas_details(saas_id: int, current_user = Depends(get_current_user)):
     """Récupère les détails d'un SaaS généré"""
-    saas_data = db_service.get_generated_saas_by_id(saas_id)
+    saas_data = db_service.get_generated_saas_by_id(saas_id, current_user.id)
     if not saas_data:
         raise HTTPException(status_code=404, detail="SaaS non trouvé")
     return saas_data
@@ -755,8 +1008,6 @@ class AutomationRequest(BaseModel):
 @app.post("/automation/create")
 def create_automation_endpoint(request: AutomationRequest, current_user = Depends(get_current_user)):
     """Crée une nouvelle automatisation"""
-    from automation_service import automation_service
-    
     result = automation_service.create_automation(current_user.id, request.name, request.config)
     
     if result["success"]:
@@ -772,13 +1023,24 @@ def get_user_automations_endpoint(current_user = Depends(get_current_user)):
     return {"automations": automations}
 
 @app.post("/automation/run/{automation_id}")
-def run_automation_manually(automation_id: str, current_user = Depends(get_current_user)):
+async def run_automation_manually(automation_id: str, current_user = Depends(get_current_user)):
     """Exécute manuellement une automatisation"""
-    from automation_service import automation_service
+    automation = await run_in_threadpool(db_service.get_automation, automation_id)
+    if not automation or automation["user_id"] != current_user.id:
+        raise HTTPException(status_code=404, detail="Automatisation non trouvée")
     
-    result = automation_service.run_automation(automation_id)
+    result = await automation_service.run_automation(automation_id)
     return result
 
+@app.get("/automation/{automation_id}/runs")
+def get_automation_runs_endpoint(automation_id: str, limit: int = Query(20, ge=1, le=100),
+                                 current_user = Depends(get_current_user)):
+    """Historique des exécutions d'une automatisation"""
+    automation = db_service.get_automation(automation_id)
+    if not automation or automation["user_id"] != current_user.id:
+        raise HTTPException(status_code=404, detail="Automatisation non trouvée")
+    return {"runs": db_service.get_automation_runs(automation_id, limit)}
+
 @app.get("/automation/templates")
 def get_automation_templates():
     """Retourne des templates d'automatisation"""
@@ -830,6 +1092,7 @@ def get_automation_templates():
             "description": "Suit automatiquement les nouveaux prospects",
             "config": {
                 "trigger": {"type": "webhook", "url": "/webhook/new-lead"},
+                "variables": {"lead_email": "", "crm_webhook": "https://crm.example.com/webhook"},
                 "actions": [
                     {
                         "type": "send_email",
@@ -858,9 +1121,20 @@ class CampaignRequest(BaseModel):
     content: str = ""
     config: dict = {}
 
+# Variables toujours disponibles dans les templates de campagne
+CAMPAIGN_VARIABLES = ("user_email", "date", "target_audience")
+
 @app.post("/campaigns/create")
 def create_campaign_endpoint(request: CampaignRequest, current_user = Depends(get_current_user)):
     """Crée une nouvelle campagne marketing"""
+    # Variables inconnues rejetées dès la création
+    config = {key: value for key, value in request.config.items() if key != "variables"}
+    try:
+        compile_template({"content": request.content, "config": config},
+                         set(CAMPAIGN_VARIABLES).union(request.config.get("variables") or {}))
+    except TemplateError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
     campaign_data = {
         "name": request.name,
         "type": request.type,
@@ -910,8 +1184,28 @@ def get_campaign_templates():
             }
         }
     ]
+    for template in templates:
+        template["variables"] = template_variables(template["template"])
     return {"templates": templates}
 
+class CampaignPreviewRequest(BaseModel):
+    template: Dict[str, str]  # Ex. {"subject": ..., "content": ...}
+    variables: dict = {}
+
+@app.post("/campaigns/preview")
+def preview_campaign(request: CampaignPreviewRequest, current_user = Depends(get_current_user)):
+    """Rend un template de campagne avec les variables fournies"""
+    context = {
+        "user_email": current_user.email,
+        "date": datetime.now().strftime("%d/%m/%Y"),
+        **request.variables
+    }
+    try:
+        # Textes fournis par l'utilisateur : compilés pour cet aperçu seulement, jamais mémoïsés
+        return {"rendered": compile_template(request.template).render(context)}
+    except TemplateError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 # === DASHBOARD ANALYTICS ===
 
 @app.get("/dashboard/analytics")
@@ -923,7 +1217,7 @@ def get_dashboard_analytics(current_user = Depends(get_current_user)):
     level_data = calculate_level(tokens_data["total_earned"])
     
     # Statistiques des SaaS générés
-    saas_count = len(db_service.get_user_generated_saas(current_user.id))
+    saas_count = db_service.count_user_generated_saas(current_user.id)
     
     # Statistiques des automatisations
     automations = db_service.get_user_automations(current_user.id)
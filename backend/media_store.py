@@ -0,0 +1,133 @@
+import hashlib
+import httpx
+import io
+import os
+import re
+import tempfile
+from typing import Optional, Tuple
+from logger import logger
+from config import settings
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+    logger.warning("Pillow non installé - miniatures désactivées")
+
+HASH_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+# Signatures des formats d'image servis
+MAGIC_NUMBERS = [
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF8", "image/gif")
+]
+
+def normalize_prompt_hash(prompt: str, size: str, quality: str) -> str:
+    """Empreinte d'une demande d'image : même prompt (casse et espaces ignorés) = même image"""
+    normalized = " ".join(prompt.lower().split())
+    return hashlib.sha256(f"{size}|{quality}|{normalized}".encode("utf-8")).hexdigest()
+
+def guess_mime_type(header: bytes) -> str:
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "image/webp"
+    for magic, mime_type in MAGIC_NUMBERS:
+        if header.startswith(magic):
+            return mime_type
+    return "application/octet-stream"
+
+def parse_byte_range(range_header: str, file_size: int):
+    """(début, fin) inclusifs d'un en-tête Range à plage unique, None si ignoré, ValueError si hors limites"""
+    unit, _, spec = range_header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        return None  # Plages multiples : on sert le fichier complet
+    start_text, _, end_text = spec.strip().partition("-")
+    if not start_text:
+        length = int(end_text)
+        if length <= 0 or file_size == 0:
+            raise ValueError("Plage vide")
+        return max(file_size - length, 0), file_size - 1
+    start = int(start_text)
+    end = min(int(end_text), file_size - 1) if end_text else file_size - 1
+    if start >= file_size or start > end:
+        raise ValueError("Plage hors limites")
+    return start, end
+
+class MediaStore:
+    """Stockage local adressé par contenu (sha256), écritures atomiques et idempotentes"""
+
+    def __init__(self, root: str = None):
+        self.root = root or settings.MEDIA_ROOT
+
+    def path_for(self, content_hash: str) -> str:
+        if not HASH_PATTERN.match(content_hash):
+            raise ValueError("Empreinte de média invalide")
+        return os.path.join(self.root, content_hash[:2], content_hash[2:4], content_hash)
+
+    def exists(self, content_hash: str) -> bool:
+        return os.path.exists(self.path_for(content_hash))
+
+    def put(self, data: bytes) -> str:
+        """Écrit le contenu s'il n'existe pas déjà et retourne son empreinte"""
+        content_hash = hashlib.sha256(data).hexdigest()
+        path = self.path_for(content_hash)
+        if os.path.exists(path):
+            return content_hash
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as tmp_file:
+                tmp_file.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return content_hash
+
+    def download(self, url: str, max_bytes: int = None) -> Tuple[str, bytes]:
+        """Télécharge un média (taille bornée) dans le stockage et retourne (empreinte, contenu)"""
+        max_bytes = max_bytes or settings.IMAGE_DOWNLOAD_MAX_BYTES
+        chunks = []
+        received = 0
+        with httpx.stream("GET", url, timeout=settings.IMAGE_DOWNLOAD_TIMEOUT, follow_redirects=True) as response:
+            response.raise_for_status()
+            for chunk in response.iter_bytes():
+                received += len(chunk)
+                if received > max_bytes:
+                    raise ValueError(f"Image trop volumineuse (> {max_bytes} octets)")
+                chunks.append(chunk)
+
+        data = b"".join(chunks)
+        return self.put(data), data
+
+    def open_info(self, content_hash: str) -> Optional[Tuple[str, int, str]]:
+        """(chemin, taille, type MIME) d'un média stocké, None s'il est absent"""
+        try:
+            path = self.path_for(content_hash)
+        except ValueError:
+            return None
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as media_file:
+            header = media_file.read(16)
+        return path, os.path.getsize(path), guess_mime_type(header)
+
+    def make_thumbnail(self, data: bytes, max_size: int = None) -> Optional[str]:
+        """Crée une miniature WebP (Pillow optionnel) et retourne son empreinte"""
+        if Image is None:
+            return None
+        max_size = max_size or settings.IMAGE_THUMBNAIL_SIZE
+        try:
+            with Image.open(io.BytesIO(data)) as image:
+                image.thumbnail((max_size, max_size))
+                output = io.BytesIO()
+                image.save(output, format="WEBP", quality=80)
+            return self.put(output.getvalue())
+        except Exception as e:
+            logger.error(f"Erreur création miniature: {e}")
+            return None
+
+# Instance globale
+media_store = MediaStore()
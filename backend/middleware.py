@@ -6,6 +6,7 @@ import time
 from collections import defaultdict
 from datetime import datetime, timedelta
 import hashlib
+import uuid
 
 class SecurityMiddleware(BaseHTTPMiddleware):
     def __init__(self, app, rate_limit: int = 100):
@@ -57,3 +58,23 @@ class LoggingMiddleware(BaseHTTPMiddleware):
         )
         
         return response
+
+class DBSessionMiddleware:
+    """Isole la session SQLAlchemy de chaque requête et la libère à la fin de la réponse"""
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        from models import ScopedSession, request_session_scope
+        token = request_session_scope.set(uuid.uuid4().hex)
+        try:
+            # Middleware ASGI pur : couvre aussi le corps des réponses en streaming
+            await self.app(scope, receive, send)
+        finally:
+            ScopedSession.remove()
+            request_session_scope.reset(token)
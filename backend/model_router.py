@@ -0,0 +1,173 @@
+import math
+import textwrap
+import threading
+from collections import defaultdict, deque
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional
+from logger import logger
+from config import settings
+
+# Niveaux de modèles, du plus rapide/économique au plus capable
+MODEL_TIERS = {
+    "fast": {"model": settings.AI_MODEL_FAST, "context_window": 128000, "max_output": 16384},
+    "standard": {"model": settings.AI_MODEL_STANDARD, "context_window": 128000, "max_output": 16384},
+    "premium": {"model": settings.AI_MODEL_PREMIUM, "context_window": 8192, "max_output": 4096}
+}
+
+# Taille de sortie attendue et niveau de modèle par tâche et par plan
+TASK_PROFILES = {
+    "saas_idea": {
+        "expected_output_tokens": 700,
+        "tiers": {"free": "fast", "starter": "standard", "pro": "standard", "business": "premium"}
+    },
+    "code_structure": {
+        "expected_output_tokens": 1600,
+        "tiers": {"free": "standard", "starter": "standard", "pro": "premium", "business": "premium"}
+    },
+    "marketing_strategy": {
+        "expected_output_tokens": 900,
+        "tiers": {"free": "fast", "starter": "fast", "pro": "standard", "business": "standard"}
+    },
+    "text": {
+        "expected_output_tokens": 350,
+        "tiers": {"free": "fast", "starter": "fast", "pro": "fast", "business": "standard"}
+    }
+}
+
+OUTPUT_HEADROOM = 1.25  # Marge appliquée à la taille de sortie attendue
+CONTEXT_MARGIN = 64  # Tokens réservés au formatage des messages
+ADAPTIVE_MIN_SAMPLES = 50  # Échantillons requis avant d'ajuster le budget sur l'observé
+
+@lru_cache(maxsize=1)
+def _get_encoder():
+    """Charge une seule fois l'encodeur tiktoken (optionnel)"""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        logger.warning(f"tiktoken indisponible, estimation approximative des tokens: {e}")
+        return None
+
+@lru_cache(maxsize=4096)
+def count_tokens(text: str) -> int:
+    """Nombre de tokens d'un texte (mis en cache pour les prompts récurrents)"""
+    encoder = _get_encoder()
+    if encoder is not None:
+        return len(encoder.encode(text))
+    # Heuristique : ~4 caractères par token pour du texte latin
+    return max(math.ceil(len(text) / 4), 1)
+
+class StaticMessage(dict):
+    """Message invariant (prompt système) : contenu normalisé et nombre de tokens calculé une seule fois"""
+
+    def __init__(self, role: str, content: str):
+        super().__init__(role=role, content=textwrap.dedent(content).strip())
+        self._token_count = None
+
+    @property
+    def token_count(self) -> int:
+        if self._token_count is None:
+            self._token_count = count_tokens(self["content"])
+        return self._token_count
+
+def count_message_tokens(messages: List[Dict]) -> int:
+    # ~4 tokens de structure par message (rôle, séparateurs)
+    total = 2
+    for message in messages:
+        tokens = message.token_count if isinstance(message, StaticMessage) else count_tokens(message["content"])
+        total += tokens + 4
+    return total
+
+@dataclass
+class RouteDecision:
+    task: str
+    tier: str
+    model: str
+    prompt_tokens: int
+    max_tokens: int
+
+class ModelRouter:
+    def __init__(self, enabled: bool = None, default_model: str = "gpt-4", default_max_tokens: int = 1500):
+        self.enabled = settings.AI_MODEL_ROUTING if enabled is None else enabled
+        self.default_model = default_model
+        self.default_max_tokens = default_max_tokens
+        self.stats = defaultdict(lambda: {
+            "calls": 0,
+            "prompt_tokens_estimated": 0,
+            "prompt_tokens": 0,
+            "cached_prompt_tokens": 0,
+            "completion_tokens": 0,
+            "budget_tokens": 0,
+            "truncated": 0
+        })
+        self.recent_completions = defaultdict(lambda: deque(maxlen=500))
+        self._lock = threading.Lock()
+
+    def expected_output_tokens(self, task: str) -> int:
+        """Taille de sortie attendue : profil statique, puis p95 observé quand assez d'échantillons"""
+        expected = TASK_PROFILES[task]["expected_output_tokens"]
+        with self._lock:
+            samples = sorted(self.recent_completions[task])
+        if len(samples) >= ADAPTIVE_MIN_SAMPLES:
+            expected = samples[min(int(0.95 * len(samples)), len(samples) - 1)]
+        return expected
+
+    def route(self, task: str, plan: str, messages: List[Dict]) -> RouteDecision:
+        prompt_tokens = count_message_tokens(messages)
+        if not self.enabled or task not in TASK_PROFILES:
+            return RouteDecision(task, "default", self.default_model, prompt_tokens, self.default_max_tokens)
+
+        profile = TASK_PROFILES[task]
+        tier_name = profile["tiers"].get(plan or "free", profile["tiers"]["free"])
+        tier = MODEL_TIERS[tier_name]
+
+        # Un prompt trop long pour la fenêtre du niveau choisi bascule sur le niveau standard
+        if prompt_tokens + CONTEXT_MARGIN >= tier["context_window"] // 2 and tier_name == "premium":
+            tier_name, tier = "standard", MODEL_TIERS["standard"]
+
+        budget = math.ceil(self.expected_output_tokens(task) * OUTPUT_HEADROOM)
+        available = tier["context_window"] - prompt_tokens - CONTEXT_MARGIN
+        max_tokens = max(min(budget, tier["max_output"], available), 16)
+
+        return RouteDecision(task, tier_name, tier["model"], prompt_tokens, max_tokens)
+
+    def record_usage(self, decision: RouteDecision, usage, finish_reason: Optional[str] = None):
+        """Enregistre les tokens réels face au budget pour ajuster le routage"""
+        completion_tokens = getattr(usage, "completion_tokens", None) or 0
+        prompt_tokens = getattr(usage, "prompt_tokens", None) or 0
+        # Tokens du préfixe servis depuis le cache du fournisseur
+        cached_tokens = getattr(getattr(usage, "prompt_tokens_details", None), "cached_tokens", None) or 0
+        truncated = finish_reason == "length"
+
+        with self._lock:
+            stats = self.stats[(decision.task, decision.model)]
+            stats["calls"] += 1
+            stats["prompt_tokens_estimated"] += decision.prompt_tokens
+            stats["prompt_tokens"] += prompt_tokens
+            stats["cached_prompt_tokens"] += cached_tokens
+            stats["completion_tokens"] += completion_tokens
+            stats["budget_tokens"] += decision.max_tokens
+            stats["truncated"] += int(truncated)
+            # Une réponse tronquée aurait été plus longue : on pousse l'estimation vers le haut
+            observed = math.ceil(completion_tokens * OUTPUT_HEADROOM) if truncated else completion_tokens
+            self.recent_completions[decision.task].append(observed)
+
+        if truncated:
+            logger.warning(f"Réponse tronquée ({decision.task}, {decision.model}, max_tokens={decision.max_tokens})")
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            items = [(key, dict(value)) for key, value in self.stats.items()]
+
+        report = {}
+        for (task, model), stats in items:
+            calls = stats["calls"] or 1
+            report[f"{task}:{model}"] = {
+                **stats,
+                "avg_completion_tokens": round(stats["completion_tokens"] / calls, 1),
+                "avg_budget_tokens": round(stats["budget_tokens"] / calls, 1),
+                "prompt_cache_hit_ratio": round(stats["cached_prompt_tokens"] / stats["prompt_tokens"], 3) if stats["prompt_tokens"] else None,
+                "budget_utilization": round(stats["completion_tokens"] / stats["budget_tokens"], 3) if stats["budget_tokens"] else None
+            }
+        return report
@@ -1,9 +1,12 @@
 
 from pydantic import BaseModel, EmailStr
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime, Float, Text, ForeignKey
+from sqlalchemy import create_engine, inspect, text, Column, Integer, String, Boolean, DateTime, Date, Float, Text, LargeBinary, ForeignKey, Index, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
-from datetime import datetime
+from sqlalchemy.orm import sessionmaker, relationship, scoped_session, deferred
+from contextvars import ContextVar
+from datetime import datetime, date
+from typing import List, Optional
+import threading
 import os
 
 # Configuration de la base de données
@@ -26,6 +29,14 @@ engine = create_engine(
 )
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Une session par requête HTTP (DBSessionMiddleware), sinon une par thread
+request_session_scope = ContextVar("request_session_scope", default=None)
+
+def _current_session_scope():
+    return request_session_scope.get() or threading.get_ident()
+
+ScopedSession = scoped_session(SessionLocal, scopefunc=_current_session_scope)
 Base = declarative_base()
 
 # Modèles SQLAlchemy
@@ -42,10 +53,24 @@ class User(Base):
     referral_code = Column(String, unique=True, index=True)
     referred_by = Column(String, nullable=True)
     wallet_address = Column(String, nullable=True, index=True)
+    # Dernière activité, écrite en différé par ActivityTracker (précision : ACTIVITY_WRITE_INTERVAL_MINUTES)
+    last_active_at = Column(DateTime, default=datetime.utcnow)
     
     # Relations
     saas_tokens = relationship("SaasToken", back_populates="user")
-    referred_users = relationship("User", remote_side=[id], foreign_keys=[referred_by])
+    referred_users = relationship(
+        "User",
+        primaryjoin="User.referral_code == foreign(User.referred_by)",
+        remote_side=[referred_by],
+        viewonly=True
+    )
+
+    __table_args__ = (
+        # Utilisateurs inactifs (rappels quotidiens) : parcours par plage de (last_active_at, id)
+        Index("ix_users_last_active_at_id", "last_active_at", "id"),
+        # Filleuls d'un parrain inscrits sur une période (rapports hebdomadaires)
+        Index("ix_users_referred_by_created", "referred_by", "created_at"),
+    )
 
 class SaasToken(Base):
     __tablename__ = "saas_tokens"
@@ -60,6 +85,9 @@ class SaasToken(Base):
     # Relations
     user = relationship("User", back_populates="saas_tokens")
 
+    # Agrégats par utilisateur et par période (rapports hebdomadaires, lot par plage d'id)
+    __table_args__ = (Index("ix_saas_tokens_user_created", "user_id", "created_at"),)
+
 class Payment(Base):
     __tablename__ = "payments"
     
@@ -72,6 +100,174 @@ class Payment(Base):
     credits_added = Column(Integer, default=0)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+class CreditTransaction(Base):
+    __tablename__ = "credit_transactions"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    amount = Column(Integer, nullable=False)  # Crédits effectivement débités
+    reserved = Column(Integer, default=0)  # Crédits réservés avant exécution
+    transaction_type = Column(String, nullable=False)  # batch_generation, ...
+    status = Column(String, default="reserved")  # reserved, settled
+    description = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    settled_at = Column(DateTime, nullable=True)
+
+class GenerationJob(Base):
+    __tablename__ = "generation_jobs"
+    
+    id = Column(String, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    kind = Column(String, nullable=False)  # saas_idea, ...
+    status = Column(String, default="pending", index=True)  # pending, running, completed, failed
+    current_stage = Column(String, nullable=True)
+    payload = Column(Text, default="{}")  # Paramètres JSON de la requête
+    results = Column(Text, default="{}")  # Résultats JSON par étape terminée
+    error = Column(Text, nullable=True)
+    attempts = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+    __table_args__ = (Index("ix_generation_jobs_user_created", "user_id", "created_at"),)
+
+class ContentCalendar(Base):
+    __tablename__ = "content_calendars"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    business_type = Column(String, nullable=False)
+    duration_days = Column(Integer, nullable=False)
+    start_date = Column(Date, nullable=False)
+    status = Column(String, default="generating")  # generating, completed
+    entries_count = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class CalendarEntry(Base):
+    __tablename__ = "calendar_entries"
+
+    id = Column(Integer, primary_key=True, index=True)
+    calendar_id = Column(Integer, ForeignKey("content_calendars.id"), nullable=False)
+    day_index = Column(Integer, nullable=False)  # Jour depuis le début du calendrier (0 = premier jour)
+    post_date = Column(Date, nullable=False)
+    week_number = Column(Integer, nullable=False)
+    weekday = Column(String, nullable=False)
+    emoji = Column(String)
+    content = Column(Text, nullable=False)
+
+    # Pagination par (calendar_id, day_index)
+    __table_args__ = (Index("ix_calendar_entries_calendar_day", "calendar_id", "day_index"),)
+
+class ImageAsset(Base):
+    __tablename__ = "image_assets"
+
+    id = Column(Integer, primary_key=True, index=True)
+    prompt_hash = Column(String, unique=True, index=True, nullable=False)  # Déduplication des prompts
+    prompt = Column(Text, nullable=False)
+    size = Column(String, nullable=False)
+    quality = Column(String, nullable=False)
+    content_hash = Column(String, index=True, nullable=False)  # sha256 du fichier dans MEDIA_ROOT
+    thumbnail_hash = Column(String, nullable=True)
+    mime_type = Column(String, default="image/png")
+    byte_size = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class ImageGenerationClaim(Base):
+    __tablename__ = "image_generation_claims"
+
+    prompt_hash = Column(String, primary_key=True)  # Prompt en cours de génération
+    job_id = Column(String, nullable=False)  # Job qui appelle l'API d'images
+    claimed_at = Column(DateTime, default=datetime.utcnow)
+
+class GeneratedSaas(Base):
+    __tablename__ = "generated_saas"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    name = Column(String, nullable=False)
+    description = Column(Text)  # Résumé court affiché dans les listes
+    created_at = Column(DateTime, default=datetime.utcnow)
+    # Contenu complet (idée, structure de code, stratégie marketing) compressé, chargé à la demande
+    payload = deferred(Column(LargeBinary, nullable=False))
+    codec = Column(String, default="zlib")  # zstd, zlib
+    payload_size = Column(Integer, default=0)  # Taille non compressée en octets
+
+    __table_args__ = (Index("ix_generated_saas_user_created", "user_id", "created_at"),)
+
+class MailingRun(Base):
+    __tablename__ = "mailing_runs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    job = Column(String, nullable=False)  # daily_reminder, weekly_report
+    run_key = Column(String, nullable=False)  # Date ou semaine ISO de l'envoi
+    status = Column(String, default="running")  # running, completed, failed
+    cursor = Column(Text, nullable=True)  # Point de reprise : clé JSON du dernier destinataire traité
+    sent = Column(Integer, default=0)
+    failed = Column(Integer, default=0)
+    skipped = Column(Integer, default=0)
+    started_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    completed_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (UniqueConstraint("job", "run_key", name="uq_mailing_runs_job_run_key"),)
+
+class EmailOutbox(Base):
+    __tablename__ = "email_outbox"
+
+    id = Column(Integer, primary_key=True, index=True)
+    to_email = Column(String, nullable=False)
+    kind = Column(String, nullable=False)  # welcome_email, token_reward, referral_success
+    params = Column(Text, default="{}")  # Paramètres JSON du rendu
+    status = Column(String, default="pending")  # pending, sending, sent, dead
+    attempts = Column(Integer, default=0)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow)
+    locked_until = Column(DateTime, nullable=True)  # Bail du worker qui envoie
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
+
+    # Lecture des emails à envoyer par (status, next_attempt_at)
+    __table_args__ = (Index("ix_email_outbox_status_next_attempt", "status", "next_attempt_at"),)
+
+class Automation(Base):
+    __tablename__ = "automations"
+
+    id = Column(String, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    name = Column(String, nullable=False)
+    config = Column(Text, default="{}")  # Config JSON complète (déclencheur, actions)
+    trigger = Column(Text, nullable=True)  # Déclencheur JSON seul, lu à la reconstruction du planificateur
+    is_active = Column(Boolean, default=True)
+    next_run_at = Column(DateTime, nullable=True)  # Heure locale du serveur ; NULL = manuelle ou désactivée
+    last_run_at = Column(DateTime, nullable=True)
+    run_count = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, index=True)  # Dernière modification de la config
+
+    __table_args__ = (Index("ix_automations_next_run_at", "next_run_at"),)
+
+class AutomationRun(Base):
+    __tablename__ = "automation_runs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    automation_id = Column(String, ForeignKey("automations.id"), nullable=False)
+    source = Column(String, default="schedule")  # schedule, manual
+    status = Column(String, default="running")  # running, success, failed
+    results = Column(Text, default="[]")  # Résultats JSON par action
+    error = Column(Text, nullable=True)
+    started_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
+    # Historique d'une automatisation, du plus récent au plus ancien
+    __table_args__ = (Index("ix_automation_runs_automation_started", "automation_id", "started_at"),)
+
+class LeaderLease(Base):
+    __tablename__ = "leader_leases"
+
+    name = Column(String, primary_key=True)  # Rôle élu (ex. scheduler)
+    holder = Column(String, nullable=False)  # hôte:pid:id du worker leader
+    expires_at = Column(DateTime, nullable=False)
+    acquired_at = Column(DateTime, default=datetime.utcnow)
+
 # Modèles Pydantic pour les APIs
 class UserCreate(BaseModel):
     email: EmailStr
@@ -97,16 +293,32 @@ class ImageRequest(BaseModel):
     prompt: str
     size: str = "1024x1024"
     quality: str = "standard"
+    async_job: bool = False  # Retourne un job_id, l'image est stockée localement une fois prête
 
 class MarketingRequest(BaseModel):
     business_type: str
     target_audience: str
     platform: str
 
+class BatchItem(BaseModel):
+    type: str = "text"  # text, marketing
+    prompt: str = ""
+    business_type: str = ""
+    target_audience: str = ""
+    platform: str = ""
+
+class BatchGenerateRequest(BaseModel):
+    items: List[BatchItem]
+
 class CalendarRequest(BaseModel):
     business_type: str
     duration_days: int = 30
 
+class CalendarCreateRequest(BaseModel):
+    business_type: str
+    duration_days: int = 30
+    start_date: Optional[date] = None
+
 class PaymentRequest(BaseModel):
     plan_id: str
 
@@ -116,6 +328,27 @@ class ReferralRequest(BaseModel):
 # Créer les tables
 def create_tables():
     Base.metadata.create_all(bind=engine)
+    if _add_last_active_column():
+        # Utilisateurs existants : activité inconnue, on part de l'inscription
+        with engine.begin() as connection:
+            connection.execute(text("UPDATE users SET last_active_at = created_at WHERE last_active_at IS NULL"))
+    _create_missing_indexes()
+
+def _add_last_active_column() -> bool:
+    """create_all ne modifie pas les tables existantes : ajoute users.last_active_at aux bases antérieures"""
+    columns = {column["name"] for column in inspect(engine).get_columns("users")}
+    if "last_active_at" in columns:
+        return False
+    with engine.begin() as connection:
+        column_type = User.__table__.c.last_active_at.type.compile(dialect=engine.dialect)
+        connection.execute(text(f"ALTER TABLE users ADD COLUMN last_active_at {column_type}"))
+    return True
+
+def _create_missing_indexes():
+    """create_all ne crée les index que des nouvelles tables : ajoute ceux déclarés depuis"""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
 
 # Fonction pour obtenir la session de base de données
 def get_db():
@@ -2,6 +2,8 @@ import openai
 import os
 from typing import Dict, List
 import json
+from config import settings
+from content_templates import render_marketing_content, render_content_calendar, image_cache
 
 # Configuration OpenAI
 openai.api_key = os.getenv("OPENAI_API_KEY")
@@ -9,9 +11,20 @@ openai.api_key = os.getenv("OPENAI_API_KEY")
 # Clé API OpenAI (à configurer dans les secrets)
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "sk-fake-key-for-demo")
 
-def generate_text(prompt: str, max_tokens: int = 500) -> str:
-    """Génère du texte avec OpenAI GPT"""
+def use_openai_api() -> bool:
+    """Vrai si une vraie clé ou un serveur compatible (OPENAI_BASE_URL) est configuré"""
+    return bool(settings.OPENAI_BASE_URL) or OPENAI_API_KEY != "sk-fake-key-for-demo"
+
+def generate_text(prompt: str, max_tokens: int = 500, plan: str = "free") -> str:
+    """Génère du texte avec OpenAI GPT (modèle choisi selon le plan de l'utilisateur)"""
     try:
+        if use_openai_api():
+            from ai_service import ai_service
+            result = ai_service.generate_text(prompt, max_tokens, plan=plan)
+            if result["success"]:
+                return result["text"]
+            return f"Erreur lors de la génération : {result['error']}"
+
         # Pour la démo, on simule une réponse
         if "post LinkedIn" in prompt.lower():
             return """🚀 Les tendances marketing 2024 qui vont révolutionner votre stratégie !
@@ -48,6 +61,19 @@ N'hésitez pas à l'adapter selon vos besoins !"""
 def generate_image(prompt: str, size: str = "1024x1024", quality: str = "standard") -> Dict:
     """Génère une image avec DALL-E"""
     try:
+        if use_openai_api():
+            from ai_service import ai_service
+            result = ai_service.generate_image(prompt, size, quality)
+            if not result["success"]:
+                return {"success": False, "error": f"Erreur génération image : {result['error']}"}
+            return {
+                "success": True,
+                "image_url": result["image_url"],
+                "prompt": prompt,
+                "size": size,
+                "quality": quality
+            }
+
         # Pour la démo, on retourne une image placeholder
         return {
             "success": True,
@@ -62,47 +88,21 @@ def generate_image(prompt: str, size: str = "1024x1024", quality: str = "standar
             "error": f"Erreur génération image : {str(e)}"
         }
 
+def generate_cached_image(prompt: str, size: str = "1024x1024", quality: str = "standard") -> Dict:
+    """generate_image mémoïsé : les visuels à prompt fixe ne sont générés qu'une fois"""
+    result = image_cache.get_or_compute(
+        f"{size}|{quality}|{prompt}",
+        lambda: generate_image(prompt, size, quality),
+        cacheable=lambda value: value.get("success", False)
+    )
+    return dict(result)
+
 def generate_marketing_content(business_type: str, target_audience: str, platform: str) -> Dict:
     """Génère du contenu marketing adapté"""
 
     try:
-        # Génération du texte principal
-        if platform == "instagram":
-            text_content = f"""✨ {business_type.title()} qui comprend ses clients !
-
-Spécialement conçu pour {target_audience}, nous savons ce qui vous fait vibrer.
-
-Découvrez notre univers et rejoignez notre communauté ! 
-
-#Instagram #Marketing #{business_type.replace(' ', '')}"""
-
-        elif platform == "linkedin":
-            text_content = f"""🚀 Comment {business_type} révolutionne l'expérience client
-
-Notre approche centrée sur {target_audience} nous permet de créer des solutions innovantes qui répondent aux vrais besoins du marché.
-
-Découvrez notre vision et partagez votre avis en commentaire !
-
-#LinkedIn #Innovation #Business"""
-
-        else:
-            text_content = f"""Nouveau chez {business_type} ! 
-
-Parfait pour {target_audience}, découvrez ce qui nous rend uniques.
-
-Suivez-nous pour plus de contenus exclusifs !"""
-
-        # Génération de l'image
-        image_result = generate_image(f"Marketing visuel moderne pour {business_type}, style professionnel, couleurs attrayantes")
-
-        # Génération de la légende
-        caption = f"""🎯 Contenu spécialement créé pour {target_audience}
-
-✅ Engageant et authentique
-✅ Optimisé pour {platform}
-✅ Call-to-action intégré
-
-#Marketing #IA #{platform.title()} #{business_type.replace(' ', '')}"""
+        text_content, caption, image_prompt = render_marketing_content(business_type, target_audience, platform)
+        image_result = generate_cached_image(image_prompt)
 
         return {
             "success": True,
@@ -125,37 +125,9 @@ def generate_content_calendar(business_type: str, duration_days: int = 30) -> Di
     """Génère un calendrier de contenu pour X jours"""
 
     try:
-        calendar_content = f"""📅 CALENDRIER DE CONTENU - {business_type.upper()} ({duration_days} jours)
-
-SEMAINE 1:
-📱 Lundi: Post de présentation + Story behind the scenes
-📸 Mercredi: Contenu produit/service + Carousel informatif  
-🎥 Vendredi: Vidéo témoignage client + Post engagement
-
-SEMAINE 2:
-💡 Lundi: Conseil/Astuce + Story interactive
-🎯 Mercredi: Contenu éducatif + Post questions/réponses
-🚀 Vendredi: Annonce/Nouveauté + Story countdown
-
-SEMAINE 3:
-👥 Lundi: Contenu communauté + Story user-generated content
-📊 Mercredi: Infographie/Statistiques + Post didactique
-🎉 Vendredi: Contenu divertissant + Story quiz
-
-SEMAINE 4:
-🔥 Lundi: Contenu tendance + Story sondage
-💎 Mercredi: Contenu premium/exclusif + Post call-to-action
-🌟 Vendredi: Récap de la semaine + Story remerciements
-
-CONSEILS BONUS:
-- Postez aux heures de forte audience (11h-13h, 17h-19h)
-- Utilisez 3-5 hashtags stratégiques par post
-- Alternez entre contenu informatif, divertissant et promotionnel
-- Répondez aux commentaires dans les 2h"""
-
         return {
             "success": True,
-            "calendar": calendar_content,
+            "calendar": render_content_calendar(business_type, duration_days),
             "duration": duration_days,
             "business_type": business_type
         }
@@ -163,4 +135,4 @@ CONSEILS BONUS:
         return {
             "success": False,
             "error": f"Erreur génération calendrier : {str(e)}"
-        }
\ No newline at end of file
+        }
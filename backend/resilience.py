@@ -0,0 +1,296 @@
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from typing import Callable, Dict, Optional
+from logger import logger
+
+class CircuitOpenError(Exception):
+    """Le disjoncteur est ouvert : l'appel est refusé sans contacter le fournisseur"""
+    pass
+
+class DeadlineExceeded(Exception):
+    """Le délai global de l'appel (retries compris) est dépassé"""
+    pass
+
+RETRYABLE_STATUS_CODES = {408, 409, 429}
+
+def get_status_code(exc: Exception) -> Optional[int]:
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        response = getattr(exc, "response", None)
+        status = getattr(response, "status_code", None)
+    return status if isinstance(status, int) else None
+
+def is_retryable(exc: Exception) -> bool:
+    """429, 5xx, timeouts et erreurs réseau sont retentés ; les autres erreurs sont définitives"""
+    if isinstance(exc, (CircuitOpenError, DeadlineExceeded)):
+        return False
+    status = get_status_code(exc)
+    if status is not None:
+        return status in RETRYABLE_STATUS_CODES or status >= 500
+    # Erreurs sans réponse HTTP (openai.APITimeoutError, APIConnectionError, ...)
+    name = type(exc).__name__
+    return isinstance(exc, (TimeoutError, ConnectionError)) or "Timeout" in name or "Connection" in name
+
+def retry_after_seconds(exc: Exception) -> Optional[float]:
+    """Lit Retry-After (secondes ou date HTTP) ou retry-after-ms de la réponse"""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return max(float(retry_after_ms) / 1000, 0.0)
+        except ValueError:
+            pass
+
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return max(float(retry_after), 0.0)
+    except ValueError:
+        try:
+            retry_at = parsedate_to_datetime(retry_after)
+            return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+        except (TypeError, ValueError):
+            return None
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self._state = "closed"
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == "open" and self.clock() - self._opened_at >= self.reset_timeout:
+            self._state = "half_open"
+            self._probe_in_flight = False
+        return self._state
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            state = self._current_state()
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True  # Un seul appel test à la fois
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._state = "closed"
+            self._consecutive_failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._consecutive_failures += 1
+            if self._state == "half_open" or self._consecutive_failures >= self.failure_threshold:
+                if self._state != "open":
+                    logger.warning(f"⚡ Disjoncteur {self.name} ouvert")
+                self._state = "open"
+                self._opened_at = self.clock()
+                self._probe_in_flight = False
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "state": self._current_state(),
+                "consecutive_failures": self._consecutive_failures
+            }
+
+class LatencyTracker:
+    def __init__(self, window: int = 200):
+        self.samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self.samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        with self._lock:
+            if not self.samples:
+                return None
+            ordered = sorted(self.samples)
+        index = min(int(q * len(ordered)), len(ordered) - 1)
+        return ordered[index]
+
+def _close_result(future):
+    """Ferme le résultat d'une requête couverte perdante s'il détient une ressource (flux)"""
+    if future.cancelled() or future.exception() is not None:
+        return
+    close = getattr(future.result(), "close", None)
+    if callable(close):
+        try:
+            close()
+        except Exception as e:
+            logger.warning(f"Fermeture d'une réponse couverte perdante impossible: {e}")
+
+class ResilientCaller:
+    """Délais par appel, retries exponentiels avec jitter, requêtes couvertes (hedging) et disjoncteur"""
+
+    def __init__(self, name: str, max_attempts: int = 3, base_delay: float = 0.5, max_delay: float = 8.0,
+                 deadline: float = 90.0, attempt_timeout: float = 60.0, hedge: bool = False,
+                 hedge_min_samples: int = 20, breaker: CircuitBreaker = None,
+                 sleep: Callable[[float], None] = time.sleep, clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.attempt_timeout = attempt_timeout
+        self.hedge = hedge
+        self.hedge_min_samples = hedge_min_samples
+        self.breaker = breaker or CircuitBreaker(name, clock=clock)
+        self.latency = LatencyTracker()
+        self.sleep = sleep
+        self.clock = clock
+        self.counters = {
+            "calls": 0,
+            "successes": 0,
+            "failures": 0,
+            "retries": 0,
+            "short_circuited": 0,
+            "hedged": 0,
+            "hedge_wins": 0
+        }
+        self._counters_lock = threading.Lock()
+        self._hedge_pool = None
+
+    def _count(self, counter: str, amount: int = 1):
+        with self._counters_lock:
+            self.counters[counter] += amount
+
+    def backoff_delay(self, attempt: int) -> float:
+        """Backoff exponentiel avec 'full jitter'"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (attempt - 1))))
+
+    def hedge_delay(self) -> Optional[float]:
+        if not self.hedge or len(self.latency.samples) < self.hedge_min_samples:
+            return None
+        return self.latency.percentile(0.95)
+
+    def call(self, fn: Callable, **kwargs):
+        """Appelle fn(timeout=..., **kwargs) en appliquant la politique de résilience"""
+        self._count("calls")
+        deadline_at = self.clock() + self.deadline
+
+        for attempt in range(1, self.max_attempts + 1):
+            if not self.breaker.allow_request():
+                self._count("short_circuited")
+                raise CircuitOpenError(f"Service {self.name} temporairement indisponible")
+
+            remaining = deadline_at - self.clock()
+            if remaining <= 0:
+                self._count("failures")
+                raise DeadlineExceeded(f"Délai dépassé pour {self.name}")
+
+            timeout = min(self.attempt_timeout, remaining)
+            started = self.clock()
+            try:
+                result = self._attempt(fn, timeout, kwargs)
+            except Exception as e:
+                retryable = is_retryable(e)
+                if retryable:
+                    self.breaker.record_failure()
+                else:
+                    # Le fournisseur a répondu (ex: 400) : il est disponible
+                    self.breaker.record_success()
+
+                if not retryable or attempt == self.max_attempts:
+                    self._count("failures")
+                    raise
+
+                delay = retry_after_seconds(e)
+                if delay is None:
+                    delay = self.backoff_delay(attempt)
+                if self.clock() + delay >= deadline_at:
+                    self._count("failures")
+                    raise
+
+                logger.warning(f"{self.name}: tentative {attempt} échouée ({e}), nouvel essai dans {delay:.2f}s")
+                self._count("retries")
+                self.sleep(delay)
+                continue
+
+            self.latency.record(self.clock() - started)
+            self.breaker.record_success()
+            self._count("successes")
+            return result
+
+    def _attempt(self, fn: Callable, timeout: float, kwargs: Dict):
+        hedge_after = self.hedge_delay()
+        if hedge_after is None or hedge_after >= timeout:
+            return fn(timeout=timeout, **kwargs)
+
+        pool = self._get_hedge_pool()
+        primary = pool.submit(fn, timeout=timeout, **kwargs)
+        done, _ = wait([primary], timeout=hedge_after)
+        if done:
+            return primary.result()
+
+        # La requête principale dépasse le p95 : on lance une requête couverte
+        self._count("hedged")
+        hedged = pool.submit(fn, timeout=max(timeout - hedge_after, 0.1), **kwargs)
+        pending = {primary, hedged}
+        last_error = None
+        try:
+            while pending:
+                done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                if not done:
+                    break
+                for future in done:
+                    if future.exception() is None:
+                        if future is hedged:
+                            self._count("hedge_wins")
+                        pending |= done - {future}
+                        return future.result()
+                    last_error = future.exception()
+        finally:
+            # Course décidée : la réponse perdante (ex. flux ouvert avec stream=True) est
+            # fermée dès qu'elle arrive, sans quoi la connexion et la génération continuent
+            for loser in pending:
+                loser.add_done_callback(_close_result)
+
+        raise last_error or TimeoutError(f"Délai dépassé pour {self.name}")
+
+    def _get_hedge_pool(self) -> ThreadPoolExecutor:
+        # Création paresseuse sous verrou : deux premiers appels concurrents ne créent qu'un pool
+        if self._hedge_pool is None:
+            with self._counters_lock:
+                if self._hedge_pool is None:
+                    self._hedge_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix=f"{self.name}-hedge")
+        return self._hedge_pool
+
+    def snapshot(self) -> Dict:
+        with self._counters_lock:
+            counters = dict(self.counters)
+        p50 = self.latency.percentile(0.5)
+        p95 = self.latency.percentile(0.95)
+        return {
+            **counters,
+            "circuit_breaker": self.breaker.snapshot(),
+            "latency_p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "latency_p95_ms": round(p95 * 1000, 1) if p95 is not None else None
+        }
@@ -0,0 +1,204 @@
+import asyncio
+import heapq
+import itertools
+import threading
+from dataclasses import dataclass
+from datetime import datetime, time, timedelta
+from typing import Callable, Dict, Iterable, List, Optional
+from config import settings
+from logger import logger
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+def _parse_time(value: str) -> time:
+    parts = [int(part) for part in value.split(":")]
+    return time(*parts)
+
+class Interval:
+    """Toutes les `seconds` secondes"""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+
+    def next_after(self, moment: datetime) -> datetime:
+        return moment + timedelta(seconds=self.seconds)
+
+class Daily:
+    """Chaque jour à l'heure `at` ("HH:MM", heure locale du serveur)"""
+
+    def __init__(self, at: str):
+        self.at = _parse_time(at)
+
+    def next_after(self, moment: datetime) -> datetime:
+        candidate = datetime.combine(moment.date(), self.at)
+        return candidate if candidate > moment else candidate + timedelta(days=1)
+
+class Weekly:
+    """Chaque semaine le jour `day` ("monday"...) à l'heure `at`"""
+
+    def __init__(self, day: str, at: str):
+        self.weekday = WEEKDAYS.index(day.lower())
+        self.at = _parse_time(at)
+
+    def next_after(self, moment: datetime) -> datetime:
+        days_ahead = (self.weekday - moment.weekday()) % 7
+        candidate = datetime.combine(moment.date() + timedelta(days=days_ahead), self.at)
+        return candidate if candidate > moment else candidate + timedelta(days=7)
+
+@dataclass(eq=False)
+class ScheduledJob:
+    id: str
+    func: Callable  # Coroutine ou fonction bloquante (exécutée dans un thread)
+    trigger: object  # Objet avec next_after(datetime) -> datetime
+    next_run_at: datetime
+    running: bool = False
+    runs: int = 0
+
+class AsyncScheduler:
+    """
+    Planificateur asyncio : les prochaines exécutions sont dans un tas, la
+    boucle dort jusqu'à l'échéance la plus proche (ou jusqu'à un ajout) et
+    lance les tâches dues avec une concurrence bornée. Une tâche encore en
+    cours à sa prochaine échéance est sautée, et les échéances manquées
+    (arrêt, surcharge) sont regroupées en une seule exécution.
+    """
+
+    def __init__(self, max_concurrency: int = None, max_sleep: float = None,
+                 clock: Callable[[], datetime] = datetime.now):
+        self.max_concurrency = max_concurrency or settings.SCHEDULER_MAX_CONCURRENCY
+        # Borne le sommeil pour suivre les changements d'heure système
+        self.max_sleep = max_sleep or settings.SCHEDULER_MAX_SLEEP_SECONDS
+        self.clock = clock
+        self._jobs: Dict[str, ScheduledJob] = {}
+        self._heap: List[tuple] = []
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._loop = None
+        self._wakeup = None
+        self._slots = None
+        self._task = None
+        self._running_tasks = set()
+        self.stats = {"runs": 0, "failures": 0, "skipped": 0, "wakeups": 0}
+
+    def add_job(self, job_id: str, func: Callable, trigger, next_run_at: datetime = None) -> ScheduledJob:
+        """Programme (ou remplace) une tâche ; appelable depuis n'importe quel thread"""
+        job = ScheduledJob(job_id, func, trigger, next_run_at or trigger.next_after(self.clock()))
+        with self._lock:
+            self._jobs[job_id] = job
+            heapq.heappush(self._heap, (job.next_run_at, next(self._sequence), job))
+        self.wake()
+        return job
+
+    def add_jobs(self, entries: Iterable[tuple]) -> int:
+        """Programme en masse des tâches (job_id, func, trigger, next_run_at) : un seul heapify"""
+        jobs = [ScheduledJob(job_id, func, trigger, next_run_at) for job_id, func, trigger, next_run_at in entries]
+        with self._lock:
+            for job in jobs:
+                self._jobs[job.id] = job
+                self._heap.append((job.next_run_at, next(self._sequence), job))
+            heapq.heapify(self._heap)
+        self.wake()
+        return len(jobs)
+
+    def remove_job(self, job_id: str) -> bool:
+        # Les entrées du tas de la tâche supprimée sont ignorées à leur échéance
+        with self._lock:
+            return self._jobs.pop(job_id, None) is not None
+
+    def get_job(self, job_id: str) -> Optional[ScheduledJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def wake(self):
+        if self._loop is not None and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _pop_due(self, now: datetime) -> List[ScheduledJob]:
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                run_at, _, job = heapq.heappop(self._heap)
+                if self._jobs.get(job.id) is not job or job.next_run_at != run_at:
+                    continue  # Tâche supprimée ou remplacée
+                due.append(job)
+                job.next_run_at = job.trigger.next_after(max(now, run_at))
+                heapq.heappush(self._heap, (job.next_run_at, next(self._sequence), job))
+        return due
+
+    def _seconds_until_next(self, now: datetime) -> float:
+        with self._lock:
+            if not self._heap:
+                return self.max_sleep
+            return min(self.max_sleep, (self._heap[0][0] - now).total_seconds())
+
+    async def _execute(self, job: ScheduledJob):
+        if job.running:
+            self.stats["skipped"] += 1
+            logger.warning(f"Tâche planifiée {job.id} encore en cours, exécution sautée")
+            return
+        job.running = True
+        try:
+            async with self._slots:
+                if asyncio.iscoroutinefunction(job.func):
+                    await job.func()
+                else:
+                    await asyncio.to_thread(job.func)
+            job.runs += 1
+            self.stats["runs"] += 1
+        except Exception as e:
+            self.stats["failures"] += 1
+            logger.error(f"Erreur tâche planifiée {job.id}: {e}")
+        finally:
+            job.running = False
+
+    async def run_forever(self):
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+        logger.info("Planificateur démarré")
+        while True:
+            self.stats["wakeups"] += 1
+            for job in self._pop_due(self.clock()):
+                task = self._loop.create_task(self._execute(job))
+                self._running_tasks.add(task)
+                task.add_done_callback(self._running_tasks.discard)
+
+            self._wakeup.clear()
+            delay = self._seconds_until_next(self.clock())
+            if delay <= 0:
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        """Démarre le planificateur dans la boucle asyncio courante"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self.run_forever())
+        return self._task
+
+    async def stop(self):
+        """Arrête la boucle et annule les tâches en cours"""
+        tasks = list(self._running_tasks)
+        if self._task is not None:
+            tasks.append(self._task)
+            self._task = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._loop = None
+        self._wakeup = None
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            next_run = min((job.next_run_at for job in self._jobs.values()), default=None)
+            return {
+                **self.stats,
+                "jobs": len(self._jobs),
+                "running": sum(1 for job in self._jobs.values() if job.running),
+                "next_run_at": next_run.isoformat() if next_run else None
+            }
+
+# Instance globale
+scheduler = AsyncScheduler()
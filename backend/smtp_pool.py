@@ -0,0 +1,226 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Callable, Dict
+import aiosmtplib
+from logger import logger
+
+def is_connection_error(exc: Exception) -> bool:
+    """Vrai si la connexion est inutilisable (à fermer et rouvrir) plutôt que le message refusé"""
+    if isinstance(exc, (aiosmtplib.SMTPServerDisconnected, aiosmtplib.SMTPConnectError, aiosmtplib.SMTPTimeoutError)):
+        return True
+    # SMTPTimeoutError hérite d'OSError : les autres erreurs SMTP sont des refus du serveur
+    return isinstance(exc, (OSError, asyncio.TimeoutError)) and not isinstance(exc, aiosmtplib.SMTPException)
+
+class PooledConnection:
+    def __init__(self, smtp, now: float):
+        self.smtp = smtp
+        self.created_at = now
+        self.last_used = now
+        self.messages_sent = 0
+
+class SMTPConnectionPool:
+    """
+    Connexions SMTP asynchrones (aiosmtplib) longues partagées entre les envois :
+    STARTTLS et login une seule fois par connexion, vérification NOOP après une
+    période d'inactivité, reconnexion sur erreur, rotation après max_messages et
+    fermeture des connexions inactives depuis plus de idle_timeout. max_size
+    borne à la fois le nombre de connexions et le nombre d'envois simultanés.
+    """
+
+    def __init__(self, host: str, port: int, user: str = None, password: str = None, starttls: bool = True,
+                 max_size: int = 4, max_messages_per_connection: int = 100, idle_timeout: float = 60.0,
+                 health_check_after: float = 10.0, timeout: float = 30.0,
+                 smtp_factory: Callable = aiosmtplib.SMTP, clock: Callable[[], float] = time.monotonic):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.starttls = starttls
+        self.max_size = max_size
+        self.max_messages_per_connection = max_messages_per_connection
+        self.idle_timeout = idle_timeout
+        self.health_check_after = health_check_after
+        self.timeout = timeout
+        self.smtp_factory = smtp_factory
+        self.clock = clock
+        self._idle = deque()
+        # Créé à la première utilisation, dans la boucle qui exécute les envois
+        self._slots = None
+        self._reaper = None
+        self.stats = {"connections_opened": 0, "connections_closed": 0, "messages_sent": 0, "reconnects": 0}
+
+    async def _open(self) -> PooledConnection:
+        smtp = self.smtp_factory(hostname=self.host, port=self.port, timeout=self.timeout, start_tls=self.starttls)
+        try:
+            await smtp.connect()
+            if self.user and self.password:
+                await smtp.login(self.user, self.password)
+        except Exception:
+            await self._quit(smtp)
+            raise
+        self.stats["connections_opened"] += 1
+        self._ensure_reaper()
+        return PooledConnection(smtp, self.clock())
+
+    async def _quit(self, smtp):
+        try:
+            await smtp.quit()
+        except Exception:
+            try:
+                smtp.close()
+            except Exception:
+                pass
+
+    async def _discard(self, connection: PooledConnection):
+        await self._quit(connection.smtp)
+        self.stats["connections_closed"] += 1
+
+    async def _is_healthy(self, connection: PooledConnection, now: float) -> bool:
+        if now - connection.last_used > self.idle_timeout:
+            return False
+        if connection.messages_sent >= self.max_messages_per_connection:
+            return False
+        if now - connection.last_used > self.health_check_after:
+            try:
+                response = await connection.smtp.noop()
+                return response.code == 250
+            except Exception:
+                return False
+        return True
+
+    async def _take_idle(self) -> PooledConnection:
+        """Première connexion inactive encore saine, None s'il faut en ouvrir une"""
+        while self._idle:
+            connection = self._idle.pop()  # La plus récemment utilisée
+            if await self._is_healthy(connection, self.clock()):
+                return connection
+            await self._discard(connection)
+        return None
+
+    @asynccontextmanager
+    async def connection(self):
+        """Emprunte une connexion ; elle est rendue au pool sauf erreur de connexion"""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_size)
+        async with self._slots:
+            connection = None
+            try:
+                connection = await self._take_idle() or await self._open()
+                yield connection
+            except Exception as e:
+                if connection is not None and is_connection_error(e):
+                    await self._discard(connection)
+                    connection = None
+                raise
+            finally:
+                if connection is not None:
+                    connection.last_used = self.clock()
+                    if connection.messages_sent >= self.max_messages_per_connection:
+                        await self._discard(connection)
+                    else:
+                        self._idle.append(connection)
+
+    async def send_message(self, msg) -> Dict:
+        """Envoie un message, avec une nouvelle tentative sur une connexion neuve si la connexion a été perdue"""
+        for attempt in range(2):
+            try:
+                async with self.connection() as connection:
+                    refused, _ = await connection.smtp.send_message(msg)
+                    connection.messages_sent += 1
+                self.stats["messages_sent"] += 1
+                return refused
+            except Exception as e:
+                if attempt == 1 or not is_connection_error(e):
+                    raise
+                logger.warning(f"Connexion SMTP perdue, reconnexion: {e}")
+                self.stats["reconnects"] += 1
+
+    def _ensure_reaper(self):
+        """Tâche de fond qui ferme les connexions inactives (le serveur les couperait sinon)"""
+        if self._reaper is None or self._reaper.done():
+            self._reaper = asyncio.get_running_loop().create_task(self._reap_forever())
+
+    async def _reap_forever(self):
+        while True:
+            await asyncio.sleep(max(self.idle_timeout / 2, 1.0))
+            try:
+                await self.close_idle()
+            except Exception as e:
+                logger.error(f"Erreur fermeture connexions SMTP inactives: {e}")
+
+    async def close_idle(self) -> int:
+        """Ferme les connexions inactives depuis plus de idle_timeout"""
+        now = self.clock()
+        expired = [c for c in self._idle if now - c.last_used > self.idle_timeout]
+        for connection in expired:
+            self._idle.remove(connection)
+            await self._discard(connection)
+        return len(expired)
+
+    async def close_all(self):
+        if self._reaper is not None:
+            self._reaper.cancel()
+            self._reaper = None
+        while self._idle:
+            await self._discard(self._idle.pop())
+
+    def snapshot(self) -> Dict:
+        return {**self.stats, "idle_connections": len(self._idle)}
+
+class SMTPTransport:
+    """
+    Exécute le pool SMTP sur une boucle asyncio dédiée : toutes les attentes
+    réseau partagent un seul thread. Les appelants asynchrones attendent sans
+    bloquer leur propre boucle, les appelants synchrones attendent le résultat.
+    """
+
+    def __init__(self, pool: SMTPConnectionPool):
+        self.pool = pool
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name="smtp-transport", daemon=True)
+                self._thread.start()
+            return self._loop
+
+    def _on_transport_loop(self) -> bool:
+        return self._thread is not None and threading.current_thread() is self._thread
+
+    def submit(self, coro):
+        """Planifie une coroutine sur la boucle SMTP et retourne un concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self._get_loop())
+
+    def run(self, coro, timeout: float = None):
+        """Exécute une coroutine sur la boucle SMTP et attend son résultat (code synchrone uniquement)"""
+        if self._on_transport_loop():
+            raise RuntimeError("Appel bloquant depuis la boucle SMTP")
+        return self.submit(coro).result(timeout)
+
+    async def send(self, msg) -> Dict:
+        if self._on_transport_loop():
+            return await self.pool.send_message(msg)
+        return await asyncio.wrap_future(self.submit(self.pool.send_message(msg)))
+
+    def send_sync(self, msg, timeout: float = None) -> Dict:
+        return self.run(self.pool.send_message(msg), timeout)
+
+    def snapshot(self) -> Dict:
+        return self.pool.snapshot()
+
+    def close(self, timeout: float = 10.0):
+        with self._lock:
+            loop, self._loop = self._loop, None
+        if loop is None:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self.pool.close_all(), loop).result(timeout)
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
@@ -0,0 +1,105 @@
+
+# Tests du suivi d'activité et des utilisateurs inactifs
+
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import Base, User
+from database import DatabaseService
+from activity_tracker import ActivityTracker
+
+engine = create_engine(
+    "sqlite:///:memory:",
+    poolclass=StaticPool,
+    connect_args={"check_same_thread": False},
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+Base.metadata.create_all(bind=engine)
+
+def make_db():
+    return DatabaseService(TestingSessionLocal())
+
+def setup_module():
+    db = TestingSessionLocal()
+    old = datetime.utcnow() - timedelta(days=10)
+    db.add_all([User(email=f"user{i}@test.fr", hashed_password="x", referral_code=f"ACT{i}", last_active_at=old)
+                for i in range(1, 6)])
+    db.commit()
+    db.close()
+
+class FakeClock:
+    def __init__(self):
+        self.now = datetime.utcnow()
+
+    def __call__(self):
+        return self.now
+
+def count_updates(fn):
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        result = fn()
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    return result, [s for s in statements if s.startswith("UPDATE")]
+
+def test_touches_are_coalesced_into_one_write_per_interval():
+    clock = FakeClock()
+    tracker = ActivityTracker(write_interval_minutes=15, flush_interval=30, db_factory=make_db, clock=clock)
+
+    for _ in range(50):
+        tracker.touch(1)
+        tracker.touch(2)
+    written, updates = count_updates(tracker.flush)
+    assert written == 2
+    assert len(updates) == 1  # Un UPDATE groupé (executemany)
+
+    # Dans la même période : aucune nouvelle écriture
+    clock.now += timedelta(minutes=10)
+    tracker.touch(1)
+    assert tracker.flush() == 0
+
+    clock.now += timedelta(minutes=6)
+    tracker.touch(1)
+    assert tracker.flush() == 1
+    assert tracker.snapshot()["touches"] == 102
+
+def test_inactive_users_range_scan():
+    clock = FakeClock()
+    tracker = ActivityTracker(db_factory=make_db, clock=clock)
+    tracker.touch(3)
+    tracker.flush()
+
+    db = make_db()
+    # Même last_active_at pour 1, 2 et 4 : départage par id ; 5 est le plus ancien
+    old = datetime.utcnow() - timedelta(days=10)
+    db.db.query(User).filter(User.id.in_([1, 2, 4])).update({User.last_active_at: old})
+    db.db.query(User).filter(User.id == 5).update({User.last_active_at: old - timedelta(days=10)})
+    db.db.commit()
+
+    inactive = [user.id for user in db.get_inactive_users(days=2)]
+    pages, after = [], None
+    while True:
+        page = db.get_inactive_users(days=2, after=after, limit=2)
+        if not page:
+            break
+        pages.append([user.id for user in page])
+        after = (page[-1].last_active_at, page[-1].id)
+
+    plan = db.db.execute(text(
+        "EXPLAIN QUERY PLAN SELECT id FROM users WHERE last_active_at < :cutoff AND is_active = 1 "
+        "AND (last_active_at, id) > (:at, :id) ORDER BY last_active_at, id LIMIT 2"
+    ), {"cutoff": datetime.utcnow(), "at": datetime.utcnow() - timedelta(days=30), "id": 0}).fetchall()
+    db.close()
+
+    assert inactive == [5, 1, 2, 4]
+    assert pages == [[5, 1], [2, 4]]
+    assert any("ix_users_last_active_at_id" in row[-1] for row in plan)
+    assert not any("TEMP B-TREE" in row[-1] for row in plan)  # Pas de tri : l'index donne l'ordre
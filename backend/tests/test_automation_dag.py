@@ -0,0 +1,84 @@
+
+# Tests de l'exécution des actions d'automatisation en graphe
+
+import asyncio
+import pytest
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scheduler import AsyncScheduler
+from automation_service import AutomationService, action_graph
+
+def make_service(max_parallel_actions: int = 4):
+    service = AutomationService(scheduler=AsyncScheduler(), db_factory=None, max_parallel_actions=max_parallel_actions)
+    service.active = 0
+    service.peak = 0
+    service.seen = {}
+
+    async def slow(action, user_id, inputs):
+        service.active += 1
+        service.peak = max(service.peak, service.active)
+        await asyncio.sleep(0.05)
+        service.active -= 1
+        service.seen[action["id"]] = dict(inputs)
+        if action.get("fail"):
+            return {"success": False, "error": "échec"}
+        return {"success": True, "outputs": {"generated_content": f"texte de {action['id']}"}}
+
+    service.action_generate_content = slow
+    service.action_post_social = slow
+    return service
+
+def test_graph_validation():
+    assert action_graph([{"type": "a"}, {"type": "b"}]) == (
+        ["action_1", "action_2"], {"action_1": [], "action_2": ["action_1"]})
+    with pytest.raises(ValueError):
+        action_graph([{"id": "a", "depends_on": "b"}])
+    with pytest.raises(ValueError):
+        action_graph([{"id": "a", "depends_on": "b"}, {"id": "b", "depends_on": ["a"]}])
+
+def test_branches_run_in_parallel_and_receive_outputs():
+    service = make_service()
+    config = {"actions": [
+        {"id": "post", "type": "post_social", "depends_on": ["gen"]},
+        {"id": "gen", "type": "generate_content", "depends_on": []},
+        {"id": "tweet", "type": "post_social", "depends_on": "gen"},
+        {"id": "other", "type": "generate_content", "depends_on": []},
+    ]}
+
+    results = asyncio.run(service.run_actions(config, 1))
+
+    assert [r["id"] for r in results] == ["post", "gen", "tweet", "other"]
+    assert all(r["status"] == "success" and r["duration_ms"] >= 40 and r["started_at"] for r in results)
+    assert service.peak == 2  # gen/other puis post/tweet
+    assert service.seen["post"] == {"generated_content": "texte de gen"}
+    assert service.seen["other"] == {}
+
+def test_failure_skips_dependents_and_parallelism_is_bounded():
+    service = make_service(max_parallel_actions=1)
+    config = {"actions": [
+        {"id": "gen", "type": "generate_content", "fail": True, "depends_on": []},
+        {"id": "post", "type": "post_social", "depends_on": ["gen"]},
+        {"id": "after", "type": "post_social", "depends_on": ["post"]},
+        {"id": "other", "type": "post_social", "depends_on": []},
+    ]}
+
+    results = {r["id"]: r for r in asyncio.run(service.run_actions(config, 1))}
+
+    assert service.peak == 1
+    assert results["gen"]["status"] == "failed"
+    assert results["post"]["status"] == "skipped" and results["after"]["status"] == "skipped"
+    assert results["other"]["status"] == "success"
+
+def test_legacy_chain_runs_in_order_and_stop_on_error():
+    service = make_service()
+    actions = [{"id": "a", "type": "generate_content", "fail": True},
+               {"id": "b", "type": "post_social"}]
+
+    results = asyncio.run(service.run_actions({"actions": actions}, 1))
+    assert service.peak == 1 and [r["status"] for r in results] == ["failed", "success"]
+
+    results = asyncio.run(service.run_actions({"actions": actions, "stop_on_error": True}, 1))
+    assert [r["status"] for r in results] == ["failed", "skipped"]
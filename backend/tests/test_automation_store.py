@@ -0,0 +1,103 @@
+
+# Tests du stockage des automatisations et de la reconstruction du planificateur
+
+import asyncio
+from datetime import datetime
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import Base, User
+from database import DatabaseService
+from scheduler import AsyncScheduler
+from automation_service import AutomationService
+
+engine = create_engine(
+    "sqlite:///:memory:",
+    poolclass=StaticPool,
+    connect_args={"check_same_thread": False},
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+Base.metadata.create_all(bind=engine)
+
+NOW = datetime(2026, 10, 19, 8, 0)  # Lundi
+
+def make_db():
+    return DatabaseService(TestingSessionLocal())
+
+def make_service():
+    return AutomationService(scheduler=AsyncScheduler(clock=lambda: NOW), db_factory=make_db)
+
+def setup_module():
+    db = TestingSessionLocal()
+    db.add(User(email="auto@test.fr", hashed_password="x", referral_code="AUTO"))
+    db.commit()
+    db.close()
+
+POST = {"type": "post_social", "platform": "twitter", "content": "Bonjour"}
+
+def test_schedules_survive_restart():
+    service = make_service()
+    daily = service.create_automation(1, "Quotidienne", {
+        "trigger": {"type": "schedule", "frequency": "daily", "time": "09:00"}, "actions": [POST]})
+    weekly = service.create_automation(1, "Hebdo", {
+        "trigger": {"type": "schedule", "frequency": "weekly", "day": "friday", "time": "18:00"}, "actions": [POST]})
+    manual = service.create_automation(1, "Manuelle", {"actions": [POST]})
+    assert daily["next_run_at"] == "2026-10-19T09:00:00"
+    assert manual["next_run_at"] is None
+
+    # Redémarrage : nouveau planificateur reconstruit par une seule requête
+    restarted = make_service()
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        loaded = restarted.load_scheduled_automations()
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+
+    assert loaded >= 2
+    assert len(statements) == 1 and "config" not in statements[0].split("FROM")[0]
+    assert restarted.scheduler.get_job(daily["automation_id"]).next_run_at == datetime(2026, 10, 19, 9, 0)
+    assert restarted.scheduler.get_job(weekly["automation_id"]).next_run_at == datetime(2026, 10, 23, 18, 0)
+    assert restarted.scheduler.get_job(manual["automation_id"]) is None
+
+def test_run_is_recorded_and_next_run_persisted():
+    service = make_service()
+    created = service.create_automation(1, "Quotidienne", {
+        "trigger": {"type": "schedule", "frequency": "daily", "time": "07:00"}, "actions": [POST, POST]})
+    automation_id = created["automation_id"]
+    # Échéance atteinte : le planificateur calcule la suivante avant l'exécution
+    service.scheduler._pop_due(datetime(2026, 10, 20, 7, 0))
+
+    result = asyncio.run(service.run_automation(automation_id, "schedule"))
+    assert result["success"]
+
+    db = make_db()
+    automation = db.get_automation(automation_id)
+    runs = db.get_automation_runs(automation_id)
+    user_automations = db.get_user_automations(1)
+    db.close()
+
+    assert automation["run_count"] == 1 and automation["last_run_at"] is not None
+    assert automation["next_run_at"] == datetime(2026, 10, 21, 7, 0)
+    assert len(runs) == 1 and runs[0]["status"] == "success" and runs[0]["source"] == "schedule"
+    assert len(runs[0]["results"]) == 2
+    assert automation_id in [a["id"] for a in user_automations]
+
+def test_leader_picks_up_automations_created_on_other_workers():
+    leader, follower = make_service(), make_service()
+    leader.load_scheduled_automations()
+
+    created = follower.create_automation(1, "Créée ailleurs", {
+        "trigger": {"type": "schedule", "frequency": "hourly"}, "actions": [POST]})
+    assert leader.scheduler.get_job(created["automation_id"]) is None
+
+    assert leader.sync_scheduled_automations() >= 1
+    assert leader.scheduler.get_job(created["automation_id"]).next_run_at == datetime(2026, 10, 19, 9, 0)
+    # Rien de nouveau : pas de reprogrammation
+    assert leader.sync_scheduled_automations() == 0
@@ -0,0 +1,133 @@
+
+# Tests de la génération groupée : réservation de crédits et flux NDJSON
+
+import asyncio
+import json
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import Base, BatchItem, CreditTransaction, User
+from database import DatabaseService
+from batch_service import BatchService
+
+engine = create_engine(
+    "sqlite:///:memory:",
+    poolclass=StaticPool,
+    connect_args={"check_same_thread": False},
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+Base.metadata.create_all(bind=engine)
+
+def make_db():
+    return DatabaseService(TestingSessionLocal())
+
+def create_user(email: str, credits: int) -> int:
+    db = TestingSessionLocal()
+    user = User(email=email, hashed_password="x", referral_code=email[:8].upper(), credits=credits)
+    db.add(user)
+    db.commit()
+    user_id = user.id
+    db.close()
+    return user_id
+
+def credits_of(user_id: int) -> int:
+    db = make_db()
+    try:
+        return db.get_user_by_id(user_id).credits
+    finally:
+        db.close()
+
+def transaction_of(transaction_id: int) -> CreditTransaction:
+    db = TestingSessionLocal()
+    try:
+        return db.query(CreditTransaction).filter(CreditTransaction.id == transaction_id).one()
+    finally:
+        db.close()
+
+def make_service(fail_prompts=(), delays=None):
+    service = BatchService(concurrency=2, db_factory=make_db)
+
+    def generate_item(item, plan="free"):
+        import time
+        time.sleep((delays or {}).get(item.prompt, 0))
+        if item.prompt in fail_prompts:
+            return {"success": False, "error": "quota dépassé"}
+        return {"success": True, "result": item.prompt.upper()}
+
+    service.generate_item = generate_item
+    return service
+
+def test_reserve_and_settle_credits():
+    user_id = create_user("reserve@test.fr", 10)
+    db = make_db()
+    assert db.reserve_credits(user_id, 15, "batch_generation") is None  # Crédits insuffisants
+    transaction_id = db.reserve_credits(user_id, 6, "batch_generation")
+    assert transaction_id is not None
+    assert db.get_user_by_id(user_id).credits == 4
+
+    assert db.settle_credit_reservation(transaction_id, 2) == 4
+    assert db.settle_credit_reservation(transaction_id, 0) == 0  # Déjà réglée : rien de plus
+    db.close()
+
+    assert credits_of(user_id) == 8
+    transaction = transaction_of(transaction_id)
+    assert transaction.status == "settled" and transaction.amount == 2 and transaction.reserved == 6
+
+def test_stream_charges_only_successful_items():
+    user_id = create_user("partial@test.fr", 3)
+    db = make_db()
+    transaction_id = db.reserve_credits(user_id, 3, "batch_generation")
+    db.close()
+    items = [BatchItem(type="text", prompt=prompt) for prompt in ("un", "deux", "trois")]
+
+    async def consume():
+        stream = make_service(fail_prompts={"deux"}).stream_batch(user_id, items, transaction_id)
+        return [json.loads(line) async for line in stream]
+
+    lines = asyncio.run(consume())
+
+    results = {line["index"]: line for line in lines if line["type"] == "result"}
+    assert results[0]["result"] == "UN" and results[2]["result"] == "TROIS"
+    assert results[1] == {"type": "result", "index": 1, "item_type": "text", "success": False, "error": "quota dépassé"}
+    summary = lines[-1]
+    assert summary["type"] == "summary"
+    assert summary["succeeded"] == 2 and summary["failed"] == 1
+    assert summary["credits_charged"] == 2 and summary["credits_refunded"] == 1 and summary["credits_left"] == 1
+    assert credits_of(user_id) == 1
+
+def test_disconnect_bills_only_delivered_items():
+    user_id = create_user("disconnect@test.fr", 4)
+    db = make_db()
+    transaction_id = db.reserve_credits(user_id, 4, "batch_generation")
+    db.close()
+    items = [BatchItem(type="text", prompt=prompt) for prompt in ("vite", "lent1", "lent2", "lent3")]
+    service = make_service(delays={"lent1": 0.3, "lent2": 0.3, "lent3": 0.3})
+
+    async def disconnect_after_first_result():
+        stream = service.stream_batch(user_id, items, transaction_id)
+        first = json.loads(await stream.__anext__())
+        await stream.aclose()  # Le client se déconnecte
+        return first
+
+    first = asyncio.run(disconnect_after_first_result())
+
+    assert first["index"] == 0 and first["success"]
+    assert credits_of(user_id) == 3  # 1 crédit facturé, 3 restitués
+    transaction = transaction_of(transaction_id)
+    assert transaction.status == "settled" and transaction.amount == 1
+
+def test_api_error_is_a_failed_item(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")  # Client construit à l'import, jamais appelé
+    import openai_client
+    from ai_service import ai_service
+    monkeypatch.setattr(openai_client, "use_openai_api", lambda: True)
+    monkeypatch.setattr(ai_service, "generate_text", lambda prompt, plan: {"success": False, "error": "503"})
+    assert BatchService().generate_item(BatchItem(type="text", prompt="x")) == {"success": False, "error": "503"}
+
+    monkeypatch.setattr(ai_service, "generate_text", lambda prompt, plan: {"success": True, "text": plan})
+    assert BatchService().generate_item(BatchItem(type="text", prompt="x"), "pro") == {"success": True, "result": "pro"}
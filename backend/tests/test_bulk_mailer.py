@@ -0,0 +1,163 @@
+
+# Tests des envois groupés
+
+import asyncio
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+import pytest
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import Base, User
+from database import DatabaseService
+from bulk_mailer import BulkMailer, MailingJob, RateLimiter, DAILY_REMINDER_JOB
+
+engine = create_engine(
+    "sqlite:///:memory:",
+    poolclass=StaticPool,
+    connect_args={"check_same_thread": False},
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+Base.metadata.create_all(bind=engine)
+
+def make_db():
+    return DatabaseService(TestingSessionLocal())
+
+@pytest.fixture(scope="module", autouse=True)
+def users():
+    db = TestingSessionLocal()
+    db.add_all([User(email=f"user{i}@test.fr", hashed_password="x", referral_code=f"REF{i}", credits=i)
+                for i in range(1, 26)])
+    db.commit()
+    db.close()
+
+def active_users_chunk(db, after_id, limit):
+    """Lot de destinataires d'id > after_id, paginé par clé comme les jobs réels"""
+    rows = db.db.query(User.id, User.email, User.credits).filter(
+        User.is_active == True, User.id > (after_id or 0)
+    ).order_by(User.id).limit(limit).all()
+    return [{"id": row.id, "email": row.email, "credits": row.credits} for row in rows]
+
+def make_job(skip_even=False):
+    def render(recipient):
+        if skip_even and recipient["id"] % 2 == 0:
+            return None
+        return "Sujet", f"<p>{recipient['credits']} crédits</p>", None
+    return MailingJob(name="test", fetch_chunk=active_users_chunk, render=render)
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.now += seconds
+
+def test_rate_limiter_spaces_sends_after_burst():
+    clock = FakeClock()
+    limiter = RateLimiter(rate=10, burst=3, clock=clock, sleep=clock.sleep)
+
+    async def scenario():
+        for _ in range(6):
+            await limiter.acquire()
+    asyncio.run(scenario())
+
+    # 3 envois immédiats puis un toutes les 100 ms
+    assert clock.now == pytest.approx(0.3)
+
+def test_run_sends_every_recipient_with_bounded_concurrency():
+    in_flight = {"current": 0, "peak": 0}
+    sent = []
+
+    async def send(to, subject, html, text):
+        in_flight["current"] += 1
+        in_flight["peak"] = max(in_flight["peak"], in_flight["current"])
+        await asyncio.sleep(0.001)
+        in_flight["current"] -= 1
+        sent.append(to)
+        return {"success": True}
+
+    mailer = BulkMailer(concurrency=4, rate=0, chunk_size=10, send=send, db_factory=make_db)
+    report = asyncio.run(mailer.run(make_job(skip_even=True), "concurrence"))
+
+    assert report["status"] == "completed"
+    assert report["sent"] == 13 and report["skipped"] == 12
+    assert sorted(sent) == sorted(f"user{i}@test.fr" for i in range(1, 26, 2))
+    assert in_flight["peak"] <= 4
+
+def test_interrupted_run_resumes_from_last_checkpoint():
+    """Un envoi interrompu reprend après le dernier lot terminé, sans renvoyer les lots précédents"""
+    sent = []
+
+    async def flaky_send(to, subject, html, text):
+        if to == "user15@test.fr" and to not in sent:
+            sent.append(to)
+            raise RuntimeError("crash du worker")
+        sent.append(to)
+        return {"success": True}
+
+    class Crash(Exception):
+        pass
+
+    def fetch(db, after_id, limit):
+        if after_id == 10 and not crashed:
+            crashed.append(True)
+            raise Crash()
+        return active_users_chunk(db, after_id, limit)
+    crashed = []
+    job = MailingJob(name="reprise", fetch_chunk=fetch, render=make_job().render)
+
+    mailer = BulkMailer(concurrency=2, rate=0, chunk_size=10, send=flaky_send, db_factory=make_db)
+    with pytest.raises(Crash):
+        asyncio.run(mailer.run(job, "2026-W01"))
+
+    report = asyncio.run(mailer.run(job, "2026-W01"))
+
+    assert report["status"] == "completed"
+    assert report["total_sent"] == 24 and report["failed"] == 1
+    assert len(sent) == 25  # Aucun destinataire du premier lot n'est renvoyé
+    assert asyncio.run(mailer.run(job, "2026-W01"))["sent"] == 0
+
+def test_daily_reminders_page_by_last_activity_and_resume():
+    """Rappels : lots parcourus par (last_active_at, id), reprise sur cette clé composite"""
+    db = make_db()
+    old = datetime.utcnow() - timedelta(days=5)
+    # Utilisateurs 20 à 25 inactifs, dont 22 et 24 à égalité
+    for user_id, days in {20: 3, 21: 9, 22: 7, 23: 4, 24: 7, 25: 8}.items():
+        db.db.query(User).filter(User.id == user_id).update({User.last_active_at: old - timedelta(days=days)})
+    db.db.commit()
+    db.close()
+
+    sent = []
+
+    async def send(to, subject, html, text):
+        sent.append(to)
+        return {"success": True}
+
+    class Crash(Exception):
+        pass
+
+    def fetch(db, cursor, limit):
+        if cursor is not None and not crashed:
+            crashed.append(cursor)
+            raise Crash()
+        return DAILY_REMINDER_JOB.fetch_chunk(db, cursor, limit)
+    crashed = []
+    job = MailingJob(name="rappels", fetch_chunk=fetch, render=lambda recipient: ("Sujet", "<p>x</p>", None),
+                     cursor=DAILY_REMINDER_JOB.cursor)
+
+    mailer = BulkMailer(concurrency=2, rate=0, chunk_size=2, send=send, db_factory=make_db)
+    with pytest.raises(Crash):
+        asyncio.run(mailer.run(job, "2026-10-19"))
+    report = asyncio.run(mailer.run(job, "2026-10-19"))
+
+    assert report["status"] == "completed" and report["total_sent"] == 6
+    # Plus ancien d'abord ; 22 et 24 départagés par id ; le premier lot n'est pas renvoyé
+    assert sent == [f"user{i}@test.fr" for i in (21, 25, 22, 24, 23, 20)]
+    assert crashed[0][1] == 25
@@ -0,0 +1,104 @@
+
+# Tests du calendrier de contenu : flux NDJSON par semaine, insertion par lots, pagination
+
+import json
+from datetime import date
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import Base
+from database import DatabaseService
+from calendar_service import CalendarService
+
+engine = create_engine(
+    "sqlite:///:memory:",
+    poolclass=StaticPool,
+    connect_args={"check_same_thread": False},
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+Base.metadata.create_all(bind=engine)
+
+START = date(2026, 10, 21)  # Un mercredi : la première semaine du plan est décalée
+
+class RecordingDatabase(DatabaseService):
+    batches = []
+
+    def add_calendar_entries(self, calendar_id, entries):
+        self.batches.append(len(entries))
+        return super().add_calendar_entries(calendar_id, entries)
+
+def create_calendar(duration_days: int) -> dict:
+    db = DatabaseService(TestingSessionLocal())
+    calendar = db.create_content_calendar(1, "coaching", duration_days, START)
+    db.close()
+    return calendar
+
+def get_calendar(calendar_id: int) -> dict:
+    db = DatabaseService(TestingSessionLocal())
+    calendar = db.get_content_calendar(calendar_id, 1)
+    db.close()
+    return calendar
+
+def make_service(insert_batch: int) -> CalendarService:
+    RecordingDatabase.batches = []
+    return CalendarService(insert_batch=insert_batch, db_factory=lambda: RecordingDatabase(TestingSessionLocal()))
+
+def test_stream_yields_one_line_per_week_and_inserts_in_batches():
+    calendar = create_calendar(60)
+    lines = [json.loads(line) for line in make_service(insert_batch=5).stream_calendar(calendar)]
+
+    assert lines[0]["type"] == "calendar" and lines[-1]["type"] == "summary"
+    weeks = lines[1:-1]
+    assert [line["week"] for line in weeks] == list(range(1, 10))
+    for line in weeks:
+        assert {entry["week"] for entry in line["entries"]} == {line["week"]}
+    assert [entry["weekday"] for entry in weeks[0]["entries"]] == ["Mercredi", "Vendredi", "Lundi"]
+
+    entries = [entry for line in weeks for entry in line["entries"]]
+    assert lines[-1]["entries"] == len(entries) == 26  # 8 semaines pleines (3 posts) + mer. et ven.
+    # Une insertion par lot de 2 semaines, plus le reliquat
+    assert RecordingDatabase.batches == [6, 6, 6, 6, 2]
+    stored = get_calendar(calendar["calendar_id"])
+    assert stored["status"] == "completed" and stored["entries_count"] == 26
+
+def test_disconnect_still_persists_the_whole_calendar():
+    calendar = create_calendar(60)
+    stream = make_service(insert_batch=5).stream_calendar(calendar)
+    next(stream)  # Métadonnées
+    first_week = json.loads(next(stream))
+    stream.close()  # Le client se déconnecte
+
+    # Seule la première semaine a été envoyée : le reste est inséré à la fermeture du flux
+    assert first_week["week"] == 1
+    stored = get_calendar(calendar["calendar_id"])
+    assert stored["status"] == "completed" and stored["entries_count"] == 26
+    assert RecordingDatabase.batches == [6, 6, 6, 6, 2]
+
+def test_entries_keyset_pages_cover_every_day_once():
+    calendar = create_calendar(28)
+    list(make_service(insert_batch=100).stream_calendar(calendar))
+    db = DatabaseService(TestingSessionLocal())
+    everything = db.get_calendar_entries(calendar["calendar_id"], limit=500)
+    assert len(everything) == 12
+
+    pages = []
+    after_day = -1
+    while True:
+        page = db.get_calendar_entries(calendar["calendar_id"], after_day, limit=4)
+        pages.append(page)
+        if len(page) < 4:
+            break
+        after_day = page[-1]["day_index"]
+
+    # 12 entrées par pages de 4 : la dernière page pleine est suivie d'une page vide
+    assert [len(page) for page in pages] == [4, 4, 4, 0]
+    assert [entry for page in pages for entry in page] == everything
+    day_indexes = [entry["day_index"] for entry in everything]
+    assert day_indexes == sorted(set(day_indexes))
+    assert db.get_calendar_entries(calendar["calendar_id"], day_indexes[-1]) == []
+    db.close()
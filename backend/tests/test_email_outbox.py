@@ -0,0 +1,161 @@
+
+# Tests de l'outbox des emails transactionnels
+
+import asyncio
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import Base, EmailOutbox
+from database import DatabaseService
+from email_outbox import OutboxWorker
+
+engine = create_engine(
+    "sqlite:///:memory:",
+    poolclass=StaticPool,
+    connect_args={"check_same_thread": False},
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+Base.metadata.create_all(bind=engine)
+
+def make_db():
+    return DatabaseService(TestingSessionLocal())
+
+def get_email(email_id):
+    db = TestingSessionLocal()
+    try:
+        return db.query(EmailOutbox).filter(EmailOutbox.id == email_id).first()
+    finally:
+        db.close()
+
+def make_worker(send, **kwargs):
+    options = dict(batch_size=10, max_attempts=3, backoff_base=60, backoff_max=600, lease_seconds=30,
+                   send=send, db_factory=make_db)
+    options.update(kwargs)
+    return OutboxWorker(**options)
+
+def test_queued_email_is_discarded_with_rolled_back_transaction():
+    """Un email ajouté sans commit disparaît si la transaction métier échoue"""
+    db = make_db()
+    db.queue_email("perdu@test.fr", "welcome_email", {"user_email": "perdu@test.fr"}, commit=False)
+    db.db.rollback()
+    db.close()
+
+    assert make_db().claim_outbox_batch(10, 30) == []
+
+def test_worker_sends_and_marks_emails():
+    sent = []
+
+    async def send(to, subject, html, text):
+        sent.append((to, subject))
+        return {"success": True}
+
+    db = make_db()
+    email_id = db.queue_email("ok@test.fr", "token_reward",
+                              {"reward_amount": 5, "reason": "Test", "new_balance": 15}).id
+    db.close()
+
+    assert asyncio.run(make_worker(send).drain_once()) == 1
+    assert sent == [("ok@test.fr", "🎉 +5 jetons SaaS gagnés !")]
+    assert get_email(email_id).status == "sent"
+
+def test_failures_are_retried_with_backoff_then_dead_lettered():
+    async def send(to, subject, html, text):
+        return {"success": False, "error": "SMTP indisponible"}
+
+    db = make_db()
+    email_id = db.queue_email("ko@test.fr", "referral_success", {"referred_email": "ami@test.fr", "reward": 25}).id
+    db.close()
+    worker = make_worker(send)
+
+    for attempt in range(1, 4):
+        assert asyncio.run(worker.drain_once()) == 1
+        email = get_email(email_id)
+        assert email.attempts == attempt
+        if attempt < 3:
+            assert email.status == "pending"
+            delay = (email.next_attempt_at - datetime.utcnow()).total_seconds()
+            assert 60 * 2 ** (attempt - 1) / 2 - 1 <= delay <= 60 * 2 ** (attempt - 1)
+            # Pas de nouvelle tentative avant l'échéance
+            assert asyncio.run(worker.drain_once()) == 0
+            session = TestingSessionLocal()
+            session.query(EmailOutbox).filter(EmailOutbox.id == email_id).update(
+                {EmailOutbox.next_attempt_at: datetime.utcnow() - timedelta(seconds=1)})
+            session.commit()
+            session.close()
+
+    email = get_email(email_id)
+    assert email.status == "dead"
+    assert email.last_error == "SMTP indisponible"
+    assert worker.snapshot() == {"sent": 0, "retried": 2, "dead": 1}
+
+def test_expired_lease_is_reclaimed():
+    """Un email réservé par un worker arrêté est repris à l'expiration du bail"""
+    db = make_db()
+    email_id = db.queue_email("bail@test.fr", "welcome_email", {"user_email": "bail@test.fr"}).id
+    assert [e["id"] for e in db.claim_outbox_batch(10, 30)] == [email_id]
+    assert db.claim_outbox_batch(10, 30) == []
+
+    db.db.query(EmailOutbox).filter(EmailOutbox.id == email_id).update(
+        {EmailOutbox.locked_until: datetime.utcnow() - timedelta(seconds=1)})
+    db.db.commit()
+    assert [e["attempts"] for e in db.claim_outbox_batch(10, 30)] == [2]
+    db.close()
+
+def test_email_claimed_by_another_worker_is_skipped():
+    """Un email réservé par un autre worker entre la lecture et l'UPDATE n'est pas pris deux fois"""
+    from sqlalchemy import event
+
+    db = make_db()
+    ids = [db.queue_email(f"course{i}@test.fr", "welcome_email", {"user_email": "x"}).id for i in range(3)]
+    raced = []
+
+    def other_worker_claims_first(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("UPDATE email_outbox") and not raced:
+            raced.append(ids[1])
+            cursor.execute("UPDATE email_outbox SET status = 'sending', attempts = 1, locked_until = ? WHERE id = ?",
+                           ((datetime.utcnow() + timedelta(seconds=30)).isoformat(" "), ids[1]))
+
+    event.listen(engine, "before_cursor_execute", other_worker_claims_first)
+    try:
+        claimed = db.claim_outbox_batch(10, 30)
+    finally:
+        event.remove(engine, "before_cursor_execute", other_worker_claims_first)
+    db.close()
+
+    assert raced == [ids[1]]
+    assert [e["id"] for e in claimed] == [ids[0], ids[2]]
+    assert get_email(ids[1]).attempts == 1  # Compté une seule fois, par l'autre worker
+
+def test_referral_reward_and_notification_share_one_transaction():
+    """Récompense de parrainage et email validés ensemble, ou pas du tout"""
+    from models import SaasToken, User
+    db = make_db()
+    db.db.add_all([User(email="parrain@test.fr", hashed_password="x", referral_code="PARRAIN"),
+                   User(email="filleul@test.fr", hashed_password="x", referral_code="FILLEUL")])
+    db.db.commit()
+    referrer_id = db.get_user_by_email("parrain@test.fr").id
+
+    def refer():
+        result = db.process_referral(referrer_id, "filleul@test.fr", commit=False)
+        db.queue_email("parrain@test.fr", "referral_success",
+                       {"referred_email": "filleul@test.fr", "reward": result["referrer_reward"]}, commit=False)
+        return result
+
+    assert refer()["referrer_balance"] == 25
+    db.db.rollback()  # Crash avant le commit
+    assert db.get_user_by_email("filleul@test.fr").referred_by is None
+    assert db.db.query(SaasToken).filter(SaasToken.user_id == referrer_id).count() == 0
+    assert db.db.query(EmailOutbox).filter(EmailOutbox.to_email == "parrain@test.fr").count() == 0
+
+    refer()
+    db.db.commit()
+    assert db.get_user_by_email("filleul@test.fr").referred_by == "PARRAIN"
+    assert db.db.query(SaasToken).filter(SaasToken.user_id == referrer_id).count() == 1
+    assert db.db.query(EmailOutbox).filter(EmailOutbox.to_email == "parrain@test.fr").count() == 1
+    db.close()
@@ -0,0 +1,86 @@
+
+# Tests du stockage compressé des SaaS générés
+
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import blob_codec
+from blob_codec import compress_json, decompress_json
+from models import Base, GeneratedSaas
+from database import DatabaseService
+
+engine = create_engine(
+    "sqlite:///:memory:",
+    poolclass=StaticPool,
+    connect_args={"check_same_thread": False},
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+Base.metadata.create_all(bind=engine)
+
+DATA = {
+    "saas_idea": {"name": "FacturIA", "description": "Factures générées par l'IA pour artisans"},
+    "code_structure": {"files": ["main.py"] * 200},
+    "marketing_strategy": {"channels": ["LinkedIn", "Newsletter"], "budget": 1500.5}
+}
+
+def test_zlib_round_trip():
+    blob, codec, raw_size = compress_json(DATA, "zlib")
+    assert codec == "zlib" and len(blob) < raw_size
+    assert decompress_json(blob, codec) == DATA
+    with pytest.raises(ValueError):
+        compress_json(DATA, "lz4")
+
+def test_zstd_round_trip():
+    pytest.importorskip("zstandard")
+    blob, codec, raw_size = compress_json(DATA, "zstd")
+    assert codec == "zstd" and len(blob) < raw_size
+    assert decompress_json(blob, codec) == DATA
+
+def test_falls_back_to_zlib_without_zstandard(monkeypatch):
+    monkeypatch.setattr(blob_codec, "zstandard", None)
+    blob, codec, _ = compress_json(DATA)
+    assert codec == "zlib" and decompress_json(blob, codec) == DATA
+    # Un contenu zstd déjà stocké exige le paquet pour être relu
+    with pytest.raises(RuntimeError):
+        decompress_json(b"", "zstd")
+
+def test_listing_pages_without_loading_payloads():
+    db = DatabaseService(TestingSessionLocal())
+    created_at = datetime(2026, 10, 1)
+    ids = []
+    for index in range(5):
+        saas_id = db.create_generated_saas(7, f"SaaS {index}", DATA)
+        # Deux SaaS créés au même instant : départagés par id
+        db.db.query(GeneratedSaas).filter(GeneratedSaas.id == saas_id).update(
+            {GeneratedSaas.created_at: created_at + timedelta(minutes=min(index, 3))})
+        ids.append(saas_id)
+    db.db.commit()
+    db.create_generated_saas(8, "Autre utilisateur", DATA)
+
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        first = db.get_user_generated_saas(7, limit=2)
+        last = first[-1]
+        second = db.get_user_generated_saas(7, (last["created_at"], last["id"]), limit=2)
+        last = second[-1]
+        third = db.get_user_generated_saas(7, (last["created_at"], last["id"]), limit=2)
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+
+    assert [row["id"] for row in first + second + third] == [ids[4], ids[3], ids[2], ids[1], ids[0]]
+    assert first[0]["description"] == DATA["saas_idea"]["description"]
+    assert statements and not any("payload" in statement for statement in statements)
+
+    detail = db.get_generated_saas_by_id(ids[0], 7)
+    assert detail["code_structure"] == DATA["code_structure"]
+    assert db.get_generated_saas_by_id(ids[0], 8) is None
+    db.close()
@@ -0,0 +1,145 @@
+
+# Tests du client HTTP partagé (webhooks)
+
+import asyncio
+import json
+import httpx
+import pytest
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from http_client import HTTPClient, ResponseTooLarge
+
+def make_client(handler, **kwargs):
+    options = {"backoff_base": 0.01, "backoff_max": 0.05}
+    options.update(kwargs)
+    return HTTPClient(transport=httpx.MockTransport(handler), **options)
+
+def test_retries_server_errors_then_succeeds():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        if len(calls) < 3:
+            return httpx.Response(503, headers={"retry-after": "0"})
+        return httpx.Response(200, json={"ok": True})
+
+    async def scenario():
+        client = make_client(handler, max_attempts=3)
+        response = await client.request("POST", "https://hooks.test/a", json={"x": 1})
+        await client.aclose()
+        return client, response
+
+    client, response = asyncio.run(scenario())
+    assert response.status_code == 200 and json.loads(response.text) == {"ok": True}
+    assert len(calls) == 3 and client.stats["retries"] == 2
+    # Même clé d'idempotence pour toutes les tentatives d'un même envoi
+    keys = {request.headers["idempotency-key"] for request in calls}
+    assert len(keys) == 1 and len(keys.pop()) == 32
+
+def test_idempotency_key_per_request_and_overridable():
+    seen = []
+
+    def handler(request):
+        seen.append((request.method, request.headers.get("idempotency-key")))
+        return httpx.Response(200)
+
+    async def scenario():
+        client = make_client(handler)
+        headers = {"Content-Type": "application/json"}
+        await client.request("POST", "https://hooks.test/a", json={}, headers=headers)
+        await client.request("POST", "https://hooks.test/a", json={})
+        await client.request("POST", "https://hooks.test/a", headers={"Idempotency-Key": "run-42"})
+        await client.request("GET", "https://hooks.test/a")
+        return headers
+
+    headers = asyncio.run(scenario())
+    assert headers == {"Content-Type": "application/json"}  # Les en-têtes de l'appelant ne sont pas modifiés
+    assert seen[0][1] != seen[1][1]
+    assert seen[2] == ("POST", "run-42") and seen[3] == ("GET", None)
+
+def test_client_of_a_finished_loop_is_closed():
+    client = make_client(lambda request: httpx.Response(204))
+
+    async def call():
+        await client.request("GET", "https://hooks.test/a")
+        return client._client
+
+    first = asyncio.run(call())
+    second = asyncio.run(call())
+    assert first is not second and first.is_closed and not second.is_closed
+    assert client.stats["clients"] == 2
+
+def test_client_errors_and_exhausted_retries_are_returned():
+    statuses = {"/bad": 400, "/down": 500}
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.path)
+        return httpx.Response(statuses[request.url.path])
+
+    async def scenario():
+        client = make_client(handler, max_attempts=2)
+        return [(await client.request("GET", f"https://hooks.test{path}")).status_code for path in statuses]
+
+    assert asyncio.run(scenario()) == [400, 500]
+    assert calls == ["/bad", "/down", "/down"]
+
+def test_response_size_is_limited():
+    def handler(request):
+        return httpx.Response(200, content=b"x" * 2048)
+
+    async def scenario():
+        client = make_client(handler, max_response_bytes=1024)
+        with pytest.raises(ResponseTooLarge):
+            await client.request("GET", "https://hooks.test/big")
+        return client
+
+    assert asyncio.run(scenario()).stats["too_large"] == 1
+
+def test_per_host_concurrency_and_total_timeout():
+    active = {"hooks.test": 0, "other.test": 0}
+    peak = dict(active)
+
+    async def handler(request):
+        host = request.url.host
+        active[host] += 1
+        peak[host] = max(peak[host], active[host])
+        await asyncio.sleep(0.2 if request.url.path == "/slow" else 0.02)
+        active[host] -= 1
+        return httpx.Response(204)
+
+    async def scenario():
+        client = make_client(handler, per_host_concurrency=2, total_timeout=0.1)
+        urls = [f"https://hooks.test/{i}" for i in range(6)] + [f"https://other.test/{i}" for i in range(6)]
+        responses = await asyncio.gather(*(client.request("POST", url) for url in urls))
+        with pytest.raises(asyncio.TimeoutError):
+            await client.request("GET", "https://hooks.test/slow")
+        return responses
+
+    assert all(r.status_code == 204 for r in asyncio.run(scenario()))
+    assert peak == {"hooks.test": 2, "other.test": 2}
+
+def test_connections_are_kept_alive():
+    connections = []
+
+    async def handle(reader, writer):
+        connections.append(writer)
+        while await reader.readuntil(b"\r\n\r\n"):
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok")
+            await writer.drain()
+
+    async def scenario():
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        client = HTTPClient()
+        for _ in range(5):
+            response = await client.request("GET", f"http://127.0.0.1:{port}/hook")
+            assert response.text == "ok"
+        await client.aclose()
+        server.close()
+
+    asyncio.run(scenario())
+    assert len(connections) == 1
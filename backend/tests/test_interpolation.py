@@ -0,0 +1,78 @@
+
+# Tests de l'interpolation {{variable}} des configs d'automatisation et de campagne
+
+import asyncio
+import pytest
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import interpolation
+from interpolation import TemplateError, compile_template, template_variables
+from scheduler import AsyncScheduler
+from automation_service import AutomationService, compile_actions
+
+def test_compiles_once_and_renders_nested_values(monkeypatch):
+    template = compile_template({
+        "subject": "Newsletter du {{ date }}",
+        "data": "{{payload}}",
+        "tags": ["{{tag}}", "fixe", 3],
+    })
+    assert template.variables == {"date", "payload", "tag"}
+
+    # Le rendu ne repasse plus par l'analyse du texte
+    monkeypatch.setattr(interpolation, "PLACEHOLDER", None)
+    rendered = template.render({"date": "19/10/2026", "payload": {"id": 7}, "tag": "saas"})
+
+    assert rendered == {"subject": "Newsletter du 19/10/2026", "data": {"id": 7}, "tags": ["saas", "fixe", 3]}
+    with pytest.raises(TemplateError, match="tag"):
+        template.render({"date": "x", "payload": 1})
+
+def test_unknown_and_malformed_variables_are_rejected_up_front():
+    with pytest.raises(TemplateError, match="crm_webhook"):
+        compile_template({"url": "{{crm_webhook}}"}, allowed={"date"})
+    with pytest.raises(TemplateError, match="Placeholder invalide"):
+        compile_template("Bonjour {{ user.email }}")
+    assert template_variables({"subject": "{{product_name}}", "content": "{{product_name}} {{tip}}"}) == [
+        "product_name", "tip"]
+
+def test_actions_only_see_outputs_from_upstream_actions():
+    compile_actions({"actions": [
+        {"id": "gen", "type": "generate_content", "prompt": "Post du {{date}}", "depends_on": []},
+        {"id": "post", "type": "post_social", "content": "{{generated_content}}", "depends_on": ["gen"]},
+    ]})
+    with pytest.raises(TemplateError, match="post"):
+        compile_actions({"actions": [
+            {"id": "gen", "type": "generate_content", "prompt": "x", "depends_on": []},
+            {"id": "post", "type": "post_social", "content": "{{generated_content}}", "depends_on": []},
+        ]})
+
+def test_run_renders_context_and_upstream_outputs():
+    service = AutomationService(scheduler=AsyncScheduler(), db_factory=None)
+    received = []
+
+    def generate(action, user_id, inputs):
+        received.append(action)
+        return {"success": True, "outputs": {"generated_content": "Contenu IA"}}
+
+    def post(action, user_id, inputs):
+        received.append(action)
+        return {"success": True}
+
+    service.action_generate_content = generate
+    service.action_post_social = post
+    config = {
+        "variables": {"product_name": "SmartSaaS"},
+        "actions": [
+            {"type": "generate_content", "prompt": "Post sur {{product_name}} du {{date}}"},
+            {"type": "post_social", "content": "{{generated_content}} #{{product_name}}"},
+        ],
+    }
+
+    results = asyncio.run(service.run_actions(config, 1, {"date": "19/10/2026", "product_name": "SmartSaaS"}))
+
+    assert all(r["success"] for r in results)
+    assert received[0]["prompt"] == "Post sur SmartSaaS du 19/10/2026"
+    assert received[1]["content"] == "Contenu IA #SmartSaaS"
+    assert config["actions"][1]["content"] == "{{generated_content}} #{{product_name}}"
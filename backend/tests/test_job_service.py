@@ -0,0 +1,308 @@
+
+# Tests du pipeline de jobs de génération
+
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import Base, GenerationJob, User
+from database import DatabaseService
+from job_service import JobService, JobStageError
+
+engine = create_engine(
+    "sqlite:///:memory:",
+    poolclass=StaticPool,
+    connect_args={"check_same_thread": False},
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+Base.metadata.create_all(bind=engine)
+
+def make_service(stages, on_failure=None):
+    service = JobService(max_workers=1, stale_after_seconds=60,
+                         db_factory=lambda: DatabaseService(TestingSessionLocal()))
+    service.register_pipeline("test", stages, on_failure=on_failure)
+    return service
+
+def create_job(job_id, user_id=1):
+    db = DatabaseService(TestingSessionLocal())
+    db.create_generation_job(job_id, user_id, "test", {"prompt": "idée"})
+    db.close()
+
+def test_run_job_persists_each_stage():
+    """Chaque étape terminée est persistée et le job passe en 'completed'"""
+    service = make_service([
+        ("first", lambda db, job: {"value": job["payload"]["prompt"]}),
+        ("second", lambda db, job: job["results"]["first"]["value"].upper()),
+    ])
+    create_job("job-complete")
+
+    service.run_job("job-complete")
+
+    job = service.get_job("job-complete")
+    assert job["status"] == "completed"
+    assert job["results"] == {"first": {"value": "idée"}, "second": "IDÉE"}
+    assert service.public_view(job)["progress"] == 1.0
+
+def test_crashed_job_resumes_from_last_completed_stage():
+    """Un job abandonné reprend sans rejouer les étapes déjà persistées"""
+    calls = []
+
+    def first(db, job):
+        calls.append("first")
+        return "fresh"
+
+    def second(db, job):
+        calls.append("second")
+        return job["results"]["first"] + "-second"
+
+    service = make_service([("first", first), ("second", second)])
+    create_job("job-crashed")
+
+    # Simule un worker mort après la première étape
+    db = DatabaseService(TestingSessionLocal())
+    db.save_generation_job_stage("job-crashed", "first", "persisted")
+    db.db.query(GenerationJob).filter(GenerationJob.id == "job-crashed").update({
+        GenerationJob.status: "running",
+        GenerationJob.updated_at: datetime.utcnow() - timedelta(minutes=5)
+    })
+    db.db.commit()
+    assert "job-crashed" in db.get_resumable_generation_jobs(60)
+    db.close()
+
+    service.run_job("job-crashed")
+
+    job = service.get_job("job-crashed")
+    assert calls == ["second"]
+    assert job["status"] == "completed"
+    assert job["results"]["second"] == "persisted-second"
+    assert job["attempts"] == 1
+
+def test_running_job_is_not_claimed_twice():
+    """Un job en cours sur un autre worker n'est pas repris"""
+    calls = []
+    service = make_service([("only", lambda db, job: calls.append("only"))])
+    create_job("job-busy")
+
+    db = DatabaseService(TestingSessionLocal())
+    assert db.claim_generation_job("job-busy", 60)
+    db.close()
+
+    service.run_job("job-busy")
+    assert calls == []
+
+def test_failed_job_runs_compensation():
+    """Un échec marque le job 'failed' et déclenche la compensation"""
+    db = DatabaseService(TestingSessionLocal())
+    user = User(email="jobs@example.com", hashed_password="x", credits=0, referral_code="JOBS0001")
+    db.db.add(user)
+    db.db.commit()
+    user_id = user.id
+    db.close()
+
+    def failing(db, job):
+        raise JobStageError("quota dépassé")
+
+    service = make_service(
+        [("only", failing)],
+        on_failure=lambda db, job: db.add_credits(job["user_id"], 15)
+    )
+    create_job("job-failed", user_id=user_id)
+
+    service.run_job("job-failed")
+
+    job = service.get_job("job-failed")
+    assert job["status"] == "failed"
+    assert job["error"] == "quota dépassé"
+
+    db = DatabaseService(TestingSessionLocal())
+    assert db.get_user_by_id(user_id).credits == 15
+    db.close()
+
+def test_save_stage_is_atomic_with_its_result():
+    """Un crash avant la persistance de l'étape 'save' ne laisse ni SaaS ni récompense en double"""
+    from job_service import _stage_save
+    from models import GeneratedSaas, SaasToken
+
+    class CrashingDatabase(DatabaseService):
+        def save_generation_job_stage(self, job_id, stage, value):
+            if stage == "save":
+                raise RuntimeError("worker tué")
+            return super().save_generation_job_stage(job_id, stage, value)
+
+    def make(db_factory):
+        service = JobService(max_workers=1, stale_after_seconds=60, db_factory=db_factory)
+        service.register_pipeline("test", [("save", _stage_save)])
+        return service
+
+    create_job("job-save", user_id=42)
+    db = DatabaseService(TestingSessionLocal())
+    db.save_generation_job_stage("job-save", "saas_idea", {"name": "Idée", "description": "d"})
+    db.save_generation_job_stage("job-save", "code_structure", {})
+    db.save_generation_job_stage("job-save", "marketing_strategy", {})
+    db.close()
+
+    make(lambda: CrashingDatabase(TestingSessionLocal())).run_job("job-save")
+
+    db = DatabaseService(TestingSessionLocal())
+    assert db.db.query(GeneratedSaas).filter(GeneratedSaas.user_id == 42).count() == 0
+    assert db.db.query(SaasToken).filter(SaasToken.user_id == 42).count() == 0
+    # Le job est repris comme après un crash
+    db.db.query(GenerationJob).filter(GenerationJob.id == "job-save").update({
+        GenerationJob.status: "running",
+        GenerationJob.updated_at: datetime.utcnow() - timedelta(minutes=5)
+    })
+    db.db.commit()
+    db.close()
+
+    make(lambda: DatabaseService(TestingSessionLocal())).run_job("job-save")
+
+    db = DatabaseService(TestingSessionLocal())
+    saas = db.db.query(GeneratedSaas).filter(GeneratedSaas.user_id == 42).all()
+    assert len(saas) == 1
+    assert db.db.query(SaasToken).filter(SaasToken.user_id == 42).count() == 1
+    assert db.get_generation_job("job-save")["results"]["save"] == {"saas_id": saas[0].id}
+    db.close()
+
+def test_image_pipeline_stores_once_and_reuses_identical_prompts(monkeypatch, tmp_path):
+    """L'image est générée, stockée puis réutilisée pour un prompt identique ; un échec restitue les crédits"""
+    import media_store
+    import openai_client
+    from job_service import _stage_image, _stage_store_image, _refund_image_generation
+    from models import ImageAsset
+
+    png = b"\x89PNG\r\n\x1a\n" + b"\x00" * 64
+    store = media_store.MediaStore(str(tmp_path))
+    store.download = lambda url, max_bytes=None: (store.put(png), png)
+    monkeypatch.setattr(media_store, "media_store", store)
+    generated = []
+
+    def generate_image(prompt, size, quality):
+        generated.append(prompt)
+        if prompt == "échec":
+            return {"success": False, "error": "contenu refusé"}
+        return {"success": True, "image_url": "https://images.test/1.png"}
+
+    monkeypatch.setattr(openai_client, "generate_image", generate_image)
+    service = JobService(max_workers=1, stale_after_seconds=60,
+                         db_factory=lambda: DatabaseService(TestingSessionLocal()))
+    service.register_pipeline("image", [("image", _stage_image), ("store", _stage_store_image)],
+                              on_failure=_refund_image_generation)
+
+    db = DatabaseService(TestingSessionLocal())
+    user = User(email="image@test.fr", hashed_password="x", referral_code="IMAGE01", credits=0)
+    db.db.add(user)
+    db.db.commit()
+    user_id = user.id
+    for job_id, prompt in (("img-1", "Un chat"), ("img-2", "  un CHAT "), ("img-3", "échec")):
+        db.create_generation_job(job_id, user_id, "image", {"prompt": prompt, "size": "1024x1024", "quality": "standard"})
+    db.close()
+
+    for job_id in ("img-1", "img-2", "img-3"):
+        service.run_job(job_id)
+
+    first, second, failed = (service.get_job(job_id) for job_id in ("img-1", "img-2", "img-3"))
+    assert generated == ["Un chat", "échec"]  # Le second prompt réutilise la première image
+    assert first["status"] == second["status"] == "completed"
+    assert second["results"]["image"]["reused"]
+    stored = first["results"]["store"]
+    assert stored["content_hash"] == second["results"]["store"]["content_hash"]
+    assert store.open_info(stored["content_hash"])[1:] == (len(png), "image/png")
+    assert failed["status"] == "failed"
+
+    db = DatabaseService(TestingSessionLocal())
+    assert db.db.query(ImageAsset).count() == 1
+    assert db.get_user_by_id(user_id).credits == 6  # Image réutilisée non facturée, job en échec restitué
+    db.close()
+
+def test_concurrent_identical_image_prompt_waits_for_the_first_job(monkeypatch):
+    """Un prompt réservé par un job en cours n'est pas régénéré : le second job attend son image"""
+    import job_service
+    import openai_client
+    from media_store import normalize_prompt_hash
+
+    payload = {"prompt": "Un phare", "size": "1024x1024", "quality": "standard"}
+    prompt_hash = normalize_prompt_hash(payload["prompt"], payload["size"], payload["quality"])
+    monkeypatch.setattr(openai_client, "generate_image", lambda *args: pytest.fail("image régénérée"))
+
+    db = DatabaseService(TestingSessionLocal())
+    user = User(email="claim@test.fr", hashed_password="x", referral_code="CLAIM01", credits=0)
+    db.db.add(user)
+    db.db.commit()
+    user_id = user.id
+    db.create_generation_job("waiter", user_id, "image", payload)
+    assert db.claim_image_prompt(prompt_hash, "owner", 60)
+    assert not db.claim_image_prompt(prompt_hash, "waiter", 60)
+    db.close()
+
+    def owner_finishes(seconds):
+        owner = DatabaseService(TestingSessionLocal())
+        owner.create_image_asset(prompt_hash, payload["prompt"], payload["size"], payload["quality"],
+                                 "c" * 64, None, "image/png", 10)
+        owner.release_image_prompt(prompt_hash, "owner")
+        owner.close()
+
+    monkeypatch.setattr(job_service.time, "sleep", owner_finishes)
+    db = DatabaseService(TestingSessionLocal())
+    result = job_service._stage_image(db, {"job_id": "waiter", "user_id": user_id, "payload": payload})
+    db.save_generation_job_stage("waiter", "image", result)  # Commite la restitution avec l'étape
+    db.close()
+
+    assert result["reused"] and result["asset"]["content_hash"] == "c" * 64
+    db = DatabaseService(TestingSessionLocal())
+    assert db.get_user_by_id(user_id).credits == job_service.IMAGE_GENERATION_COST
+    assert db.claim_image_prompt(prompt_hash, "next", 60)  # Réservation libérée par le premier job
+    db.close()
+
+def test_refund_is_not_lost_to_a_concurrent_debit():
+    """Débit et restitution sont des UPDATE relatifs : pas de mise à jour perdue entre sessions"""
+    db = DatabaseService(TestingSessionLocal())
+    user = User(email="concurrent@test.fr", hashed_password="x", referral_code="CONC01", credits=10)
+    db.db.add(user)
+    db.db.commit()
+    user_id = user.id
+
+    request = DatabaseService(TestingSessionLocal())
+    current_user = request.get_user_by_id(user_id)  # Chargé par la requête avant la restitution
+    assert current_user.credits == 10
+
+    db.add_credits(user_id, 15)  # Restitution par un worker de jobs
+    assert request.spend_credits(user_id, 3)
+    assert current_user.credits == 22  # Solde relu après le débit
+    assert not request.spend_credits(user_id, 100)
+    request.close()
+
+    assert db.get_user_by_id(user_id).credits == 22
+    db.close()
+
+def test_periodic_sweep_resumes_stale_jobs_once():
+    """Le balayage périodique reprend un job abandonné sans le planifier deux fois"""
+    submitted = []
+
+    class PausedExecutor:
+        def submit(self, fn, job_id):
+            submitted.append(job_id)
+
+    service = make_service([("only", lambda db, job: "ok")])
+    service.executor = PausedExecutor()
+    create_job("job-abandoned")
+    db = DatabaseService(TestingSessionLocal())
+    db.db.query(GenerationJob).filter(GenerationJob.id == "job-abandoned").update({
+        GenerationJob.status: "running",
+        GenerationJob.updated_at: datetime.utcnow() - timedelta(minutes=5)
+    })
+    db.db.commit()
+    db.close()
+
+    service.resume_interrupted_jobs()
+    service.resume_interrupted_jobs()  # Toujours en file : pas de doublon
+    assert submitted.count("job-abandoned") == 1
+
+    service.run_job("job-abandoned")
+    assert service.get_job("job-abandoned")["status"] == "completed"
+    assert "job-abandoned" not in service._queued
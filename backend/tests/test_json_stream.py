@@ -0,0 +1,72 @@
+
+# Tests de l'analyse incrémentale des réponses JSON de l'IA
+
+import json
+import pytest
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from json_stream import IncrementalJSONParser, StreamingJSONError, TASK_REQUIRED_FIELDS, TASK_SCHEMAS
+
+SAAS_IDEA = {
+    "name": "PlanPro",
+    "description": "Planification \"intelligente\" {pour} freelances",
+    "features": ["Agenda", {"nested": [1, 2]}, "Facturation"],
+    "tech_stack": {"backend": "FastAPI", "frontend": "React"},
+    "monetization": "Abonnement",
+    "target_market": "Freelances",
+    "mvp_timeline": 6,
+    "estimated_cost": "5000€"
+}
+
+def feed_in_chunks(parser, text, size):
+    fields = []
+    for start in range(0, len(text), size):
+        fields.extend(parser.feed(text[start:start + size]))
+    return fields
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 1000])
+def test_fields_are_emitted_as_soon_as_complete(chunk_size):
+    """Chaque champ est retourné une seule fois, quel que soit le découpage du flux"""
+    text = "```json\n" + json.dumps(SAAS_IDEA, ensure_ascii=False, indent=2) + "\n```"
+    parser = IncrementalJSONParser(TASK_SCHEMAS["saas_idea"])
+
+    fields = feed_in_chunks(parser, text, chunk_size)
+
+    assert [name for name, _ in fields] == list(SAAS_IDEA)
+    assert parser.fields == SAAS_IDEA
+    assert parser.schema_complete
+
+def test_schema_complete_before_object_closes():
+    """Le flux peut être coupé dès le dernier champ requis, avant l'accolade finale"""
+    parser = IncrementalJSONParser({"name": (str,), "features": (list,)})
+
+    assert parser.feed('{"name": "A", "features": ["x"') == [("name", "A")]
+    assert not parser.schema_complete
+    assert parser.feed('], "extra": "texte superflu') == [("features", ["x"])]
+    assert parser.schema_complete
+    assert not parser.closed
+
+def test_scalar_value_before_closing_brace():
+    parser = IncrementalJSONParser({})
+    assert parser.feed('{"weeks": 12 }') == [("weeks", 12)]
+    assert parser.closed
+
+def test_schema_type_mismatch_is_rejected():
+    parser = IncrementalJSONParser({"features": (list,)})
+    with pytest.raises(StreamingJSONError):
+        parser.feed('{"features": "pas une liste",')
+
+def test_only_required_fields_are_reported_missing():
+    """Un champ facultatif absent ne bloque pas la réponse ; un champ indispensable si"""
+    parser = IncrementalJSONParser(TASK_SCHEMAS["saas_idea"], TASK_REQUIRED_FIELDS["saas_idea"])
+    parser.feed('{"name": "A", "description": "Outil de devis"}')
+
+    assert parser.closed and parser.missing_fields == []
+    assert not parser.schema_complete
+
+    parser = IncrementalJSONParser(TASK_SCHEMAS["saas_idea"], TASK_REQUIRED_FIELDS["saas_idea"])
+    parser.feed('{"name": "A"}')
+    assert parser.missing_fields == ["description"]
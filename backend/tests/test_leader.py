@@ -0,0 +1,79 @@
+
+# Tests de l'élection du leader (bail en base)
+
+import asyncio
+import tempfile
+import time
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import Base
+from database import DatabaseService
+from leader import LeaderElection
+
+# Fichier SQLite partagé, comme entre plusieurs workers d'un même hôte
+engine = create_engine(
+    f"sqlite:///{tempfile.mkdtemp()}/leader.db",
+    connect_args={"check_same_thread": False},
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+Base.metadata.create_all(bind=engine)
+
+def make_db():
+    return DatabaseService(TestingSessionLocal())
+
+def make_worker(name: str, holder: str, lease_seconds: float = 0.3, renew_interval: float = 0.05):
+    return LeaderElection(name=name, backend="lease", lease_seconds=lease_seconds, renew_interval=renew_interval,
+                          holder=holder, engine=engine, db_factory=make_db)
+
+def test_single_leader_and_handoff_on_expiry():
+    first, second = make_worker("expiry", "worker-1"), make_worker("expiry", "worker-2")
+    assert first.try_acquire()
+    assert not second.try_acquire()
+    assert first.try_acquire()  # Renouvellement
+
+    # Le leader meurt : plus de renouvellement, le bail expire
+    time.sleep(0.35)
+    assert second.try_acquire()
+    assert not first.try_acquire()
+
+def test_release_hands_off_immediately():
+    first, second = make_worker("release", "worker-1", lease_seconds=60), make_worker("release", "worker-2", lease_seconds=60)
+    assert first.try_acquire()
+    assert not second.try_acquire()
+    first.release()
+    assert second.try_acquire()
+
+def test_only_the_leader_runs_scheduled_work():
+    events = []
+    workers = [make_worker("loop", f"worker-{i}") for i in range(3)]
+
+    def callbacks(worker):
+        async def elected():
+            events.append(("elected", worker.holder))
+
+        async def revoked():
+            events.append(("revoked", worker.holder))
+        return elected, revoked
+
+    async def scenario():
+        for worker in workers:
+            worker.start(*callbacks(worker))
+        await asyncio.sleep(0.2)
+        leaders = [worker for worker in workers if worker.is_leader]
+        assert len(leaders) == 1
+        await leaders[0].stop()  # Arrêt propre : un autre worker prend la main
+        await asyncio.sleep(0.2)
+        remaining = [worker for worker in workers if worker.is_leader]
+        for worker in workers:
+            await worker.stop()
+        return leaders[0], remaining
+
+    first_leader, remaining = asyncio.run(scenario())
+    assert len(remaining) == 1 and remaining[0] is not first_leader
+    assert events[:3] == [("elected", first_leader.holder), ("revoked", first_leader.holder),
+                          ("elected", remaining[0].holder)]
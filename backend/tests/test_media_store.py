@@ -0,0 +1,54 @@
+
+# Tests du stockage de médias adressé par contenu et des requêtes Range
+
+import hashlib
+import os
+import pytest
+
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from media_store import MediaStore, guess_mime_type, normalize_prompt_hash, parse_byte_range
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 100
+
+def test_byte_ranges():
+    assert parse_byte_range("bytes=0-9", 100) == (0, 9)
+    assert parse_byte_range("bytes=90-200", 100) == (90, 99)  # Fin bornée à la taille
+    assert parse_byte_range("bytes=50-", 100) == (50, 99)  # Plage ouverte
+    assert parse_byte_range("bytes=-10", 100) == (90, 99)  # Suffixe
+    assert parse_byte_range("bytes=-500", 100) == (0, 99)
+    assert parse_byte_range("bytes=0-9,20-29", 100) is None  # Plages multiples : fichier complet
+    assert parse_byte_range("items=0-9", 100) is None
+
+def test_unsatisfiable_ranges_raise():
+    # ValueError : l'endpoint répond 416 avec Content-Range: bytes */taille
+    for header in ("bytes=100-", "bytes=150-160", "bytes=20-10", "bytes=-0", "bytes=abc-"):
+        with pytest.raises(ValueError):
+            parse_byte_range(header, 100)
+    with pytest.raises(ValueError):
+        parse_byte_range("bytes=-10", 0)
+
+def test_put_deduplicates_by_content(tmp_path):
+    store = MediaStore(str(tmp_path))
+    content_hash = store.put(PNG)
+    assert content_hash == hashlib.sha256(PNG).hexdigest()
+    path = store.path_for(content_hash)
+    written_at = os.stat(path).st_mtime_ns
+
+    assert store.put(PNG) == content_hash  # Contenu identique : pas de réécriture
+    assert os.stat(path).st_mtime_ns == written_at
+    assert store.put(PNG + b"\x01") != content_hash
+    files = [name for _, _, names in os.walk(tmp_path) for name in names]
+    assert len(files) == 2 and not any(name.startswith(".tmp-") for name in files)
+
+    assert store.open_info(content_hash) == (path, len(PNG), "image/png")
+    assert store.open_info("0" * 64) is None
+    assert store.open_info("../../etc/passwd") is None
+
+def test_prompt_hash_and_mime_type():
+    assert normalize_prompt_hash("Un  Chat ", "1024x1024", "hd") == normalize_prompt_hash("un chat", "1024x1024", "hd")
+    assert normalize_prompt_hash("un chat", "512x512", "hd") != normalize_prompt_hash("un chat", "1024x1024", "hd")
+    assert guess_mime_type(b"\xff\xd8\xff\xe0") == "image/jpeg"
+    assert guess_mime_type(b"RIFF\x00\x00\x00\x00WEBPVP8 ") == "image/webp"
+    assert guess_mime_type(b"texte") == "application/octet-stream"
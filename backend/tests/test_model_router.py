@@ -0,0 +1,64 @@
+
+# Tests du routage des modèles : niveau par plan, repli sur prompt long, budget de tokens
+
+from types import SimpleNamespace
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from model_router import ADAPTIVE_MIN_SAMPLES, MODEL_TIERS, ModelRouter
+
+MESSAGES = [{"role": "user", "content": "Une idée de SaaS pour les artisans"}]
+
+def usage(completion_tokens: int):
+    return SimpleNamespace(completion_tokens=completion_tokens, prompt_tokens=20, prompt_tokens_details=None)
+
+def test_tier_follows_task_and_plan():
+    router = ModelRouter(enabled=True)
+    assert router.route("saas_idea", "free", MESSAGES).tier == "fast"
+    assert router.route("saas_idea", "pro", MESSAGES).tier == "standard"
+    decision = router.route("saas_idea", "business", MESSAGES)
+    assert decision.tier == "premium" and decision.model == MODEL_TIERS["premium"]["model"]
+    assert router.route("text", "business", MESSAGES).tier == "standard"
+    assert router.route("text", "inconnu", MESSAGES).tier == "fast"  # Plan inconnu : niveau gratuit
+    assert router.route("text", None, MESSAGES).tier == "fast"
+
+    disabled = ModelRouter(enabled=False, default_model="gpt-4", default_max_tokens=1500)
+    decision = disabled.route("saas_idea", "business", MESSAGES)
+    assert (decision.tier, decision.model, decision.max_tokens) == ("default", "gpt-4", 1500)
+
+def test_long_prompt_falls_back_from_premium():
+    router = ModelRouter(enabled=True)
+    long_prompt = [{"role": "user", "content": "contexte " * 6000}]
+    decision = router.route("code_structure", "pro", long_prompt)
+    assert decision.tier == "standard"
+    assert decision.prompt_tokens > MODEL_TIERS["premium"]["context_window"] // 2
+
+def test_max_tokens_budget_from_profile_and_limits():
+    router = ModelRouter(enabled=True)
+    assert router.route("saas_idea", "free", MESSAGES).max_tokens == 875  # 700 x 1.25
+    assert router.route("text", "free", MESSAGES).max_tokens == 438  # 350 x 1.25
+
+    # Le budget ne dépasse jamais la sortie maximale du niveau
+    for _ in range(ADAPTIVE_MIN_SAMPLES):
+        router.record_usage(router.route("code_structure", "pro", MESSAGES), usage(20000))
+    assert router.route("code_structure", "pro", MESSAGES).max_tokens == MODEL_TIERS["premium"]["max_output"]
+
+def test_budget_adapts_to_observed_p95():
+    router = ModelRouter(enabled=True)
+    decision = router.route("text", "free", MESSAGES)
+    for tokens in range(1, ADAPTIVE_MIN_SAMPLES):
+        router.record_usage(decision, usage(tokens))
+    assert router.expected_output_tokens("text") == 350  # Pas encore assez d'échantillons
+
+    for tokens in range(ADAPTIVE_MIN_SAMPLES, 101):
+        router.record_usage(decision, usage(tokens))
+    assert router.expected_output_tokens("text") == 96  # p95 de 1..100
+    assert router.route("text", "free", MESSAGES).max_tokens == 120
+
+    # Une réponse tronquée compte pour plus que sa longueur observée
+    router.record_usage(decision, usage(400), finish_reason="length")
+    assert max(router.recent_completions["text"]) == 500
+    stats = router.snapshot()[f"text:{decision.model}"]
+    assert stats["calls"] == 101 and stats["truncated"] == 1
@@ -0,0 +1,197 @@
+
+# Tests de la politique de résilience des appels IA
+
+import time
+import pytest
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from resilience import (ResilientCaller, CircuitBreaker, CircuitOpenError,
+                        is_retryable, retry_after_seconds)
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+class FakeAPIError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = FakeResponse(status_code, headers)
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+def make_caller(clock, **kwargs):
+    return ResilientCaller("test", sleep=clock.sleep, clock=clock, **kwargs)
+
+def test_retries_on_server_errors_then_succeeds():
+    """Les erreurs 5xx sont retentées jusqu'au succès"""
+    clock = FakeClock()
+    caller = make_caller(clock, max_attempts=3)
+    calls = []
+
+    def flaky(timeout):
+        calls.append(timeout)
+        if len(calls) < 3:
+            raise FakeAPIError(503)
+        return "ok"
+
+    assert caller.call(flaky) == "ok"
+    assert len(calls) == 3
+    assert caller.counters["retries"] == 2
+    assert caller.breaker.state == "closed"
+
+def test_client_errors_are_not_retried():
+    """Une erreur 400 est définitive et ne compte pas comme panne"""
+    clock = FakeClock()
+    caller = make_caller(clock, max_attempts=3)
+    calls = []
+
+    def bad_request(timeout):
+        calls.append(timeout)
+        raise FakeAPIError(400)
+
+    with pytest.raises(FakeAPIError):
+        caller.call(bad_request)
+    assert len(calls) == 1
+    assert caller.breaker.snapshot()["consecutive_failures"] == 0
+
+def test_retry_after_header_is_honored():
+    """Le délai Retry-After remplace le backoff calculé"""
+    clock = FakeClock()
+    caller = make_caller(clock, max_attempts=2)
+    attempts = []
+
+    def rate_limited(timeout):
+        attempts.append(clock())
+        if len(attempts) == 1:
+            raise FakeAPIError(429, {"retry-after": "4"})
+        return "ok"
+
+    assert caller.call(rate_limited) == "ok"
+    assert attempts == [0.0, 4.0]
+    assert retry_after_seconds(FakeAPIError(429, {"retry-after-ms": "250"})) == 0.25
+
+def test_deadline_caps_attempt_timeout_and_retries():
+    """Le délai global borne le timeout par tentative et interrompt les retries"""
+    clock = FakeClock()
+    caller = make_caller(clock, max_attempts=5, deadline=10.0, attempt_timeout=60.0)
+    timeouts = []
+
+    def slow_failure(timeout):
+        timeouts.append(timeout)
+        raise FakeAPIError(429, {"retry-after": "20"})
+
+    with pytest.raises(FakeAPIError):
+        caller.call(slow_failure)
+    assert timeouts == [10.0]
+
+def test_circuit_breaker_opens_and_recovers():
+    """Le disjoncteur s'ouvre après N échecs puis laisse passer un appel test"""
+    clock = FakeClock()
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=30.0, clock=clock)
+    caller = make_caller(clock, max_attempts=1, breaker=breaker)
+
+    def down(timeout):
+        raise FakeAPIError(502)
+
+    for _ in range(2):
+        with pytest.raises(FakeAPIError):
+            caller.call(down)
+    assert breaker.state == "open"
+
+    with pytest.raises(CircuitOpenError):
+        caller.call(down)
+    assert caller.counters["short_circuited"] == 1
+
+    clock.now += 30.0
+    assert breaker.state == "half_open"
+    assert caller.call(lambda timeout: "recovered") == "recovered"
+    assert breaker.state == "closed"
+
+def test_hedged_request_wins_over_slow_primary():
+    """Au-delà du p95, une requête couverte est lancée et la plus rapide gagne"""
+    caller = ResilientCaller("hedge", max_attempts=1, hedge=True, hedge_min_samples=1)
+    caller.latency.record(0.05)
+    calls = []
+
+    def sometimes_slow(timeout):
+        calls.append(timeout)
+        if len(calls) == 1:
+            time.sleep(1.0)
+            return "primary"
+        return "hedged"
+
+    assert caller.call(sometimes_slow) == "hedged"
+    assert caller.counters["hedged"] == 1
+    assert caller.counters["hedge_wins"] == 1
+
+def test_losing_hedged_stream_is_closed():
+    """La réponse perdante d'une course couverte (flux) est fermée dès son arrivée"""
+    class FakeStream:
+        def __init__(self, name):
+            self.name = name
+            self.closed = False
+
+        def close(self):
+            self.closed = True
+
+    caller = ResilientCaller("hedge-stream", max_attempts=1, hedge=True, hedge_min_samples=1)
+    caller.latency.record(0.05)
+    streams = []
+
+    def open_stream(timeout):
+        stream = FakeStream("primary" if not streams else "hedged")
+        streams.append(stream)
+        if stream.name == "primary":
+            time.sleep(0.5)
+        return stream
+
+    winner = caller.call(open_stream)
+    assert winner.name == "hedged" and not winner.closed
+    time.sleep(0.7)  # La requête principale finit après la course
+    assert [s.closed for s in streams if s.name == "primary"] == [True]
+
+def test_hedge_pool_is_created_once_under_concurrency(monkeypatch):
+    """Des premiers appels couverts simultanés partagent un seul pool de threads"""
+    import threading
+    import resilience
+    created = []
+
+    def slow_pool(**kwargs):
+        time.sleep(0.05)  # Élargit la fenêtre entre le test et l'affectation
+        created.append(kwargs)
+        return object()
+
+    monkeypatch.setattr(resilience, "ThreadPoolExecutor", slow_pool)
+    caller = ResilientCaller("hedge-init", hedge=True)
+    barrier = threading.Barrier(8)
+    pools = []
+
+    def first_call():
+        barrier.wait()
+        pools.append(caller._get_hedge_pool())
+
+    threads = [threading.Thread(target=first_call) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(created) == 1 and len({id(pool) for pool in pools}) == 1
+
+def test_is_retryable_network_errors():
+    assert is_retryable(TimeoutError())
+    assert is_retryable(ConnectionError())
+    assert not is_retryable(ValueError())
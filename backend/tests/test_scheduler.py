@@ -0,0 +1,87 @@
+
+# Tests du planificateur asyncio
+
+import asyncio
+import threading
+import time
+from datetime import datetime
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scheduler import AsyncScheduler, Daily, Interval, Weekly
+
+def test_triggers_compute_next_run():
+    monday_morning = datetime(2026, 10, 19, 8, 0)  # Lundi
+    assert Daily("10:00").next_after(monday_morning) == datetime(2026, 10, 19, 10, 0)
+    assert Daily("10:00").next_after(datetime(2026, 10, 19, 10, 0)) == datetime(2026, 10, 20, 10, 0)
+    assert Weekly("monday", "09:00").next_after(monday_morning) == datetime(2026, 10, 19, 9, 0)
+    assert Weekly("monday", "09:00").next_after(datetime(2026, 10, 19, 9, 30)) == datetime(2026, 10, 26, 9, 0)
+    assert Weekly("friday", "18:30").next_after(monday_morning) == datetime(2026, 10, 23, 18, 30)
+
+def test_sleeps_until_next_due_job_without_polling():
+    scheduler = AsyncScheduler(max_concurrency=2, max_sleep=60)
+    calls = []
+
+    async def tick():
+        calls.append(time.monotonic())
+
+    async def scenario():
+        scheduler.add_job("tick", tick, Interval(0.1))
+        scheduler.start()
+        await asyncio.sleep(0.55)
+        await scheduler.stop()
+
+    asyncio.run(scenario())
+    assert 4 <= len(calls) <= 6
+    # Un réveil par échéance (plus le démarrage), pas de boucle active
+    assert scheduler.stats["wakeups"] <= len(calls) + 2
+
+def test_bounded_concurrency_and_overlap_skipped():
+    scheduler = AsyncScheduler(max_concurrency=2, max_sleep=60)
+    active, peak = [0], [0]
+
+    async def slow():
+        active[0] += 1
+        peak[0] = max(peak[0], active[0])
+        await asyncio.sleep(0.15)
+        active[0] -= 1
+
+    async def scenario():
+        now = datetime.now()
+        for i in range(5):
+            scheduler.add_job(f"slow{i}", slow, Interval(0.05), next_run_at=now)
+        scheduler.start()
+        await asyncio.sleep(0.5)
+        await scheduler.stop()
+
+    asyncio.run(scenario())
+    assert peak[0] == 2
+    assert scheduler.stats["runs"] >= 3
+    assert scheduler.stats["skipped"] > 0
+
+def test_job_added_from_another_thread_wakes_the_loop():
+    scheduler = AsyncScheduler(max_concurrency=1, max_sleep=60)
+    done = []
+
+    def blocking_job():
+        done.append(threading.current_thread().name)
+
+    async def scenario():
+        scheduler.add_job("far", blocking_job, Daily("00:00"))
+        scheduler.start()
+        await asyncio.sleep(0.05)
+        started = time.monotonic()
+        threading.Thread(target=lambda: scheduler.add_job("now", blocking_job, Daily("00:00"),
+                                                          next_run_at=datetime.now())).start()
+        while not done and time.monotonic() - started < 1:
+            await asyncio.sleep(0.01)
+        elapsed = time.monotonic() - started
+        scheduler.remove_job("now")
+        await scheduler.stop()
+        return elapsed
+
+    elapsed = asyncio.run(scenario())
+    assert len(done) == 1
+    assert elapsed < 0.5
@@ -0,0 +1,187 @@
+
+# Tests du pool de connexions SMTP
+
+import asyncio
+from types import SimpleNamespace
+import aiosmtplib
+import pytest
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from smtp_pool import SMTPConnectionPool, SMTPTransport
+
+class FakeSMTP:
+    """Session aiosmtplib simulée : compte les handshakes et peut perdre la connexion"""
+    instances = []
+
+    def __init__(self, hostname=None, port=None, timeout=None, start_tls=None):
+        self.sent = []
+        self.logins = 0
+        self.noops = 0
+        self.closed = False
+        self.drop_next_send = False
+        self.noop_code = 250
+        FakeSMTP.instances.append(self)
+
+    async def connect(self):
+        pass
+
+    async def login(self, user, password):
+        self.logins += 1
+
+    async def noop(self):
+        self.noops += 1
+        return SimpleNamespace(code=self.noop_code, message="OK")
+
+    async def send_message(self, msg):
+        if self.drop_next_send:
+            raise aiosmtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+        self.sent.append(msg)
+        return {}, "OK"
+
+    async def quit(self):
+        self.closed = True
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock():
+    FakeSMTP.instances = []
+    return FakeClock()
+
+def make_pool(clock, **kwargs):
+    options = dict(user="user", password="secret", max_size=2, max_messages_per_connection=3,
+                   idle_timeout=60, health_check_after=10, smtp_factory=FakeSMTP, clock=clock)
+    options.update(kwargs)
+    return SMTPConnectionPool("smtp.test", 587, **options)
+
+def run(coro):
+    return asyncio.run(coro)
+
+def test_messages_reuse_one_authenticated_connection(clock):
+    """Plusieurs envois successifs partagent une seule connexion (un seul login)"""
+    pool = make_pool(clock)
+
+    async def scenario():
+        for i in range(3):
+            await pool.send_message(f"message {i}")
+    run(scenario())
+
+    assert len(FakeSMTP.instances) == 1
+    assert FakeSMTP.instances[0].logins == 1
+    assert len(FakeSMTP.instances[0].sent) == 3
+
+def test_concurrent_sends_bounded_by_pool_size(clock, monkeypatch):
+    """Les envois simultanés ouvrent au plus max_size connexions"""
+    pool = make_pool(clock, max_size=2, max_messages_per_connection=100)
+    in_flight = {"current": 0, "peak": 0}
+
+    async def tracked_send(self, msg):
+        in_flight["current"] += 1
+        in_flight["peak"] = max(in_flight["peak"], in_flight["current"])
+        await asyncio.sleep(0.01)
+        in_flight["current"] -= 1
+        return {}, "OK"
+    monkeypatch.setattr(FakeSMTP, "send_message", tracked_send)
+
+    async def scenario():
+        await asyncio.gather(*(pool.send_message(f"message {i}") for i in range(6)))
+    run(scenario())
+
+    assert len(FakeSMTP.instances) == 2
+    assert in_flight["peak"] == 2
+    assert pool.snapshot()["messages_sent"] == 6
+
+def test_connection_rotated_after_max_messages(clock):
+    pool = make_pool(clock, max_messages_per_connection=2)
+
+    async def scenario():
+        for i in range(5):
+            await pool.send_message(f"message {i}")
+    run(scenario())
+
+    assert [len(smtp.sent) for smtp in FakeSMTP.instances] == [2, 2, 1]
+    assert FakeSMTP.instances[0].closed and FakeSMTP.instances[1].closed
+
+def test_idle_connection_is_health_checked_then_replaced(clock):
+    """Après une pause, un NOOP vérifie la connexion ; en échec, une nouvelle est ouverte"""
+    pool = make_pool(clock)
+
+    async def scenario():
+        await pool.send_message("premier")
+
+        clock.now = 20
+        await pool.send_message("après pause")
+        assert FakeSMTP.instances[0].noops == 1
+        assert len(FakeSMTP.instances) == 1
+
+        clock.now = 40
+        FakeSMTP.instances[0].noop_code = 421
+        await pool.send_message("serveur fermé")
+    run(scenario())
+
+    assert len(FakeSMTP.instances) == 2
+    assert FakeSMTP.instances[0].closed
+
+def test_idle_timeout_closes_connections(clock):
+    pool = make_pool(clock)
+
+    async def scenario():
+        await pool.send_message("message")
+        clock.now = 61
+        return await pool.close_idle()
+
+    assert run(scenario()) == 1
+    assert FakeSMTP.instances[0].closed
+
+def test_reconnects_once_when_connection_drops(clock):
+    pool = make_pool(clock)
+
+    async def scenario():
+        await pool.send_message("premier")
+        FakeSMTP.instances[0].drop_next_send = True
+        await pool.send_message("second")
+    run(scenario())
+
+    assert len(FakeSMTP.instances) == 2
+    assert FakeSMTP.instances[1].sent == ["second"]
+    assert pool.snapshot()["reconnects"] == 1
+
+def test_rejected_message_keeps_connection(clock):
+    """Un destinataire refusé n'invalide pas la connexion"""
+    pool = make_pool(clock)
+
+    async def refuse(msg):
+        raise aiosmtplib.SMTPRecipientsRefused([aiosmtplib.SMTPRecipientRefused(550, "No such user", "x@test")])
+
+    async def scenario():
+        await pool.send_message("premier")
+        FakeSMTP.instances[0].send_message = refuse
+        with pytest.raises(aiosmtplib.SMTPRecipientsRefused):
+            await pool.send_message("refusé")
+    run(scenario())
+
+    assert len(FakeSMTP.instances) == 1
+    assert pool.snapshot()["idle_connections"] == 1
+
+def test_transport_serves_sync_and_async_callers(clock):
+    """Le transport partage la boucle SMTP entre appelants synchrones et asynchrones"""
+    transport = SMTPTransport(make_pool(clock))
+    try:
+        transport.send_sync("depuis un thread", timeout=5)
+
+        async def from_another_loop():
+            return await transport.send("depuis une autre boucle")
+        assert run(from_another_loop()) == {}
+    finally:
+        transport.close()
+
+    assert FakeSMTP.instances[0].sent == ["depuis un thread", "depuis une autre boucle"]
+    assert FakeSMTP.instances[0].closed
@@ -0,0 +1,121 @@
+
+# Tests des statistiques hebdomadaires agrégées
+
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import Base, GenerationJob, SaasToken, User
+from database import DatabaseService
+from bulk_mailer import weekly_report_period
+
+engine = create_engine(
+    "sqlite:///:memory:",
+    poolclass=StaticPool,
+    connect_args={"check_same_thread": False},
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+Base.metadata.create_all(bind=engine)
+
+SINCE = datetime(2026, 10, 12)
+UNTIL = datetime(2026, 10, 19)
+IN_WEEK = datetime(2026, 10, 14)
+BEFORE = datetime(2026, 10, 5)
+
+def setup_module():
+    db = TestingSessionLocal()
+    alice = User(email="alice@test.fr", hashed_password="x", referral_code="ALICE")
+    bob = User(email="bob@test.fr", hashed_password="x", referral_code="BOB")
+    idle = User(email="idle@test.fr", hashed_password="x", referral_code="IDLE")
+    gone = User(email="gone@test.fr", hashed_password="x", referral_code="GONE", is_active=False)
+    db.add_all([alice, bob, idle, gone])
+    db.flush()
+    db.add_all([
+        # Alice : 2 générations de texte, 1 image, 1 SaaS, 6 jetons gagnés dans la semaine
+        SaasToken(user_id=alice.id, amount=1, transaction_type="first_generation", created_at=IN_WEEK),
+        SaasToken(user_id=alice.id, amount=1, transaction_type="first_generation", created_at=IN_WEEK),
+        SaasToken(user_id=alice.id, amount=1, transaction_type="daily_login", created_at=IN_WEEK),
+        SaasToken(user_id=alice.id, amount=5, transaction_type="referral_signup", created_at=IN_WEEK),
+        SaasToken(user_id=alice.id, amount=3, transaction_type="spent", created_at=IN_WEEK),
+        SaasToken(user_id=alice.id, amount=50, transaction_type="earned", created_at=BEFORE),
+        GenerationJob(id="img", user_id=alice.id, kind="image", status="completed", created_at=IN_WEEK),
+        GenerationJob(id="saas", user_id=alice.id, kind="saas_idea", status="completed", created_at=IN_WEEK),
+        GenerationJob(id="failed", user_id=alice.id, kind="image", status="failed", created_at=IN_WEEK),
+        # Bob : une image, filleul d'Alice inscrit dans la semaine
+        GenerationJob(id="bob-img", user_id=bob.id, kind="image", status="completed", created_at=IN_WEEK),
+        SaasToken(user_id=gone.id, amount=10, transaction_type="earned", created_at=IN_WEEK),
+    ])
+    bob.referred_by = "ALICE"
+    bob.created_at = IN_WEEK
+    idle.created_at = BEFORE
+    alice.created_at = BEFORE
+    db.commit()
+    db.close()
+
+def stats_by_email(rows):
+    return {row["email"]: row["stats"] for row in rows}
+
+def test_stats_for_all_users_in_one_query():
+    db = DatabaseService(TestingSessionLocal())
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        stats = stats_by_email(db.iter_weekly_stats(SINCE, UNTIL))
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+        db.close()
+
+    assert len(statements) == 1
+    assert stats == {
+        "alice@test.fr": {"total_content": 4, "text_generations": 3, "image_generations": 1,
+                          "tokens_earned": 6, "new_referrals": 1},
+        "bob@test.fr": {"total_content": 1, "text_generations": 0, "image_generations": 1,
+                        "tokens_earned": 0, "new_referrals": 0},
+        "idle@test.fr": {"total_content": 0, "text_generations": 0, "image_generations": 0,
+                         "tokens_earned": 0, "new_referrals": 0},
+    }
+
+def test_chunks_paginate_and_skip_users_without_content():
+    db = DatabaseService(TestingSessionLocal())
+    first = db.get_weekly_stats_chunk(SINCE, UNTIL, after_id=0, limit=1, only_active=True)
+    second = db.get_weekly_stats_chunk(SINCE, UNTIL, after_id=first[-1]["id"], limit=1, only_active=True)
+    third = db.get_weekly_stats_chunk(SINCE, UNTIL, after_id=second[-1]["id"], limit=1, only_active=True)
+    db.close()
+
+    assert [row["email"] for row in first + second] == ["alice@test.fr", "bob@test.fr"]
+    assert third == []
+
+def test_weekly_report_period_is_previous_iso_week():
+    assert weekly_report_period("2026-W43") == (SINCE, UNTIL)
+
+def test_chunk_aggregates_only_its_id_range():
+    db = DatabaseService(TestingSessionLocal())
+    alice = db.get_user_by_email("alice@test.fr")
+    query = db._weekly_stats_query(SINCE, UNTIL, True, (alice.id - 1, alice.id))
+    rows = [db._serialize_weekly_stats(row) for row in query]
+    assert [row["email"] for row in rows] == ["alice@test.fr"]
+    assert rows[0]["stats"]["new_referrals"] == 1  # Filleul compté même hors de la plage d'id du lot
+
+    sql = str(query.statement.compile(engine, compile_kwargs={"literal_binds": True}))
+    plan = [row[-1] for row in db.db.execute(text("EXPLAIN QUERY PLAN " + sql))]
+    db.close()
+    # Chaque agrégation lit la plage d'utilisateurs du lot, pas toute la période
+    for table in ("saas_tokens", "generation_jobs"):
+        assert any(step.startswith(f"SEARCH {table} USING INDEX") and "(user_id>? AND user_id<?)" in step
+                   for step in plan)
+    assert any("ix_users_referred_by_created" in step for step in plan)
+
+def test_empty_id_ranges_are_skipped():
+    db = DatabaseService(TestingSessionLocal())
+    bob = db.get_user_by_email("bob@test.fr")
+    # Après Bob : seuls 'idle' (sans contenu) et des inactifs, aucun lot à envoyer
+    assert db.get_weekly_stats_chunk(SINCE, UNTIL, after_id=bob.id, limit=1, only_active=True) == []
+    rows = db.get_weekly_stats_chunk(SINCE, UNTIL, after_id=bob.id, limit=1)
+    db.close()
+    assert [row["email"] for row in rows] == ["idle@test.fr"]